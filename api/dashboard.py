@@ -1,6 +1,5 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import sqlite3
 import os
 import sys
 from datetime import datetime, timedelta
@@ -14,9 +13,15 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 try:
     from utils.config import Config
     from db.database import BalanceDB, PaymentDB
+    from db.readonly import (
+        readonly_connection, DASHBOARD_PENDING_PAYMENTS_SQL, DASHBOARD_RECENT_PAYMENTS_SQL,
+        DASHBOARD_BALANCE_HISTORY_SQL, PAID_TODAY_COUNT_SQL
+    )
+    from db.sqlstats import get_sql_stats
 except ImportError as e:
     print(f"Ошибка импорта: {e}")
     Config = None
+    readonly_connection = None
 
 class handler(BaseHTTPRequestHandler):
     def do_POST(self):
@@ -84,12 +89,24 @@ class handler(BaseHTTPRequestHandler):
                 self._send_response(200, history)
                 return
             
+            # API для статистики запросов к базе данных
+            if path == '/dashboard/api/dbstats':
+                self._send_response(200, get_sql_stats(self._get_limit(query_params)))
+                return
+            
             # 404 для остальных путей
             self._send_response(404, {"error": "Not found", "path": path})
             
         except Exception as e:
             self._send_response(500, {"error": str(e), "traceback": traceback.format_exc()})
     
+    def _get_limit(self, query_params, default=20):
+        """Параметр limit запроса"""
+        try:
+            return max(1, int(query_params.get('limit', [default])[0]))
+        except ValueError:
+            return default
+    
     def _check_dashboard_auth(self, query_params):
         """Проверка авторизации для дашборда"""
         # Проверяем сессионный токен в куки
@@ -1125,28 +1142,14 @@ class handler(BaseHTTPRequestHandler):
             # Используем путь к базе данных из переменных окружения или дефолтный
             db_path = os.getenv('DATABASE_PATH', '/tmp/bot.db')
             
-            # Проверяем существование файла базы данных
+            # Дашборд только читает базу: если бот ее еще не создал, данных нет
             if not os.path.exists(db_path):
-                # Создаем базу данных если её нет
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS balance (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        balance REAL DEFAULT 0.0,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                cursor.execute("INSERT INTO balance (balance) VALUES (0.0)")
-                conn.commit()
-                conn.close()
                 return 0.0
             
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT balance FROM balance ORDER BY id DESC LIMIT 1")
-            result = cursor.fetchone()
-            conn.close()
+            with readonly_connection(db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT current_balance FROM balance WHERE id = 1")
+                result = cursor.fetchone()
             return float(result[0]) if result else 0.0
         except Exception as e:
             print(f"Ошибка получения баланса: {e}")
@@ -1158,33 +1161,14 @@ class handler(BaseHTTPRequestHandler):
             db_path = os.getenv('DATABASE_PATH', '/tmp/bot.db')
             
             if not os.path.exists(db_path):
-                # Создаем таблицу платежей если её нет
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS payments (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        service_name TEXT NOT NULL,
-                        amount REAL NOT NULL,
-                        project_name TEXT,
-                        payment_method TEXT,
-                        status TEXT DEFAULT 'pending',
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        marketer_id INTEGER
-                    )
-                ''')
-                conn.commit()
-                conn.close()
                 return []
             
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM payments WHERE status = 'pending' ORDER BY created_at DESC")
-            payments = []
-            for row in cursor.fetchall():
-                payments.append(dict(row))
-            conn.close()
+            with readonly_connection(db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(DASHBOARD_PENDING_PAYMENTS_SQL)
+                payments = []
+                for row in cursor.fetchall():
+                    payments.append(dict(row))
             return payments
         except Exception as e:
             print(f"Ошибка получения платежей: {e}")
@@ -1198,15 +1182,10 @@ class handler(BaseHTTPRequestHandler):
             if not os.path.exists(db_path):
                 return 0
                 
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM payments 
-                WHERE DATE(created_at) = DATE('now') AND status = 'paid'
-            """)
-            result = cursor.fetchone()
-            conn.close()
+            with readonly_connection(db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(PAID_TODAY_COUNT_SQL)
+                result = cursor.fetchone()
             return int(result[0]) if result else 0
         except Exception as e:
             print(f"Ошибка получения платежей за сегодня: {e}")
@@ -1220,24 +1199,15 @@ class handler(BaseHTTPRequestHandler):
             if not os.path.exists(db_path):
                 return {"payments": []}
             
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    id, service_name, amount, project_name, 
-                    payment_method, status, created_at, marketer_id
-                FROM payments 
-                ORDER BY created_at DESC 
-                LIMIT 50
-            """)
-            
-            payments = []
-            for row in cursor.fetchall():
-                payments.append(dict(row))
+            with readonly_connection(db_path) as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute(DASHBOARD_RECENT_PAYMENTS_SQL)
+                
+                payments = []
+                for row in cursor.fetchall():
+                    payments.append(dict(row))
             
-            conn.close()
             return {"payments": payments}
         except Exception as e:
             print(f"Ошибка получения данных о платежах: {e}")
@@ -1251,43 +1221,24 @@ class handler(BaseHTTPRequestHandler):
             if not os.path.exists(db_path):
                 return {"history": []}
             
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Сначала проверим, существует ли таблица
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name='balance_history'
-            """)
-            
-            if not cursor.fetchone():
-                # Создаем таблицу истории баланса
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS balance_history (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        amount REAL NOT NULL,
-                        description TEXT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        user_id INTEGER
-                    )
-                ''')
-                conn.commit()
-                conn.close()
-                return {"history": []}
-            
-            cursor.execute("""
-                SELECT amount, description, timestamp, user_id
-                FROM balance_history 
-                ORDER BY timestamp DESC 
-                LIMIT 30
-            """)
-            
-            history = []
-            for row in cursor.fetchall():
-                history.append(dict(row))
+            with readonly_connection(db_path) as conn:
+                cursor = conn.cursor()
+                
+                # Сначала проверим, существует ли таблица
+                cursor.execute("""
+                    SELECT name FROM sqlite_master 
+                    WHERE type='table' AND name='balance_history'
+                """)
+                
+                if not cursor.fetchone():
+                    return {"history": []}
+                
+                cursor.execute(DASHBOARD_BALANCE_HISTORY_SQL)
+                
+                history = []
+                for row in cursor.fetchall():
+                    history.append(dict(row))
             
-            conn.close()
             return {"history": history}
         except Exception as e:
             print(f"Ошибка получения истории баланса: {e}")
@@ -1,9 +1,11 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import asyncio
 import logging
 import os
 import sys
+import time
+import atexit
+import asyncio
 from urllib.parse import parse_qs
 
 # Добавляем корневую директорию в path для импорта модулей
@@ -15,14 +17,111 @@ sys.path.insert(0, os.path.join(root_dir, 'handlers'))
 sys.path.insert(0, os.path.join(root_dir, 'db'))
 sys.path.insert(0, os.path.join(root_dir, 'nlp'))
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Настройка логирования (LOG_LEVEL=DEBUG включает пошаговые сообщения инициализации)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Глобальные переменные для кеширования
 bot = None
 dp = None
 
+# Длительность init_bot (мс), для health check
+init_duration_ms = None
+
+# Максимальное время обработки одного запроса в фоновом loop (секунды)
+WEBHOOK_HANDLER_TIMEOUT = float(os.getenv("WEBHOOK_HANDLER_TIMEOUT", "55"))
+
+# Запас до WEBHOOK_HANDLER_TIMEOUT, который оставляет доставка уведомлений
+# после обработки обновления (секунды); недоставленное отправит outbox позже
+WEBHOOK_DELIVERY_RESERVE = 5.0
+
+# Секрет планировщика для GET /cron/outbox (Vercel Cron передает его в
+# заголовке Authorization: Bearer <CRON_SECRET>); без него эндпоинт отключен
+CRON_SECRET = os.getenv("CRON_SECRET", "")
+
+
+def run_async(coro):
+    """
+    Выполнение корутины в постоянном фоновом event loop процесса
+
+    Теплый экземпляр переиспользует loop между вызовами, поэтому сессия
+    aiohttp бота, пул соединений с базой и клиенты OpenAI не пересоздаются.
+    """
+    from utils.background_loop import run_in_background_loop
+    return run_in_background_loop(coro, WEBHOOK_HANDLER_TIMEOUT)
+
+
+async def flush_fsm_storage(dispatcher):
+    """Запись накопленных изменений состояний FSM"""
+    flush = getattr(dispatcher.storage, "flush", None)
+    if flush is None:
+        return
+    try:
+        await flush()
+    except Exception as e:
+        logger.error(f"Ошибка записи состояний FSM: {e}")
+
+
+async def deliver_notifications(bot):
+    """
+    Доставка уведомлений, записанных в outbox при обработке обновления,
+    и сводок, окно накопления которых истекло
+
+    Returns:
+        Количество обработанных строк outbox
+    """
+    try:
+        from utils.outbox import deliver_outbox
+        return await deliver_outbox(bot)
+    except Exception as e:
+        logger.error(f"Ошибка доставки уведомлений outbox: {e}")
+        return 0
+
+
+def limit_outbound_waits():
+    """
+    Flood control внутри запроса ждется не дольше OUTBOUND_REQUEST_MAX_RETRY_AFTER:
+    более долгую паузу переживает outbox (строка откладывается на retry_after)
+    """
+    from utils.outbound import OUTBOUND_REQUEST_MAX_RETRY_AFTER, set_max_retry_after
+    set_max_retry_after(OUTBOUND_REQUEST_MAX_RETRY_AFTER)
+
+
+async def drain_outbound_queue(timeout=None):
+    """Отправка сообщений из очереди исходящих"""
+    try:
+        from utils.outbound import drain_outbound
+        if not await drain_outbound(timeout):
+            logger.warning("Очередь исходящих сообщений не опустела")
+    except Exception as e:
+        logger.error(f"Ошибка отправки очереди исходящих сообщений: {e}")
+
+
+async def shutdown_bot():
+    """Закрытие сессии бота, хранилища FSM и пула соединений (при завершении процесса)"""
+    if dp is not None:
+        try:
+            await dp.storage.close()
+        except Exception as e:
+            logger.warning(f"Ошибка закрытия хранилища FSM: {e}")
+    await drain_outbound_queue(10)
+    if bot is not None:
+        await bot.session.close()
+    try:
+        from db.pool import close_pool
+        await close_pool()
+    except Exception as e:
+        logger.warning(f"Ошибка закрытия пула соединений: {e}")
+
+
+def _stop_background_loop():
+    """Остановка фонового loop при выходе из процесса"""
+    from utils.background_loop import stop_background_loop
+    stop_background_loop(shutdown_bot)
+
+
+atexit.register(_stop_background_loop)
+
 # Встроенная конфигурация как fallback для Vercel
 class BuiltinConfig:
     """Встроенная конфигурация для работы без внешних модулей"""
@@ -58,15 +157,16 @@ builtin_config = BuiltinConfig()
 
 async def init_bot():
     """Инициализация бота и диспетчера"""
-    global bot, dp
+    global bot, dp, init_duration_ms
     
     if bot is not None and dp is not None:
-        logger.info("Бот уже инициализирован, возвращаем существующий")
         return bot, dp
     
+    started = time.perf_counter()
     try:
         from aiogram import Bot, Dispatcher
         from aiogram.fsm.storage.memory import MemoryStorage
+        from db.fsm_storage import SQLiteStorage
         
         # Получаем токен из переменных окружения
         bot_token = os.getenv("BOT_TOKEN")
@@ -75,16 +175,17 @@ async def init_bot():
         
         # Создание бота и диспетчера
         bot = Bot(token=bot_token)
-        dp = Dispatcher(storage=MemoryStorage())
+        # Состояния FSM в SQLite переживают холодный старт и общие для экземпляров
+        dp = Dispatcher(storage=SQLiteStorage())
         
-        logger.info("✓ Бот и диспетчер созданы")
+        logger.debug("✓ Бот и диспетчер созданы")
         
         # Пытаемся импортировать модули по одному
-        logger.info("📦 Начинаем пошаговую инициализацию...")
+        logger.debug("📦 Начинаем пошаговую инициализацию...")
         
         # Шаг 1: База данных
         try:
-            logger.info("1️⃣ Импортируем db.database...")
+            logger.debug("1️⃣ Импортируем db.database...")
             try:
                 from db.database import init_database
             except ImportError:
@@ -101,11 +202,11 @@ async def init_bot():
                 else:
                     raise ImportError("Не найден файл db/database.py")
                     
-            logger.info("✓ db.database импортирован")
+            logger.debug("✓ db.database импортирован")
             
-            logger.info("1️⃣ Инициализируем базу данных...")
+            logger.debug("1️⃣ Инициализируем базу данных...")
             await init_database()
-            logger.info("✓ База данных инициализирована")
+            logger.debug("✓ База данных инициализирована")
             
         except Exception as e:
             logger.error(f"❌ Ошибка базы данных: {e}")
@@ -118,19 +219,19 @@ async def init_bot():
         def safe_import_handler(module_name: str, function_name: str):
             """Безопасный импорт обработчика с fallback"""
             try:
-                logger.info(f"2️⃣ Импортируем {module_name}...")
+                logger.debug(f"2️⃣ Импортируем {module_name}...")
                 
                 # Подробная диагностика
-                logger.info(f"   🔍 Попытка импорта модуля: {module_name}")
-                logger.info(f"   🔍 Ищем функцию: {function_name}")
+                logger.debug(f"   🔍 Попытка импорта модуля: {module_name}")
+                logger.debug(f"   🔍 Ищем функцию: {function_name}")
                 
                 module = __import__(module_name, fromlist=[function_name])
-                logger.info(f"   ✅ Модуль {module_name} загружен")
+                logger.debug(f"   ✅ Модуль {module_name} загружен")
                 
                 handler_func = getattr(module, function_name)
-                logger.info(f"   ✅ Функция {function_name} найдена")
+                logger.debug(f"   ✅ Функция {function_name} найдена")
                 
-                logger.info(f"✓ {module_name} импортирован успешно")
+                logger.debug(f"✓ {module_name} импортирован успешно")
                 return handler_func
                 
             except ImportError as ie:
@@ -159,42 +260,42 @@ async def init_bot():
         handlers_imported['manager'] = safe_import_handler('handlers.manager', 'setup_manager_handlers')
         
         # Шаг 3: Регистрация обработчиков объединена с проверкой
-        logger.info("3️⃣ Регистрация объединена с проверкой работоспособности")
+        logger.debug("3️⃣ Регистрация объединена с проверкой работоспособности")
         
         # Финальная проверка
         final_handlers = len(dp.message.handlers)
-        logger.info(f"🎯 ИТОГО ЗАРЕГИСТРИРОВАНО MESSAGE HANDLERS: {final_handlers}")
+        logger.debug(f"🎯 ИТОГО ЗАРЕГИСТРИРОВАНО MESSAGE HANDLERS: {final_handlers}")
         
         # Проверяем успешность загрузки основных обработчиков
         successful_imports = sum(1 for h in handlers_imported.values() if h is not None)
-        logger.info(f"📊 Успешно импортировано обработчиков: {successful_imports}/{len(handlers_imported)}")
+        logger.debug(f"📊 Успешно импортировано обработчиков: {successful_imports}/{len(handlers_imported)}")
         
         if final_handlers == 0:
             logger.error("❌ НЕ ЗАРЕГИСТРИРОВАНО НИ ОДНОГО MESSAGE HANDLER!")
-            logger.info("🆘 Добавляем минимальный набор обработчиков...")
+            logger.debug("🆘 Добавляем минимальный набор обработчиков...")
             await add_minimal_handlers(dp)
         
         # Безопасная проверка и регистрация обработчиков
         working_handlers = 0
-        logger.info("🔧 НАЧИНАЕМ ПРОВЕРКУ ОБРАБОТЧИКОВ...")
+        logger.debug("🔧 НАЧИНАЕМ ПРОВЕРКУ ОБРАБОТЧИКОВ...")
         
         try:
             for name, handler_func in handlers_imported.items():
                 try:
-                    logger.info(f"🔍 Проверяем {name}...")
+                    logger.debug(f"🔍 Проверяем {name}...")
                     if handler_func is not None:
-                        logger.info(f"🔍 Пробуем зарегистрировать {name}...")
+                        logger.debug(f"🔍 Пробуем зарегистрировать {name}...")
                         handler_func(dp)
                         working_handlers += 1
-                        logger.info(f"✅ {name} обработчик зарегистрирован успешно")
+                        logger.debug(f"✅ {name} обработчик зарегистрирован успешно")
                     else:
-                        logger.info(f"⚠️ {name} обработчик отсутствует (None)")
+                        logger.debug(f"⚠️ {name} обработчик отсутствует (None)")
                 except Exception as e:
                     logger.error(f"❌ Ошибка регистрации {name}: {str(e)}")
                     import traceback
                     logger.error(f"❌ Traceback: {traceback.format_exc()}")
             
-            logger.info(f"📊 Работающих обработчиков: {working_handlers}/{len(handlers_imported)}")
+            logger.debug(f"📊 Работающих обработчиков: {working_handlers}/{len(handlers_imported)}")
             
         except Exception as e:
             logger.error(f"💥 КРИТИЧЕСКАЯ ОШИБКА В ЦИКЛЕ ОБРАБОТЧИКОВ: {str(e)}")
@@ -203,9 +304,9 @@ async def init_bot():
         
         # ВСЕГДА используем встроенные обработчики для стабильной работы
         try:
-            logger.info("🚀 Активируем встроенные обработчики для полной функциональности")
+            logger.debug("🚀 Активируем встроенные обработчики для полной функциональности")
             await add_builtin_handlers(dp)
-            logger.info("✅ Встроенные обработчики активированы")
+            logger.debug("✅ Встроенные обработчики активированы")
         except Exception as e:
             logger.error(f"💥 ОШИБКА ВСТРОЕННЫХ ОБРАБОТЧИКОВ: {str(e)}")
             import traceback
@@ -213,30 +314,34 @@ async def init_bot():
         
         # Обновляем счетчик после добавления fallback
         final_handlers = len(dp.message.handlers)
-        logger.info(f"🎯 ИТОГО MESSAGE HANDLERS (с fallback): {final_handlers}")
+        logger.debug(f"🎯 ИТОГО MESSAGE HANDLERS (с fallback): {final_handlers}")
         
         # Выводим список всех обработчиков
-        for i, handler in enumerate(dp.message.handlers):
-            handler_name = handler.callback.__name__ if handler.callback else "Unknown"
-            logger.info(f"  📝 Handler {i}: {handler_name}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, handler in enumerate(dp.message.handlers):
+                handler_name = handler.callback.__name__ if handler.callback else "Unknown"
+                logger.debug(f"  📝 Handler {i}: {handler_name}")
         
         # Шаг 4: Команды бота (опционально)
         try:
-            logger.info("4️⃣ Импортируем utils.bot_commands...")
+            logger.debug("4️⃣ Импортируем utils.bot_commands...")
             bot_commands_func = safe_import_handler('utils.bot_commands', 'BotCommandManager')
             if bot_commands_func:
-                logger.info("✓ utils.bot_commands импортирован")
+                logger.debug("✓ utils.bot_commands импортирован")
                 
-                logger.info("4️⃣ Настраиваем команды бота...")
+                logger.debug("4️⃣ Настраиваем команды бота...")
                 command_manager = bot_commands_func(bot)
                 await command_manager.setup_commands()
-                logger.info("✓ Команды бота настроены")
+                logger.debug("✓ Команды бота настроены")
             else:
                 logger.warning("⚠️ Команды бота не настроены - модуль не импортирован")
         except Exception as e:
             logger.error(f"❌ Ошибка настройки команд (не критично): {e}")
         
-        logger.info("🎉 ИНИЦИАЛИЗАЦИЯ ЗАВЕРШЕНА УСПЕШНО!")
+        init_duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Бот инициализирован за {init_duration_ms} мс: "
+                    f"{working_handlers}/{len(handlers_imported)} модулей обработчиков, "
+                    f"{final_handlers} message handlers")
         return bot, dp
         
     except Exception as e:
@@ -483,47 +588,50 @@ async def add_builtin_handlers(dp):
     dp.message.register(builtin_status, Command("status"))
     dp.message.register(builtin_default)  # Последний - ловит всё остальное
     
-    logger.info("✅ Встроенные обработчики зарегистрированы")
+    logger.debug("✅ Встроенные обработчики зарегистрированы")
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """Обработка GET запросов"""
         try:
-            logger.info(f"GET запрос: {self.path}")
+            logger.debug(f"GET запрос: {self.path}")
             
-            # Health check
+            # Health check не инициализирует бота: холодный экземпляр отвечает
+            # сразу, без импорта обработчиков и запросов к Telegram
             if self.path in ['/', '/health']:
-                # Инициализируем бота при первом запросе чтобы убедиться что всё работает
-                try:
-                    bot_instance, dp_instance = asyncio.run(init_bot())
-                    handlers_count = len(dp_instance.message.handlers) if dp_instance.message.handlers else 0
-                    response = {
-                        "status": "ok", 
-                        "bot": "running",
-                        "webhook": "active",
-                        "handlers": handlers_count,
-                        "message": "Bot initialized successfully"
-                    }
-                except Exception as e:
-                    logger.error(f"Ошибка инициализации бота в health check: {e}")
-                    response = {
-                        "status": "error", 
-                        "bot": "error",
-                        "webhook": "inactive",
-                        "error": str(e)
-                    }
+                initialized = bot is not None and dp is not None
+                response = {
+                    "status": "ok",
+                    "bot": "running" if initialized else "not_initialized",
+                    "webhook": "active",
+                    "handlers": len(dp.message.handlers) if initialized else None,
+                    "init_ms": init_duration_ms,
+                }
                 self._send_response(200, response)
                 return
             
             # Установка webhook
             if self.path == '/set_webhook':
-                result = asyncio.run(self._set_webhook())
+                result = run_async(self._set_webhook())
                 self._send_response(200, result)
                 return
             
             # Информация о webhook
             if self.path == '/webhook_info':
-                result = asyncio.run(self._get_webhook_info())
+                result = run_async(self._get_webhook_info())
+                self._send_response(200, result)
+                return
+            
+            # Доставка outbox по расписанию: без фонового воркера сводки с истекшим
+            # окном иначе ждали бы следующего обновления
+            if self.path == '/cron/outbox':
+                if not CRON_SECRET:
+                    self._send_response(403, {"error": "CRON_SECRET не задан"})
+                    return
+                if self.headers.get('Authorization') != f"Bearer {CRON_SECRET}":
+                    self._send_response(401, {"error": "Unauthorized"})
+                    return
+                result = run_async(self._deliver_outbox())
                 self._send_response(200, result)
                 return
             
@@ -537,17 +645,20 @@ class handler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Обработка POST запросов"""
         try:
-            logger.info(f"POST запрос: {self.path}")
+            logger.debug(f"POST запрос: {self.path}")
             
             # Webhook endpoint
             if self.path == '/webhook':
-                result = self._run_async_safe(self._handle_webhook)
+                # Тело читается в потоке запроса: фоновый loop не блокируется на сокете
+                content_length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(content_length).decode('utf-8'))
+                result = run_async(self._handle_webhook(data))
                 self._send_response(200, result)
                 return
             
             # Установка webhook через POST
             if self.path == '/set_webhook':
-                result = self._run_async_safe(self._set_webhook)
+                result = run_async(self._set_webhook())
                 self._send_response(200, result)
                 return
             
@@ -558,73 +669,60 @@ class handler(BaseHTTPRequestHandler):
             logger.error(f"Ошибка POST запроса: {e}")
             self._send_response(500, {"error": str(e)})
     
-    def _run_async_safe(self, coro_func):
-        """Безопасный запуск async функции в serverless окружении"""
-        # Всегда создаем новый event loop для каждого webhook запроса
-        # Это самый надежный способ в serverless окружении
+    async def _claim_update(self, update_id) -> bool:
+        """Проверка, что обновление еще не принималось (повторы Telegram отсеиваются)"""
+        if update_id is None:
+            return True
         try:
-            logger.info("🔄 Создаем новый event loop для webhook")
-            new_loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(new_loop)
-            # Вызываем функцию для создания нового coroutine
-            result = new_loop.run_until_complete(coro_func())
-            new_loop.close()
-            logger.info("✅ Webhook обработан с новым event loop")
-            return result
+            from db.dedup import update_dedup
+            return await update_dedup.claim(update_id)
         except Exception as e:
-            logger.error(f"💥 Ошибка в новом event loop: {e}")
-            # Пробуем старую логику как fallback
-            try:
-                logger.info("🔧 Пробуем старую логику как fallback...")
-                loop = asyncio.get_event_loop()
-                if loop.is_closed():
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    logger.info("🔄 Создан fallback event loop")
-                
-                if loop.is_running():
-                    try:
-                        import nest_asyncio
-                        nest_asyncio.apply()
-                        logger.info("🔄 Применен nest_asyncio в fallback")
-                        return loop.run_until_complete(coro_func())
-                    except ImportError:
-                        raise Exception("nest_asyncio недоступен и loop запущен")
-                else:
-                    return loop.run_until_complete(coro_func())
-                    
-            except Exception as e2:
-                logger.error(f"💥 Все методы event loop не сработали: {e2}")
-                raise
+            # Без базы отсев недоступен: лучше обработать повтор, чем потерять обновление
+            logger.warning(f"⚠️ Не удалось проверить повтор обновления {update_id}: {e}")
+            return True
+    
+    async def _release_update(self, update_id):
+        """Освобождение обновления после ошибки, чтобы повторная доставка его обработала"""
+        try:
+            from db.dedup import update_dedup
+            await update_dedup.release(update_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось освободить обновление {update_id}: {e}")
     
-    async def _handle_webhook(self):
+    async def _handle_webhook(self, data):
         """Обработка webhook от Telegram"""
+        deadline = time.monotonic() + WEBHOOK_HANDLER_TIMEOUT - WEBHOOK_DELIVERY_RESERVE
+        update_id = None
+        dispatched = False
         try:
-            # Получение данных запроса
-            content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length).decode('utf-8')
-            data = json.loads(post_data)
-            
-            logger.info(f"📨 Получено обновление: {json.dumps(data, ensure_ascii=False)[:200]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📨 Получено обновление: {json.dumps(data, ensure_ascii=False)[:200]}...")
             
             # Инициализация бота
             bot_instance, dp_instance = await init_bot()
+            limit_outbound_waits()
+            
+            # Повторная доставка (Telegram не дождался ответа) получает 200 без обработки
+            if not await self._claim_update(data.get("update_id")):
+                logger.debug(f"🔁 Обновление {data.get('update_id')} уже принято, пропускаем повтор")
+                return {"ok": True, "duplicate": True}
+            update_id = data.get("update_id")
             
             # ДИАГНОСТИКА: Проверяем что обработчики есть
             handlers_count = len(dp_instance.message.handlers) if dp_instance.message.handlers else 0
-            logger.info(f"🎯 Доступно message handlers: {handlers_count}")
+            logger.debug(f"🎯 Доступно message handlers: {handlers_count}")
             
             if handlers_count == 0:
                 logger.error("❌ НЕТ ОБРАБОТЧИКОВ СООБЩЕНИЙ!")
-                logger.info("🆘 Добавляем экстренные обработчики...")
+                logger.debug("🆘 Добавляем экстренные обработчики...")
                 await add_minimal_handlers(dp_instance)
                 handlers_count = len(dp_instance.message.handlers)
-                logger.info(f"✅ Добавлено экстренных обработчиков: {handlers_count}")
-            else:
+                logger.debug(f"✅ Добавлено экстренных обработчиков: {handlers_count}")
+            elif logger.isEnabledFor(logging.DEBUG):
                 # Показываем список обработчиков для диагностики
                 for i, handler in enumerate(dp_instance.message.handlers):
                     handler_name = handler.callback.__name__ if handler.callback else "Unknown"
-                    logger.info(f"  📝 Handler {i}: {handler_name}")
+                    logger.debug(f"  📝 Handler {i}: {handler_name}")
             
             # Создание Update объекта
             from aiogram.types import Update
@@ -634,16 +732,30 @@ class handler(BaseHTTPRequestHandler):
             if update.message:
                 text = update.message.text or "<non-text message>"
                 user_id = update.message.from_user.id if update.message.from_user else "unknown"
-                logger.info(f"📩 Сообщение от {user_id}: '{text[:50]}...'")
+                logger.debug(f"📩 Сообщение от {user_id}: '{text[:50]}...'")
             elif update.callback_query:
-                logger.info(f"🔘 Callback query: {update.callback_query.data}")
+                logger.debug(f"🔘 Callback query: {update.callback_query.data}")
             else:
-                logger.info(f"❓ Неизвестный тип апдейта: {update}")
+                logger.debug(f"❓ Неизвестный тип апдейта: {update}")
             
             # Обработка обновления
-            logger.info("⚡ Начинаем обработку апдейта...")
+            logger.debug("⚡ Начинаем обработку апдейта...")
             await dp_instance.feed_update(bot_instance, update)
-            logger.info("✅ Апдейт обработан успешно")
+            # Изменения обновления зафиксированы: повторная обработка создала бы
+            # дубли заявок и пополнений, поэтому дальше обновление не освобождается
+            dispatched = True
+            # Экземпляр замораживается после ответа: отложенные состояния FSM,
+            # уведомления outbox и сообщения из очереди отправки записываются
+            # и отправляются сейчас, но не дольше оставшегося времени запроса
+            await flush_fsm_storage(dp_instance)
+            try:
+                await asyncio.wait_for(deliver_notifications(bot_instance),
+                                       max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                logger.warning("Доставка уведомлений не уложилась в отведенное время, "
+                               "остаток отправит outbox")
+            await drain_outbound_queue(max(0.0, deadline - time.monotonic()))
+            logger.debug("✅ Апдейт обработан успешно")
             
             return {"ok": True}
             
@@ -652,6 +764,26 @@ class handler(BaseHTTPRequestHandler):
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
+        finally:
+            # Ошибка или отмена по WEBHOOK_HANDLER_TIMEOUT (CancelledError не
+            # перехватывается except Exception) до обработки обновления:
+            # повторная доставка обработает его заново
+            if not dispatched and update_id is not None:
+                await self._release_update(update_id)
+    
+    async def _deliver_outbox(self):
+        """Доставка накопившихся уведомлений и сводок вне обработки обновления"""
+        deadline = time.monotonic() + WEBHOOK_HANDLER_TIMEOUT - WEBHOOK_DELIVERY_RESERVE
+        bot_instance, _ = await init_bot()
+        limit_outbound_waits()
+        try:
+            processed = await asyncio.wait_for(deliver_notifications(bot_instance),
+                                               max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logger.warning("Доставка outbox по расписанию не уложилась в отведенное время")
+            processed = None
+        await drain_outbound_queue(max(0.0, deadline - time.monotonic()))
+        return {"ok": True, "processed": processed}
     
     async def _set_webhook(self):
         """Установка webhook"""
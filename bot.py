@@ -3,12 +3,12 @@
 Обрабатывает заявки от маркетологов и управляет балансом.
 """
 
+import os
 import asyncio
 import logging
 from datetime import datetime
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from handlers.marketer import setup_marketer_handlers
 from handlers.financier import setup_financier_handlers
@@ -18,9 +18,22 @@ from handlers.menu_handler import setup_menu_handlers
 from handlers.command_handlers import setup_command_handlers
 from handlers.voice_handler import setup_voice_handlers
 from db.database import init_database
+from db.fsm_storage import SQLiteStorage
+from db.pool import close_pool
 from utils.config import Config
 from utils.logger import setup_logger
 from utils.bot_commands import BotCommandManager
+from utils.outbound import drain_outbound
+from utils.outbox import OutboxWorker
+
+# Режим polling: default - dp.start_polling, sharded - очереди по чатам (webhook/polling.py)
+POLLING_MODE = os.getenv("POLLING_MODE", "default")
+
+# Сколько ждать отправки очереди исходящих сообщений при остановке (секунды)
+OUTBOUND_DRAIN_TIMEOUT = 10
+
+# Сколько ждать завершения пачки доставки outbox при остановке (секунды)
+OUTBOX_STOP_TIMEOUT = 10
 
 
 async def main():
@@ -39,7 +52,7 @@ async def main():
     
     # Создание бота и диспетчера
     bot = Bot(token=config.BOT_TOKEN)
-    storage = MemoryStorage()
+    storage = SQLiteStorage()
     dp = Dispatcher(storage=storage)
     
     # Инициализация базы данных
@@ -64,13 +77,25 @@ async def main():
     
     logger.info("Команды бота настроены")
     
+    # Фоновая доставка уведомлений из outbox
+    outbox_worker = OutboxWorker(bot)
+    outbox_worker.start()
+    
     try:
         logger.info("Бот запущен")
-        await dp.start_polling(bot)
+        if POLLING_MODE == "sharded":
+            from webhook.polling import run_sharded_polling
+            await run_sharded_polling(bot, dp)
+        else:
+            await dp.start_polling(bot)
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
+        await storage.close()
+        await outbox_worker.stop(OUTBOX_STOP_TIMEOUT)
+        await drain_outbound(OUTBOUND_DRAIN_TIMEOUT)
         await bot.session.close()
+        await close_pool()
         logger.info("Бот остановлен")
 
 
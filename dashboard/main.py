@@ -8,7 +8,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, JSONResponse
 from datetime import datetime, timedelta
-import sqlite3
+from typing import Optional
 import os
 import sys
 
@@ -17,6 +17,12 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.config import Config
 from db.database import BalanceDB, PaymentDB
+from db.rollups import RollupDB
+from db.archive import query_range
+from db.readonly import (
+    readonly_connection, DASHBOARD_RECENT_PAYMENTS_SQL, DASHBOARD_BALANCE_HISTORY_SQL, PAID_TODAY_COUNT_SQL
+)
+from db.sqlstats import get_sql_stats
 
 app = FastAPI(title="Manager Dashboard", description="Дашборд для руководителей")
 
@@ -58,7 +64,7 @@ async def get_dashboard_stats(request: Request):
         pending_payments = await PaymentDB.get_pending_payments()
         
         # Вычисляем дополнительную статистику
-        total_pending = sum(payment["amount"] for payment in pending_payments)
+        total_pending = sum(payment.amount for payment in pending_payments)
         pending_count = len(pending_payments)
         
         # Получаем историю платежей за последние 7 дней
@@ -97,47 +103,38 @@ async def get_dashboard_stats(request: Request):
 
 
 @app.get("/api/payments")
-async def get_payments_data(request: Request):
-    """API для получения данных о платежах"""
+async def get_payments_data(request: Request, date_from: Optional[str] = None,
+                            date_to: Optional[str] = None):
+    """API для получения данных о платежах (за период - включая архив)"""
     try:
         # Проверяем авторизацию
         await get_manager_auth(request)
-        # Получаем все платежи
-        db_path = config.DATABASE_PATH
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
         
-        # Запрос платежей с дополнительной информацией
-        cursor.execute("""
-            SELECT 
-                id,
-                service_name,
-                amount,
-                project_name,
-                payment_method,
-                status,
-                created_at,
-                marketer_id
-            FROM payments 
-            ORDER BY created_at DESC 
-            LIMIT 50
-        """)
+        # Исторический диапазон: основная база и помесячные архивы
+        if date_from and date_to:
+            payments = await query_range("payments", date_from, date_to)
+            return {"payments": payments}
         
-        payments = []
-        for row in cursor.fetchall():
-            payments.append({
-                "id": row["id"],
-                "service_name": row["service_name"],
-                "amount": row["amount"],
-                "project_name": row["project_name"],
-                "payment_method": row["payment_method"],
-                "status": row["status"],
-                "created_at": row["created_at"],
-                "marketer_id": row["marketer_id"]
-            })
+        # Получаем все платежи (соединение только для чтения)
+        with readonly_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Запрос платежей с дополнительной информацией
+            cursor.execute(DASHBOARD_RECENT_PAYMENTS_SQL)
+            
+            payments = []
+            for row in cursor.fetchall():
+                payments.append({
+                    "id": row["id"],
+                    "service_name": row["service_name"],
+                    "amount": row["amount"],
+                    "project_name": row["project_name"],
+                    "payment_method": row["payment_method"],
+                    "status": row["status"],
+                    "created_at": row["created_at"],
+                    "marketer_id": row["marketer_id"]
+                })
         
-        conn.close()
         return {"payments": payments}
         
     except Exception as e:
@@ -145,64 +142,68 @@ async def get_payments_data(request: Request):
 
 
 @app.get("/api/balance-history")
-async def get_balance_history(request: Request):
-    """API для получения истории баланса"""
+async def get_balance_history(request: Request, date_from: Optional[str] = None,
+                              date_to: Optional[str] = None):
+    """API для получения истории баланса (за период - включая архив)"""
     try:
         # Проверяем авторизацию
         await get_manager_auth(request)
-        db_path = config.DATABASE_PATH
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
         
-        # Получаем историю изменений баланса
-        cursor.execute("""
-            SELECT 
-                amount,
-                description,
-                timestamp,
-                user_id
-            FROM balance_history 
-            ORDER BY timestamp DESC 
-            LIMIT 30
-        """)
+        # Исторический диапазон: основная база и помесячные архивы
+        if date_from and date_to:
+            rows = await query_range("balance_history", date_from, date_to)
+            history = [
+                {
+                    "amount": row["amount"],
+                    "description": row["description"],
+                    "timestamp": row["timestamp"],
+                    "user_id": row["user_id"]
+                }
+                for row in rows
+            ]
+            return {"history": history}
         
-        history = []
-        for row in cursor.fetchall():
-            history.append({
-                "amount": row["amount"],
-                "description": row["description"],
-                "timestamp": row["timestamp"],
-                "user_id": row["user_id"]
-            })
+        with readonly_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Получаем историю изменений баланса
+            cursor.execute(DASHBOARD_BALANCE_HISTORY_SQL)
+            
+            history = []
+            for row in cursor.fetchall():
+                history.append({
+                    "amount": row["amount"],
+                    "description": row["description"],
+                    "timestamp": row["timestamp"],
+                    "user_id": row["user_id"]
+                })
         
-        conn.close()
         return {"history": history}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching balance history: {str(e)}")
 
 
+@app.get("/api/dbstats")
+async def get_db_stats(request: Request, limit: int = 20, order_by: str = "total_ms"):
+    """API статистики запросов дашборда к базе данных"""
+    # Проверяем авторизацию
+    await get_manager_auth(request)
+
+    if order_by not in ("total_ms", "count", "max_ms", "p95_ms", "rows", "lock_wait_ms"):
+        raise HTTPException(status_code=400, detail=f"Unknown order_by: {order_by}")
+
+    return get_sql_stats(limit, order_by)
+
+
 async def get_recent_payments(since_date):
-    """Получает платежи с определенной даты"""
+    """Получает оплаченные платежи с определенной даты (с точностью до дня)"""
     try:
-        db_path = config.DATABASE_PATH
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT COUNT(*) as count, SUM(amount) as total
-            FROM payments 
-            WHERE created_at >= ? AND status = 'paid'
-        """, (since_date.isoformat(),))
-        
-        result = cursor.fetchone()
-        conn.close()
+        result = await RollupDB.get_paid_totals_since(since_date.date().isoformat())
         
         return {
-            "count": result["count"] or 0,
-            "total": round(result["total"] or 0, 2)
+            "count": result["count"],
+            "total": round(result["total"], 2)
         }
     except:
         return {"count": 0, "total": 0}
@@ -211,26 +212,8 @@ async def get_recent_payments(since_date):
 async def get_project_statistics():
     """Получает статистику по проектам"""
     try:
-        db_path = config.DATABASE_PATH
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                project_name,
-                COUNT(*) as count,
-                SUM(amount) as total,
-                AVG(amount) as avg_amount
-            FROM payments 
-            WHERE project_name IS NOT NULL
-            GROUP BY project_name 
-            ORDER BY total DESC
-            LIMIT 10
-        """)
-        
         projects = []
-        for row in cursor.fetchall():
+        for row in await RollupDB.get_project_stats(limit=10):
             projects.append({
                 "name": row["project_name"],
                 "count": row["count"],
@@ -238,7 +221,6 @@ async def get_project_statistics():
                 "average": round(row["avg_amount"], 2)
             })
         
-        conn.close()
         return projects
     except:
         return []
@@ -247,32 +229,15 @@ async def get_project_statistics():
 async def get_daily_statistics():
     """Получает статистику по дням"""
     try:
-        db_path = config.DATABASE_PATH
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         # Статистика за последние 7 дней
-        cursor.execute("""
-            SELECT 
-                DATE(created_at) as date,
-                COUNT(*) as count,
-                SUM(amount) as total
-            FROM payments 
-            WHERE created_at >= date('now', '-7 days')
-            GROUP BY DATE(created_at)
-            ORDER BY date DESC
-        """)
-        
         daily = []
-        for row in cursor.fetchall():
+        for row in await RollupDB.get_daily_stats(days=7):
             daily.append({
                 "date": row["date"],
                 "count": row["count"],
                 "total": round(row["total"], 2)
             })
         
-        conn.close()
         return daily
     except:
         return []
@@ -281,18 +246,12 @@ async def get_daily_statistics():
 async def get_payments_today():
     """Получает количество платежей за сегодня"""
     try:
-        db_path = config.DATABASE_PATH
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM payments 
-            WHERE DATE(created_at) = DATE('now') AND status = 'paid'
-        """)
-        
-        result = cursor.fetchone()
-        conn.close()
+        with readonly_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(PAID_TODAY_COUNT_SQL)
+            
+            result = cursor.fetchone()
         
         return result[0] if result else 0
     except:
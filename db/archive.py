@@ -0,0 +1,341 @@
+"""
+Архивирование старых записей в помесячные файлы базы данных.
+Закрытые (оплаченные/отклоненные) заявки, транзакции и история баланса
+старше заданного возраста переносятся из основной базы в файлы
+archive_YYYY_MM.db. Основные таблицы остаются небольшими, а исторические
+данные подключаются через ATTACH только на время запроса.
+
+Запуск:
+    python -m db.archive run [--days N]
+    python -m db.archive list
+    python -m db.archive query payments 2024-01-01 2024-03-31 [--status paid]
+"""
+
+import os
+import re
+import sys
+import asyncio
+import logging
+import argparse
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from db.pool import read_connection, write_connection
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# Возраст записей (в днях), после которого они переносятся в архив
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+
+# Каталог архивных файлов (по умолчанию - archive рядом с основной базой)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "")
+
+# Архивируемые таблицы: (таблица, колонка даты, дополнительное условие отбора)
+ARCHIVE_TABLES: List[Tuple[str, str, Optional[str]]] = [
+    ("payments", "created_at", "status IN ('paid', 'rejected')"),
+    ("transactions", "created_at", None),
+    ("balance_history", "timestamp", None),
+]
+
+# Колонки, которые возвращают запросы по всем разделам
+QUERY_COLUMNS = {
+    "payments": ["id", "marketer_id", "service_name", "amount", "payment_method",
+                 "project_name", "status", "created_at"],
+    "balance_history": ["id", "amount", "description", "timestamp", "user_id",
+                        "transaction_type"],
+    "transactions": ["id", "user_id", "transaction_type", "amount", "description",
+                     "created_at", "payment_id"],
+}
+
+_ARCHIVE_FILE_RE = re.compile(r"^archive_(\d{4})_(\d{2})\.db$")
+
+# Псевдоним подключаемого архива
+_ALIAS = "arch"
+
+
+def get_archive_dir() -> str:
+    """Каталог архивных файлов"""
+    if ARCHIVE_DIR:
+        return ARCHIVE_DIR
+    return os.path.join(os.path.dirname(Config().DATABASE_PATH) or ".", "archive")
+
+
+def archive_path(month: str) -> str:
+    """Путь к архивному файлу месяца (month в формате YYYY-MM)"""
+    return os.path.join(get_archive_dir(), f"archive_{month.replace('-', '_')}.db")
+
+
+def list_archives() -> Dict[str, str]:
+    """Существующие архивные файлы: {YYYY-MM: путь}"""
+    directory = get_archive_dir()
+    if not os.path.isdir(directory):
+        return {}
+
+    archives = {}
+    for name in sorted(os.listdir(directory)):
+        match = _ARCHIVE_FILE_RE.match(name)
+        if match:
+            archives[f"{match.group(1)}-{match.group(2)}"] = os.path.join(directory, name)
+    return archives
+
+
+def _month_bounds(month: str) -> Tuple[str, str]:
+    """Начало месяца и начало следующего месяца (YYYY-MM-DD)"""
+    year, mon = map(int, month.split("-"))
+    start = date(year, mon, 1)
+    end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+    return start.isoformat(), end.isoformat()
+
+
+def months_in_range(date_from: str, date_to: str) -> List[str]:
+    """Месяцы (YYYY-MM), которые затрагивает диапазон дат"""
+    start = date.fromisoformat(date_from).replace(day=1)
+    end = date.fromisoformat(date_to).replace(day=1)
+
+    months = []
+    while start <= end:
+        months.append(start.strftime("%Y-%m"))
+        start = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return months
+
+
+async def _columns(db, schema: str, table: str) -> List[str]:
+    """Колонки таблицы в указанной схеме"""
+    cursor = await db.execute(f"PRAGMA {schema}.table_info({table})")
+    return [row[1] for row in await cursor.fetchall()]
+
+
+async def _ensure_archive_schema(db):
+    """Создание архивных таблиц по образцу основных (с тем же первичным ключом)"""
+    for table, date_column, _ in ARCHIVE_TABLES:
+        cursor = await db.execute(
+            "SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        )
+        row = await cursor.fetchone()
+        ddl = re.sub(rf"^CREATE TABLE\s+\"?{table}\"?",
+                     f"CREATE TABLE IF NOT EXISTS {_ALIAS}.{table}", row[0], count=1)
+        await db.execute(ddl)
+        await db.execute(
+            f"CREATE INDEX IF NOT EXISTS {_ALIAS}.idx_{table}_{date_column} "
+            f"ON {table} ({date_column})"
+        )
+
+
+async def _pending_months(db, days: int) -> List[str]:
+    """Месяцы, в которых есть записи для архивирования"""
+    parts = []
+    params = []
+    for table, date_column, condition in ARCHIVE_TABLES:
+        where = f"{date_column} < datetime('now', ?)"
+        if condition:
+            where += f" AND {condition}"
+        parts.append(f"SELECT DISTINCT strftime('%Y-%m', {date_column}) FROM {table} WHERE {where}")
+        params.append(f"-{days} days")
+
+    cursor = await db.execute(" UNION ".join(parts) + " ORDER BY 1", params)
+    return [row[0] for row in await cursor.fetchall() if row[0]]
+
+
+async def _archive_month(db, month: str, days: int) -> Dict[str, int]:
+    """
+    Перенос записей одного месяца в его архивный файл
+
+    Копирование и удаление выполняются в одной транзакции. Архивные таблицы
+    имеют тот же первичный ключ, что и основные, поэтому повторный запуск
+    после сбоя не создаст дубликатов.
+    """
+    path = archive_path(month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    month_start, month_end = _month_bounds(month)
+
+    await db.execute(f"ATTACH DATABASE ? AS {_ALIAS}", (path,))
+    try:
+        await _ensure_archive_schema(db)
+        await db.commit()
+
+        moved = {}
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            for table, date_column, condition in ARCHIVE_TABLES:
+                main_columns = await _columns(db, "main", table)
+                archive_columns = set(await _columns(db, _ALIAS, table))
+                columns = ", ".join(c for c in main_columns if c in archive_columns)
+
+                where = (f"{date_column} >= ? AND {date_column} < ? "
+                         f"AND {date_column} < datetime('now', ?)")
+                if condition:
+                    where += f" AND {condition}"
+                params = (month_start, month_end, f"-{days} days")
+
+                await db.execute(
+                    f"INSERT OR IGNORE INTO {_ALIAS}.{table} ({columns}) "
+                    f"SELECT {columns} FROM main.{table} WHERE {where}", params
+                )
+                cursor = await db.execute(f"DELETE FROM main.{table} WHERE {where}", params)
+                moved[table] = cursor.rowcount
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    finally:
+        await db.execute(f"DETACH DATABASE {_ALIAS}")
+
+    return moved
+
+
+async def archive_old_records(days: int = ARCHIVE_AFTER_DAYS) -> Dict[str, Dict[str, int]]:
+    """
+    Архивирование записей старше days дней
+
+    Returns:
+        {YYYY-MM: {таблица: перенесено строк}}
+    """
+    if days < 1:
+        raise ValueError("Возраст архивирования должен быть не меньше 1 дня")
+
+    result = {}
+    async with write_connection() as db:
+        for month in await _pending_months(db, days):
+            result[month] = await _archive_month(db, month, days)
+            logger.info(f"Архив {month}: {result[month]}")
+    return result
+
+
+async def query_range(table: str, date_from: str, date_to: str,
+                      status: Optional[str] = None, limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    Записи за диапазон дат из основной базы и архивов
+
+    Архивные файлы нужных месяцев подключаются по одному на время запроса.
+
+    Args:
+        table: payments, transactions или balance_history
+        date_from: Начальная дата (YYYY-MM-DD, включительно)
+        date_to: Конечная дата (YYYY-MM-DD, включительно)
+        status: Фильтр по статусу (только для payments)
+        limit: Максимальное количество записей
+
+    Returns:
+        Записи, новые сверху
+    """
+    date_column = next((d for t, d, _ in ARCHIVE_TABLES if t == table), None)
+    if date_column is None:
+        raise ValueError(f"Неизвестная таблица: {table}")
+    if status is not None and table != "payments":
+        raise ValueError("Фильтр по статусу доступен только для payments")
+
+    end = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat()
+    columns = ", ".join(QUERY_COLUMNS[table])
+    where = f"{date_column} >= ? AND {date_column} < ?"
+    params: List[Any] = [date.fromisoformat(date_from).isoformat(), end]
+    if status is not None:
+        where += " AND status = ?"
+        params.append(status)
+    params.append(limit)
+
+    archives = list_archives()
+    months = [m for m in months_in_range(date_from, date_to) if m in archives]
+
+    rows = []
+    async with read_connection() as db:
+        cursor = await db.execute(
+            f"SELECT {columns} FROM main.{table} WHERE {where} "
+            f"ORDER BY {date_column} DESC LIMIT ?", params
+        )
+        rows.extend(dict(row) for row in await cursor.fetchall())
+
+        for month in months:
+            await db.execute(f"ATTACH DATABASE ? AS {_ALIAS}", (archives[month],))
+            try:
+                cursor = await db.execute(
+                    f"SELECT {columns} FROM {_ALIAS}.{table} WHERE {where} "
+                    f"ORDER BY {date_column} DESC LIMIT ?", params
+                )
+                rows.extend(dict(row) for row in await cursor.fetchall())
+            finally:
+                await db.execute(f"DETACH DATABASE {_ALIAS}")
+
+    rows.sort(key=lambda row: (row[date_column] or "", row["id"]), reverse=True)
+    return rows[:limit]
+
+
+async def aggregate_archived_payments(db) -> Dict[tuple, Tuple[int, float]]:
+    """
+    Агрегаты заархивированных платежей в разрезе таблицы payment_rollups
+
+    Args:
+        db: Соединение aiosqlite вне транзакции (архивы подключаются через ATTACH)
+
+    Returns:
+        {(day, project_name, service_name, marketer_id, status): (count, total)}
+    """
+    result: Dict[tuple, Tuple[int, float]] = {}
+    for path in list_archives().values():
+        await db.execute(f"ATTACH DATABASE ? AS {_ALIAS}", (path,))
+        try:
+            cursor = await db.execute(f"""
+                SELECT DATE(created_at), project_name, service_name, marketer_id,
+                       IFNULL(status, 'unknown'), COUNT(*), SUM(amount)
+                FROM {_ALIAS}.payments
+                GROUP BY 1, 2, 3, 4, 5
+            """)
+            for row in await cursor.fetchall():
+                key = tuple(row[:5])
+                count, total = result.get(key, (0, 0.0))
+                result[key] = (count + row[5], total + row[6])
+        finally:
+            await db.execute(f"DETACH DATABASE {_ALIAS}")
+    return result
+
+
+async def _main(argv: List[str]) -> int:
+    """Командная строка архива"""
+    from db.database import init_database
+    from db.pool import close_pool
+
+    parser = argparse.ArgumentParser(prog="python -m db.archive", description="Архив старых записей")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="перенести старые записи в архив")
+    run_parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                            help="возраст записей в днях")
+
+    commands.add_parser("list", help="список архивных файлов")
+
+    query_parser = commands.add_parser("query", help="записи за период из базы и архивов")
+    query_parser.add_argument("table", choices=sorted(QUERY_COLUMNS))
+    query_parser.add_argument("date_from", help="YYYY-MM-DD")
+    query_parser.add_argument("date_to", help="YYYY-MM-DD")
+    query_parser.add_argument("--status")
+    query_parser.add_argument("--limit", type=int, default=100)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for month, path in list_archives().items():
+            print(f"{month}  {path}  {os.path.getsize(path) // 1024} КБ")
+        return 0
+
+    await init_database()
+    try:
+        if args.command == "run":
+            result = await archive_old_records(args.days)
+            if not result:
+                print(f"Записей старше {args.days} дней нет")
+            for month, moved in result.items():
+                print(f"{month}: " + ", ".join(f"{table} {count}" for table, count in moved.items()))
+        else:
+            rows = await query_range(args.table, args.date_from, args.date_to,
+                                     status=args.status, limit=args.limit)
+            for row in rows:
+                print(" | ".join(str(value) for value in row.values()))
+            print(f"\nЗаписей: {len(rows)}")
+    finally:
+        await close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
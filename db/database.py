@@ -4,14 +4,79 @@
 """
 
 import os
-import aiosqlite
 import logging
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from utils.config import Config
+from db.pool import get_pool, read_connection, write_connection
+from db.writer import submit_write
+from db.migrations import apply_migrations
+from db.outbox import (
+    OutboxDB, signal_outbox, NOTIFY_DIGEST_WINDOW_SECONDS, NOTIFY_DIGEST_IMMEDIATE_AMOUNT
+)
+from db.models import Payment, Transaction, BalanceEvent, select_columns, fetch_all, fetch_one, verify_models
 
 logger = logging.getLogger(__name__)
 
+# Списки колонок моделей для SELECT
+PAYMENT_COLUMNS = select_columns(Payment)
+TRANSACTION_COLUMNS = select_columns(Transaction)
+BALANCE_EVENT_COLUMNS = select_columns(BalanceEvent)
+
+# Горячие запросы чтения (их планы проверяет python -m db.migrations)
+PENDING_PAYMENTS_SQL = f"""
+    SELECT {PAYMENT_COLUMNS} FROM payments WHERE status = 'pending'
+    ORDER BY created_at DESC
+"""
+
+RECENT_PAYMENTS_SQL = f"""
+    SELECT {PAYMENT_COLUMNS} FROM payments
+    ORDER BY created_at DESC
+    LIMIT ?
+"""
+
+RECENT_PAID_PAYMENTS_SQL = f"""
+    SELECT {PAYMENT_COLUMNS} FROM payments
+    WHERE created_at >= datetime('now', ?)
+    AND status = 'paid'
+    ORDER BY created_at DESC
+"""
+
+MARKETER_STATUS_COUNTS_SQL = """
+    SELECT status, COUNT(*) FROM payments
+    WHERE marketer_id = ?
+    GROUP BY status
+"""
+
+BALANCE_HISTORY_SQL = f"""
+    SELECT {BALANCE_EVENT_COLUMNS} FROM balance_history
+    ORDER BY timestamp DESC
+    LIMIT ?
+"""
+
+
+def payments_page_sql(by_marketer: bool, by_status: bool, after_cursor: bool) -> str:
+    """
+    Запрос страницы заявок (PaymentDB.list_payments)
+
+    Параметры запроса по порядку: marketer_id, status, курсор (created_at, id),
+    размер страницы - только для включенных условий.
+    """
+    conditions = []
+    if by_marketer:
+        conditions.append("marketer_id = ?")
+    if by_status:
+        conditions.append("status = ?")
+    if after_cursor:
+        conditions.append("(created_at, id) < (?, ?)")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"""
+        SELECT {PAYMENT_COLUMNS} FROM payments
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    """
+
 
 async def init_database():
     """Инициализация базы данных и создание таблиц"""
@@ -22,7 +87,14 @@ async def init_database():
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir)
     
-    async with aiosqlite.connect(config.DATABASE_PATH) as db:
+    async with write_connection() as db:
+        # WAL: читатели (дашборды) и писатель не блокируют друг друга.
+        # Режим сохраняется в файле базы и действует для всех соединений
+        cursor = await db.execute("PRAGMA journal_mode = WAL")
+        journal_mode = (await cursor.fetchone())[0]
+        if journal_mode.lower() != "wal":
+            logger.warning(f"Не удалось включить WAL, режим журнала: {journal_mode}")
+        
         # Таблица платежей
         await db.execute("""
             CREATE TABLE IF NOT EXISTS payments (
@@ -88,6 +160,10 @@ async def init_database():
             """)
         
         await db.commit()
+        
+        # Индексы и последующие изменения схемы
+        await apply_migrations(db)
+        await verify_models(db)
         logger.info("База данных инициализирована успешно")
 
 
@@ -97,10 +173,16 @@ class PaymentDB:
     @staticmethod
     async def create_payment(marketer_id: int, service_name: str, amount: float, 
                            payment_method: str, payment_details: str, 
-                           project_name: str, file_path: Optional[str] = None) -> int:
-        """Создание новой заявки на платеж"""
-        config = Config()
-        
+                           project_name: str, file_path: Optional[str] = None,
+                           notify: bool = False) -> int:
+        """
+        Создание новой заявки на платеж
+
+        Args:
+            notify: Записать в той же транзакции уведомление финансистам (outbox).
+                При включенных сводках (NOTIFY_DIGEST_WINDOW_SECONDS) заявки меньше
+                NOTIFY_DIGEST_IMMEDIATE_AMOUNT попадают в сводку payment_digest
+        """
         # Валидация входных данных
         if amount <= 0:
             raise ValueError("Сумма должна быть больше нуля")
@@ -109,7 +191,7 @@ class PaymentDB:
         if not project_name.strip():
             raise ValueError("Название проекта не может быть пустым")
         
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        async def _create(db) -> int:
             cursor = await db.execute("""
                 INSERT INTO payments 
                 (marketer_id, service_name, amount, payment_method, 
@@ -117,71 +199,321 @@ class PaymentDB:
                 VALUES (?, ?, ?, ?, ?, ?, ?)
             """, (marketer_id, service_name, amount, payment_method, 
                   payment_details, project_name, file_path))
-            
             payment_id = cursor.lastrowid
-            await db.commit()
             
-            logger.info(f"Создана заявка на платеж ID: {payment_id}")
+            if notify:
+                payload = {
+                    "payment_id": payment_id,
+                    "service_name": service_name,
+                    "amount": amount,
+                    "project_name": project_name,
+                    "payment_method": payment_method,
+                    "payment_details": payment_details,
+                }
+                if NOTIFY_DIGEST_WINDOW_SECONDS > 0 and amount < NOTIFY_DIGEST_IMMEDIATE_AMOUNT:
+                    await OutboxDB.add_digest_item(db, "payment_digest", Config().FINANCIERS, payload,
+                                                   dedup_key=f"payment_created:{payment_id}")
+                else:
+                    await OutboxDB.add(db, "payment_created", Config().FINANCIERS, payload,
+                                       dedup_key=f"payment_created:{payment_id}")
             return payment_id
+        
+        payment_id = await submit_write(_create, on_commit=signal_outbox if notify else None)
+        logger.info(f"Создана заявка на платеж ID: {payment_id}")
+        return payment_id
     
     @staticmethod
-    async def get_payment(payment_id: int) -> Optional[Dict[str, Any]]:
+    async def get_payment(payment_id: int) -> Optional[Payment]:
         """Получение платежа по ID"""
-        config = Config()
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("""
-                SELECT * FROM payments WHERE id = ?
+        async with read_connection() as db:
+            return await fetch_one(db, Payment, f"""
+                SELECT {PAYMENT_COLUMNS} FROM payments WHERE id = ?
             """, (payment_id,))
-            
-            row = await cursor.fetchone()
-            return dict(row) if row else None
     
     @staticmethod
-    async def get_payments_by_marketer(marketer_id: int) -> List[Dict[str, Any]]:
-        """Получение всех заявок конкретного маркетолога"""
-        config = Config()
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("""
-                SELECT * FROM payments 
-                WHERE marketer_id = ? 
-                ORDER BY created_at DESC
-            """, (marketer_id,))
-            
+    async def list_payments(marketer_id: Optional[int] = None, status: Optional[str] = None,
+                            before_created_at: Optional[str] = None,
+                            before_id: Optional[int] = None,
+                            limit: int = 10) -> List[Payment]:
+        """
+        Страница заявок, новые сверху (keyset-пагинация)
+
+        Курсор - пара (created_at, id) последней заявки предыдущей страницы,
+        поэтому стоимость запроса не зависит от того, насколько далеко
+        пролистан список.
+
+        Args:
+            marketer_id: Заявки только этого маркетолога (None - всех)
+            status: Фильтр по статусу (None - любой)
+            before_created_at: created_at последней заявки предыдущей страницы
+            before_id: id последней заявки предыдущей страницы
+            limit: Размер страницы
+
+        Returns:
+            Список заявок
+        """
+        if (before_created_at is None) != (before_id is None):
+            raise ValueError("Курсор страницы задается парой before_created_at и before_id")
+        if limit < 1:
+            raise ValueError("Размер страницы должен быть больше нуля")
+
+        params: List[Any] = []
+        if marketer_id is not None:
+            params.append(marketer_id)
+        if status is not None:
+            params.append(status)
+        if before_id is not None:
+            params.extend([before_created_at, before_id])
+        params.append(limit)
+
+        sql = payments_page_sql(marketer_id is not None, status is not None, before_id is not None)
+        async with read_connection() as db:
+            return await fetch_all(db, Payment, sql, params)
+
+    @staticmethod
+    async def count_payments_by_status(marketer_id: Optional[int] = None) -> Dict[str, int]:
+        """Количество заявок по статусам (маркетолога или всех)"""
+        async with read_connection() as db:
+            if marketer_id is None:
+                cursor = await db.execute("""
+                    SELECT status, COUNT(*) FROM payments GROUP BY status
+                """)
+            else:
+                cursor = await db.execute(MARKETER_STATUS_COUNTS_SQL, (marketer_id,))
+
             rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
-    
+            return {row[0]: row[1] for row in rows}
+
     @staticmethod
-    async def update_payment_status(payment_id: int, status: str, 
-                                  confirmation_hash: Optional[str] = None,
-                                  confirmation_file: Optional[str] = None):
-        """Обновление статуса платежа"""
-        config = Config()
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            await db.execute("""
-                UPDATE payments 
-                SET status = ?, confirmation_hash = ?, confirmation_file = ?,
+    async def confirm_payment(payment_id: int,
+                              confirmation_hash: Optional[str] = None,
+                              confirmation_file: Optional[str] = None,
+                              description: str = "",
+                              notify: bool = False) -> Optional[float]:
+        """
+        Подтверждение оплаты одной транзакцией
+
+        Переводит заявку из pending в paid, записывает транзакцию и историю
+        баланса и списывает сумму с баланса. Статус меняется только если заявка
+        еще ожидает оплаты, поэтому два одновременных подтверждения не спишут
+        сумму дважды.
+
+        Args:
+            notify: Записать в той же транзакции уведомление маркетологу и,
+                если баланс опустился ниже порога, руководителям (outbox)
+
+        Returns:
+            Новый баланс или None, если заявка не найдена или уже обработана
+        """
+        async def _confirm(db) -> Optional[tuple]:
+            cursor = await db.execute("""
+                UPDATE payments
+                SET status = 'paid', confirmation_hash = ?, confirmation_file = ?,
                     updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (status, confirmation_hash, confirmation_file, payment_id))
-            
-            await db.commit()
-            logger.info(f"Обновлен статус платежа ID: {payment_id} -> {status}")
-    
+                WHERE id = ? AND status = 'pending'
+            """, (confirmation_hash, confirmation_file, payment_id))
+
+            if cursor.rowcount != 1:
+                return None
+
+            cursor = await db.execute("""
+                SELECT marketer_id, amount, service_name, project_name FROM payments WHERE id = ?
+            """, (payment_id,))
+            payment = await cursor.fetchone()
+            amount = payment["amount"]
+            note = description or f"Оплата {payment['service_name']} для {payment['project_name']}"
+
+            # Обновляем баланс
+            await db.execute("""
+                UPDATE balance
+                SET current_balance = current_balance - ?,
+                    last_updated = CURRENT_TIMESTAMP
+                WHERE id = 1
+            """, (amount,))
+
+            # Записываем транзакцию
+            await db.execute("""
+                INSERT INTO transactions
+                (user_id, transaction_type, amount, description, payment_id)
+                VALUES (?, 'expense', ?, ?, ?)
+            """, (0, amount, note, payment_id))
+
+            # Записываем в историю баланса
+            await db.execute("""
+                INSERT INTO balance_history
+                (amount, description, user_id, transaction_type)
+                VALUES (?, ?, ?, ?)
+            """, (-amount, note, 0, 'expense'))
+
+            new_balance, data_version = await _read_balance_for_cache(db)
+
+            if notify:
+                await OutboxDB.add(db, "payment_confirmed", [payment["marketer_id"]], {
+                    "payment_id": payment_id,
+                    "service_name": payment["service_name"],
+                    "amount": amount,
+                    "project_name": payment["project_name"],
+                }, dedup_key=f"payment_confirmed:{payment_id}")
+                await _add_low_balance_alert(db, new_balance, f"low_balance:payment:{payment_id}")
+            return amount, new_balance, data_version
+
+        pool = await get_pool()
+
+        def _store_balance(result: Optional[tuple]):
+            if result is not None:
+                balance_cache.store(pool, result[1], result[2])
+                if notify:
+                    signal_outbox()
+
+        result = await submit_write(_confirm, on_commit=_store_balance)
+        if result is None:
+            logger.info(f"Заявка ID: {payment_id} не найдена или уже обработана")
+            return None
+
+        amount, new_balance, _ = result
+        if new_balance < 0:
+            logger.warning(f"Баланс ушел в минус после оплаты заявки ID: {payment_id}: {new_balance}$")
+        logger.info(f"Подтверждена оплата заявки ID: {payment_id}, списано {amount}$")
+        return new_balance
+
     @staticmethod
-    async def get_pending_payments() -> List[Dict[str, Any]]:
+    async def get_pending_payments() -> List[Payment]:
         """Получение всех ожидающих платежей"""
-        config = Config()
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute("""
-                SELECT * FROM payments WHERE status = 'pending'
-                ORDER BY created_at DESC
-            """)
-            
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        async with read_connection() as db:
+            return await fetch_all(db, Payment, PENDING_PAYMENTS_SQL)
+
+    @staticmethod
+    async def get_recent_payments(limit: int = 10) -> List[Payment]:
+        """Последние заявки всех маркетологов"""
+        async with read_connection() as db:
+            return await fetch_all(db, Payment, RECENT_PAYMENTS_SQL, (limit,))
+
+    @staticmethod
+    async def get_recent_paid_payments(days: int = 7) -> List[Payment]:
+        """Оплаченные заявки за последние days дней"""
+        async with read_connection() as db:
+            return await fetch_all(db, Payment, RECENT_PAID_PAYMENTS_SQL, (f"-{days} days",))
+
+
+class BalanceCache:
+    """
+    Кэш текущего баланса в памяти процесса
+
+    Обновляется операциями записи этого процесса (add_balance,
+    reset_balance, confirm_payment). Записи других процессов (дашборд,
+    второй воркер бота) обнаруживаются по PRAGMA data_version: если
+    значение изменилось с момента заполнения кэша, баланс перечитывается.
+
+    Коммит на соединении записи этого процесса не меняет его data_version,
+    поэтому читатель, начавший чтение до такого коммита, не может сохранять
+    прочитанное значение по версии данных: он сверяет поколение записей
+    (generation), снятое до чтения.
+    """
+
+    def __init__(self):
+        self.value: Optional[float] = None
+        self.data_version: Optional[int] = None
+        self.pool = None
+        # Увеличивается при каждом сохранении после коммита и сбросе
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pool, data_version: int) -> Optional[float]:
+        """Значение из кэша, если оно актуально"""
+        if self.pool is pool and self.data_version == data_version and self.value is not None:
+            self.hits += 1
+            return self.value
+        self.misses += 1
+        return None
+
+    def store(self, pool, value: float, data_version: int, generation: Optional[int] = None):
+        """
+        Сохранение значения вместе с версией данных, при которой оно прочитано
+
+        Args:
+            generation: Поколение, снятое читателем до чтения; если после него
+                был коммит этого процесса, прочитанное значение устарело и не
+                сохраняется. None - сохранение после коммита записи.
+        """
+        if generation is None:
+            self.generation += 1
+        elif generation != self.generation:
+            return
+        self.pool = pool
+        self.value = value
+        self.data_version = data_version
+
+    def invalidate(self):
+        """Сброс кэша"""
+        self.generation += 1
+        self.value = None
+        self.data_version = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+balance_cache = BalanceCache()
+
+
+async def _read_balance_for_cache(db) -> tuple:
+    """
+    Баланс и data_version на соединении записи внутри открытой транзакции
+
+    Вызывается после изменения баланса и до коммита: пока транзакция держит
+    блокировку записи, другие процессы не могут зафиксировать изменения,
+    поэтому прочитанная версия точно соответствует новому значению.
+    """
+    cursor = await db.execute("SELECT current_balance FROM balance WHERE id = 1")
+    row = await cursor.fetchone()
+    cursor = await db.execute("PRAGMA data_version")
+    version = await cursor.fetchone()
+    return (row[0] if row else 0.0), version[0]
+
+
+async def _balance_cache_updater(notify: bool = False):
+    """
+    Обработчик коммита, сохраняющий в кэш результат _read_balance_for_cache
+
+    Вызывается писателем сразу после коммита пачки и по порядку команд,
+    поэтому в кэше остается баланс последней команды пачки.
+
+    Args:
+        notify: Операция записала уведомления в outbox - разбудить воркер доставки
+    """
+    pool = await get_pool()
+
+    def _store(result: tuple):
+        balance_cache.store(pool, result[0], result[1])
+        if notify:
+            signal_outbox()
+
+    return _store
+
+
+async def _add_low_balance_alert(db, balance: float, dedup_key: str):
+    """
+    Уведомление руководителей о низком балансе внутри операции записи
+
+    Время уведомления обновляется в той же транзакции.
+    """
+    config = Config()
+    if balance >= config.LOW_BALANCE_THRESHOLD:
+        return
+    await OutboxDB.add(db, "low_balance", config.MANAGERS, {
+        "balance": balance,
+        "threshold": config.LOW_BALANCE_THRESHOLD,
+    }, dedup_key=dedup_key)
+    await db.execute("""
+        UPDATE balance SET last_low_balance_alert = CURRENT_TIMESTAMP WHERE id = 1
+    """)
 
 
 class BalanceDB:
@@ -189,28 +521,50 @@ class BalanceDB:
     
     @staticmethod
     async def get_balance() -> float:
-        """Получение текущего баланса"""
-        config = Config()
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        """Получение текущего баланса (из кэша, если баланс не менялся другим процессом)"""
+        pool = await get_pool()
+        generation = balance_cache.generation
+        data_version = await pool.data_version()
+        
+        cached = balance_cache.get(pool, data_version)
+        if cached is not None:
+            return cached
+        
+        async with pool.reader() as db:
             cursor = await db.execute("""
                 SELECT current_balance FROM balance WHERE id = 1
             """)
             
             row = await cursor.fetchone()
-            return row[0] if row else 0.0
+            balance = row[0] if row else 0.0
+        
+        balance_cache.store(pool, balance, data_version, generation)
+        return balance
     
     @staticmethod
-    async def add_balance(amount: float, user_id: int, description: str = ""):
-        """Пополнение баланса"""
-        config = Config()
-        
+    def get_cache_stats() -> Dict[str, Any]:
+        """Статистика кэша баланса"""
+        return balance_cache.stats()
+    
+    @staticmethod
+    async def add_balance(amount: float, user_id: int, description: str = "",
+                          notify: bool = False) -> float:
+        """
+        Пополнение баланса
+
+        Args:
+            notify: Записать в той же транзакции уведомление финансистам (outbox)
+
+        Returns:
+            Новый баланс
+        """
         # Валидация входных данных
         if amount <= 0:
             raise ValueError("Сумма пополнения должна быть больше нуля")
         if user_id <= 0:
             raise ValueError("ID пользователя некорректен")
         
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
+        async def _add(db) -> tuple:
             # Обновляем баланс
             await db.execute("""
                 UPDATE balance 
@@ -220,11 +574,12 @@ class BalanceDB:
             """, (amount,))
             
             # Записываем транзакцию
-            await db.execute("""
+            cursor = await db.execute("""
                 INSERT INTO transactions 
                 (user_id, transaction_type, amount, description)
                 VALUES (?, 'income', ?, ?)
             """, (user_id, amount, description))
+            transaction_id = cursor.lastrowid
             
             # Записываем в историю баланса
             await db.execute("""
@@ -233,97 +588,97 @@ class BalanceDB:
                 VALUES (?, ?, ?, ?)
             """, (amount, description or f"Пополнение баланса", user_id, 'income'))
             
-            await db.commit()
-            logger.info(f"Баланс пополнен на {amount}$")
+            new_balance, data_version = await _read_balance_for_cache(db)
+            
+            if notify:
+                await OutboxDB.add(db, "balance_added", Config().FINANCIERS, {
+                    "amount": amount,
+                    "new_balance": new_balance,
+                    "description": description,
+                }, dedup_key=f"balance_added:{transaction_id}")
+            return new_balance, data_version
+        
+        new_balance, _ = await submit_write(_add, on_commit=await _balance_cache_updater(notify))
+        logger.info(f"Баланс пополнен на {amount}$")
+        return new_balance
     
     @staticmethod
-    async def subtract_balance(amount: float, payment_id: int, description: str = ""):
-        """Списание с баланса"""
-        config = Config()
-        
-        # Валидация входных данных
-        if amount <= 0:
-            raise ValueError("Сумма списания должна быть больше нуля")
-        if payment_id < 0:
-            raise ValueError("ID платежа некорректен")
-        
-        # Проверка достаточности средств
-        current_balance = await BalanceDB.get_balance()
-        if current_balance < amount:
-            logger.warning(f"Недостаточно средств для списания {amount}$. Текущий баланс: {current_balance}$")
-            # Не блокируем операцию, но логируем предупреждение
-        
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            # Обновляем баланс
+    async def reset_balance(user_id: int, username: str = "", notify: bool = False) -> float:
+        """
+        Обнуление баланса одной транзакцией
+
+        Списывает текущий баланс целиком (транзакция с payment_id = 0).
+        Баланс читается внутри транзакции, поэтому параллельные изменения
+        не теряются.
+
+        Args:
+            notify: Записать в той же транзакции уведомление финансистам (outbox)
+
+        Returns:
+            Баланс до обнуления
+        """
+        description = "Обнуление баланса руководителем"
+
+        async def _reset(db) -> tuple:
+            cursor = await db.execute("SELECT current_balance FROM balance WHERE id = 1")
+            row = await cursor.fetchone()
+            old_balance = row[0] if row else 0.0
+            if old_balance == 0:
+                _, data_version = await _read_balance_for_cache(db)
+                return old_balance, data_version
+            
             await db.execute("""
                 UPDATE balance 
-                SET current_balance = current_balance - ?,
+                SET current_balance = 0,
                     last_updated = CURRENT_TIMESTAMP
                 WHERE id = 1
-            """, (amount,))
-            
-            # Записываем транзакцию
-            await db.execute("""
+            """)
+            cursor = await db.execute("""
                 INSERT INTO transactions 
                 (user_id, transaction_type, amount, description, payment_id)
-                VALUES (?, 'expense', ?, ?, ?)
-            """, (0, amount, description, payment_id))
-            
-            # Записываем в историю баланса
+                VALUES (?, 'expense', ?, ?, 0)
+            """, (0, old_balance, description))
+            transaction_id = cursor.lastrowid
             await db.execute("""
                 INSERT INTO balance_history 
                 (amount, description, user_id, transaction_type)
                 VALUES (?, ?, ?, ?)
-            """, (-amount, description or f"Списание с баланса", 0, 'expense'))
+            """, (-old_balance, description, user_id, 'expense'))
             
-            await db.commit()
-            logger.info(f"С баланса списано {amount}$")
-    
-    @staticmethod
-    async def check_low_balance() -> bool:
-        """Проверка на низкий баланс"""
-        config = Config()
-        current_balance = await BalanceDB.get_balance()
-        return current_balance < config.LOW_BALANCE_THRESHOLD
+            _, data_version = await _read_balance_for_cache(db)
+            if notify:
+                await OutboxDB.add(db, "balance_reset", Config().FINANCIERS, {
+                    "old_balance": old_balance,
+                    "username": username or "Unknown",
+                    "reset_at": datetime.now().strftime('%d.%m.%Y %H:%M:%S'),
+                }, dedup_key=f"balance_reset:{transaction_id}")
+            return old_balance, data_version
+        
+        pool = await get_pool()
+        
+        def _store(result: tuple):
+            old_balance, data_version = result
+            balance_cache.store(pool, 0.0, data_version)
+            if notify and old_balance:
+                signal_outbox()
+        
+        old_balance, _ = await submit_write(_reset, on_commit=_store)
+        if old_balance:
+            logger.info(f"Баланс обнулен, списано {old_balance}$")
+        return old_balance
     
     @staticmethod
-    async def update_low_balance_alert():
-        """Обновление времени последнего уведомления о низком балансе"""
-        config = Config()
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            await db.execute("""
-                UPDATE balance 
-                SET last_low_balance_alert = CURRENT_TIMESTAMP
-                WHERE id = 1
-            """)
-            await db.commit()
+    async def get_balance_history(limit: int = 30) -> List[BalanceEvent]:
+        """Последние изменения баланса"""
+        async with read_connection() as db:
+            return await fetch_all(db, BalanceEvent, BALANCE_HISTORY_SQL, (limit,))
     
     @staticmethod
-    async def should_send_low_balance_alert() -> bool:
-        """Проверка, нужно ли отправлять уведомление о низком балансе"""
-        config = Config()
-        
-        if not await BalanceDB.check_low_balance():
-            return False
-        
-        async with aiosqlite.connect(config.DATABASE_PATH) as db:
-            cursor = await db.execute("""
-                SELECT last_low_balance_alert FROM balance WHERE id = 1
-            """)
-            
-            row = await cursor.fetchone()
-            if not row or not row[0]:
-                return True
-            
-            # Проверяем, не отправляли ли уведомление недавно
-            last_alert = datetime.fromisoformat(row[0])
-            current_balance = await BalanceDB.get_balance()
-            
-            # Отправляем уведомление только если баланс стал еще ниже
-            cursor = await db.execute("""
-                SELECT COUNT(*) FROM transactions 
-                WHERE created_at > ? AND transaction_type = 'expense'
-            """, (last_alert.isoformat(),))
-            
-            expense_count = await cursor.fetchone()
-            return expense_count[0] > 0 
\ No newline at end of file
+    async def get_recent_transactions(limit: int = 30) -> List[Transaction]:
+        """Последние операции по балансу"""
+        async with read_connection() as db:
+            return await fetch_all(db, Transaction, f"""
+                SELECT {TRANSACTION_COLUMNS} FROM transactions
+                ORDER BY created_at DESC
+                LIMIT ?
+            """, (limit,))
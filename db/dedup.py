@@ -0,0 +1,127 @@
+"""
+Отсев повторных доставок обновлений Telegram.
+Если обработка webhook длится дольше таймаута Telegram, то же обновление
+приходит снова. Каждый update_id один раз "занимается" в таблице
+processed_updates (миграция 5); повторная доставка получает сразу 200
+без запуска обработчиков, запросов к OpenAI и записи в базу.
+
+Перед таблицей стоит LRU в памяти процесса: повторы, пришедшие в тот же
+экземпляр, отсеиваются без обращения к базе. Записи старше
+UPDATE_DEDUP_TTL_SECONDS удаляются (Telegram не хранит обновления дольше суток).
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Any
+
+from db.writer import submit_write
+
+logger = logging.getLogger(__name__)
+
+
+# Сколько хранить обработанные update_id (секунды)
+UPDATE_DEDUP_TTL_SECONDS = float(os.getenv("UPDATE_DEDUP_TTL_SECONDS", str(24 * 3600)))
+
+# Размер LRU в памяти процесса
+UPDATE_DEDUP_LRU_SIZE = int(os.getenv("UPDATE_DEDUP_LRU_SIZE", "10000"))
+
+# Как часто удалять устаревшие записи таблицы (секунды)
+UPDATE_DEDUP_PURGE_INTERVAL = 3600.0
+
+
+class UpdateDedup:
+    """Хранилище обработанных update_id: LRU в памяти перед таблицей SQLite"""
+
+    def __init__(self, ttl: float = UPDATE_DEDUP_TTL_SECONDS, lru_size: int = UPDATE_DEDUP_LRU_SIZE):
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self._recent: "OrderedDict[int, float]" = OrderedDict()
+        self._last_purge = 0.0
+        self.claimed = 0
+        self.duplicates_memory = 0
+        self.duplicates_db = 0
+        self.purged = 0
+
+    def _remember(self, update_id: int, received_at: float):
+        """Добавление в LRU"""
+        self._recent[update_id] = received_at
+        self._recent.move_to_end(update_id)
+        while len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+
+    async def claim(self, update_id: int) -> bool:
+        """
+        Занять update_id перед обработкой
+
+        Returns:
+            True - обновление новое и его нужно обработать,
+            False - повторная доставка уже принятого обновления
+        """
+        now = time.time()
+        received_at = self._recent.get(update_id)
+        if received_at is not None and now - received_at < self.ttl:
+            self._recent.move_to_end(update_id)
+            self.duplicates_memory += 1
+            return False
+
+        purge = now - self._last_purge >= UPDATE_DEDUP_PURGE_INTERVAL
+        if purge:
+            self._last_purge = now
+
+        async def _claim(db) -> tuple:
+            # Запись старше TTL занимается заново
+            cursor = await db.execute("""
+                INSERT INTO processed_updates (update_id, received_at)
+                VALUES (?, ?)
+                ON CONFLICT (update_id) DO UPDATE SET received_at = excluded.received_at
+                WHERE received_at < ?
+            """, (update_id, now, now - self.ttl))
+            claimed = cursor.rowcount == 1
+
+            purged = 0
+            if purge:
+                cursor = await db.execute(
+                    "DELETE FROM processed_updates WHERE received_at < ?", (now - self.ttl,)
+                )
+                purged = cursor.rowcount
+            return claimed, purged
+
+        claimed, purged = await submit_write(_claim)
+        if purged:
+            self.purged += purged
+            logger.info(f"Удалено устаревших записей об обновлениях: {purged}")
+
+        self._remember(update_id, now)
+        if claimed:
+            self.claimed += 1
+        else:
+            self.duplicates_db += 1
+        return claimed
+
+    async def release(self, update_id: int):
+        """
+        Освободить update_id, если обработка завершилась ошибкой
+
+        Следующая доставка того же обновления будет обработана заново.
+        """
+        self._recent.pop(update_id, None)
+
+        async def _release(db):
+            await db.execute("DELETE FROM processed_updates WHERE update_id = ?", (update_id,))
+
+        await submit_write(_release)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики отсева повторов"""
+        return {
+            "claimed": self.claimed,
+            "duplicates_memory": self.duplicates_memory,
+            "duplicates_db": self.duplicates_db,
+            "purged": self.purged,
+            "lru_size": len(self._recent),
+        }
+
+
+update_dedup = UpdateDedup()
@@ -0,0 +1,296 @@
+"""
+Хранилище состояний FSM aiogram в SQLite.
+MemoryStorage терял состояния пользователей при каждом холодном старте и
+перезапуске, а несколько процессов не видели состояния друг друга. Здесь
+состояние и данные каждого ключа хранятся в таблице fsm_storage (миграция 7)
+со сроком хранения FSM_STATE_TTL_SECONDS.
+
+Перед таблицей стоит кэш процесса с отложенной записью: изменения сначала
+попадают в кэш, а через FSM_FLUSH_INTERVAL_MS записываются в базу одной
+пачкой через db/writer.py (несколько set_state/update_data одного
+обработчика дают одну запись). Serverless-обработчик вызывает flush() до
+ответа Telegram, так как после ответа экземпляр замораживается.
+
+Прочитанные записи считаются актуальными FSM_CACHE_SECONDS секунд. При
+нескольких процессах обновления одного чата должны попадать в один процесс
+(см. порядок обработки в README) либо FSM_CACHE_SECONDS=0 - тогда каждое
+чтение идет в базу.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from db.pool import read_connection
+from db.writer import submit_write
+
+logger = logging.getLogger(__name__)
+
+
+# Срок хранения состояния с последнего изменения (секунды, 0 - без срока)
+FSM_STATE_TTL_SECONDS = float(os.getenv("FSM_STATE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Сколько секунд прочитанная из базы запись считается актуальной
+FSM_CACHE_SECONDS = float(os.getenv("FSM_CACHE_SECONDS", "5"))
+
+# Задержка отложенной записи (мс, 0 - запись сразу при изменении)
+FSM_FLUSH_INTERVAL_MS = float(os.getenv("FSM_FLUSH_INTERVAL_MS", "50"))
+
+# Записей в пачке, после которых запись выполняется без ожидания задержки
+FSM_FLUSH_MAX_BATCH = int(os.getenv("FSM_FLUSH_MAX_BATCH", "256"))
+
+# Записей в кэше процесса (незаписанные изменения не вытесняются)
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+
+# Как часто удалять записи с истекшим сроком (секунды)
+FSM_PURGE_INTERVAL = 3600.0
+
+_EMPTY_DATA = "{}"
+
+
+class _Entry:
+    """Запись кэша: состояние и данные (JSON) одного ключа"""
+
+    __slots__ = ("state", "data", "loaded_at", "dirty")
+
+    def __init__(self, state: Optional[str] = None, data: str = _EMPTY_DATA, loaded_at: float = 0.0):
+        self.state = state
+        self.data = data
+        self.loaded_at = loaded_at
+        self.dirty = False
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в SQLite с кэшем процесса и пакетной отложенной записью"""
+
+    def __init__(self, ttl: float = FSM_STATE_TTL_SECONDS,
+                 cache_seconds: float = FSM_CACHE_SECONDS,
+                 flush_interval_ms: float = FSM_FLUSH_INTERVAL_MS,
+                 max_batch: int = FSM_FLUSH_MAX_BATCH,
+                 cache_size: int = FSM_CACHE_SIZE,
+                 key_builder: Optional[KeyBuilder] = None):
+        if max_batch < 1:
+            raise ValueError("Размер пачки записи должен быть не меньше 1")
+
+        self.ttl = ttl
+        self.cache_seconds = cache_seconds
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.key_builder = key_builder or DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True
+        )
+
+        self._cache: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._last_purge = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.read_errors = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.flush_errors = 0
+        self.purged = 0
+
+    # --- Интерфейс BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = self.key_builder.build(key)
+        entry = await self._load(name)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._mark_dirty(name, entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        entry = await self._load(self.key_builder.build(key))
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Данные FSM должны быть словарем, получено {type(data).__name__}")
+        name = self.key_builder.build(key)
+        entry = await self._load(name)
+        # Сериализация сразу: несериализуемые данные дают ошибку в обработчике, а не при записи
+        entry.data = json.dumps(data, ensure_ascii=False)
+        await self._mark_dirty(name, entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        entry = await self._load(self.key_builder.build(key))
+        return json.loads(entry.data)
+
+    async def close(self) -> None:
+        """Запись накопленных изменений"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+        self._flush_task = None
+        await self.flush()
+
+    # --- Кэш ---
+
+    async def _load(self, name: str) -> _Entry:
+        """Запись из кэша или из базы"""
+        entry = self._cache.get(name)
+        now = time.time()
+        if entry is not None and (entry.dirty or now - entry.loaded_at < self.cache_seconds):
+            self._cache.move_to_end(name)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = _Entry(loaded_at=now)
+        try:
+            async with read_connection() as db:
+                cursor = await db.execute(
+                    "SELECT state, data, expires_at FROM fsm_storage WHERE key = ?", (name,)
+                )
+                row = await cursor.fetchone()
+            if row is not None and (row["expires_at"] is None or row["expires_at"] > now):
+                entry.state = row["state"]
+                entry.data = row["data"]
+        except Exception as e:
+            # Без базы хранилище работает как MemoryStorage
+            self.read_errors += 1
+            logger.error(f"Ошибка чтения состояния FSM {name}: {e}")
+
+        # Пока шло чтение, запись могла измениться в этом процессе
+        current = self._cache.get(name)
+        if current is not None and current.dirty:
+            return current
+
+        self._cache[name] = entry
+        self._cache.move_to_end(name)
+        self._evict()
+        return entry
+
+    def _evict(self):
+        """Вытеснение самых старых записанных записей сверх FSM_CACHE_SIZE"""
+        excess = len(self._cache) - self.cache_size
+        if excess <= 0:
+            return
+        for name in list(self._cache):
+            if excess <= 0:
+                break
+            if not self._cache[name].dirty:
+                del self._cache[name]
+                excess -= 1
+
+    async def _mark_dirty(self, name: str, entry: _Entry):
+        """Постановка изменения в очередь записи"""
+        entry.dirty = True
+        # Параллельное чтение могло заменить запись в кэше
+        self._cache[name] = entry
+        self._dirty.add(name)
+
+        if self.flush_interval <= 0 or len(self._dirty) >= self.max_batch:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        """Запись после задержки FSM_FLUSH_INTERVAL_MS"""
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка отложенной записи состояний FSM: {e}")
+
+    # --- Запись ---
+
+    async def flush(self) -> int:
+        """
+        Запись накопленных изменений одной транзакцией
+
+        Returns:
+            Количество записанных ключей
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._dirty:
+                return 0
+
+            now = time.time()
+            expires_at = now + self.ttl if self.ttl > 0 else None
+            names = list(self._dirty)
+            self._dirty.clear()
+
+            entries = [(name, self._cache[name]) for name in names]
+            upserts, deletes = [], []
+            for name, entry in entries:
+                entry.dirty = False
+                entry.loaded_at = now
+                if entry.state is None and entry.data == _EMPTY_DATA:
+                    deletes.append((name,))
+                else:
+                    upserts.append((name, entry.state, entry.data, now, expires_at))
+
+            purge = self.ttl > 0 and now - self._last_purge >= FSM_PURGE_INTERVAL
+
+            async def _write(db) -> int:
+                if upserts:
+                    await db.executemany("""
+                        INSERT INTO fsm_storage (key, state, data, updated_at, expires_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (key) DO UPDATE SET
+                            state = excluded.state,
+                            data = excluded.data,
+                            updated_at = excluded.updated_at,
+                            expires_at = excluded.expires_at
+                    """, upserts)
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+                if purge:
+                    cursor = await db.execute(
+                        "DELETE FROM fsm_storage WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+                    )
+                    return cursor.rowcount
+                return 0
+
+            try:
+                purged = await submit_write(_write)
+            except Exception as e:
+                # Изменения остаются в кэше и будут записаны следующей пачкой
+                self.flush_errors += 1
+                for name, entry in entries:
+                    current = self._cache.get(name)
+                    if current is None or not current.dirty:
+                        entry.dirty = True
+                        self._cache[name] = entry
+                        self._dirty.add(name)
+                logger.error(f"Ошибка записи состояний FSM ({len(names)} ключей): {e}")
+                raise
+
+            if purge:
+                self._last_purge = now
+            if purged:
+                self.purged += purged
+                logger.info(f"Удалено устаревших состояний FSM: {purged}")
+
+            self.flushes += 1
+            self.rows_flushed += len(names)
+            self._evict()
+            return len(names)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики кэша и записи"""
+        return {
+            "cached": len(self._cache),
+            "dirty": len(self._dirty),
+            "hits": self.hits,
+            "misses": self.misses,
+            "read_errors": self.read_errors,
+            "flushes": self.flushes,
+            "rows_flushed": self.rows_flushed,
+            "flush_errors": self.flush_errors,
+            "purged": self.purged,
+        }
@@ -0,0 +1,85 @@
+"""
+Хранилище кэша ответов OpenAI парсеров (таблица llm_cache, миграция 9).
+Ключ, нормализацию текста и подстановку чисел формирует nlp/parse_cache.py;
+здесь - чтение, запись и ограничение размера таблицы.
+"""
+
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from db.pool import read_connection
+from db.writer import submit_write
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCacheDB:
+    """Операции с таблицей llm_cache"""
+
+    @staticmethod
+    async def get(key: str) -> Optional[Tuple[List[str], Any, float]]:
+        """
+        Непросроченная запись
+
+        Returns:
+            (числа исходного текста, ответ модели, срок хранения) или None
+        """
+        async with read_connection() as db:
+            cursor = await db.execute(
+                "SELECT numbers, result, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            )
+            row = await cursor.fetchone()
+        if row is None:
+            return None
+        return json.loads(row["numbers"]), json.loads(row["result"]), row["expires_at"]
+
+    @staticmethod
+    async def put(key: str, parser: str, template: str, numbers: List[str], result: Any,
+                  ttl: float, max_entries: Optional[int] = None) -> int:
+        """
+        Запись ответа модели
+
+        Args:
+            max_entries: Если передан, удаляются просроченные записи и самые
+                старые сверх этого количества
+
+        Returns:
+            Количество удаленных записей
+        """
+        now = time.time()
+
+        async def _put(db) -> int:
+            await db.execute("""
+                INSERT OR REPLACE INTO llm_cache (key, parser, template, numbers, result, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (key, parser, template, json.dumps(numbers),
+                  json.dumps(result, ensure_ascii=False), now, now + ttl))
+            if max_entries is None:
+                return 0
+
+            cursor = await db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            purged = cursor.rowcount
+            cursor = await db.execute("""
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (max_entries,))
+            return purged + cursor.rowcount
+
+        purged = await submit_write(_put)
+        if purged:
+            logger.info(f"Удалено записей кэша ответов OpenAI: {purged}")
+        return purged
+
+    @staticmethod
+    async def stats() -> Dict[str, Any]:
+        """Количество записей по парсерам"""
+        async with read_connection() as db:
+            cursor = await db.execute(
+                "SELECT parser, COUNT(*) FROM llm_cache WHERE expires_at > ? GROUP BY parser",
+                (time.time(),)
+            )
+            return {row[0]: row[1] for row in await cursor.fetchall()}
@@ -0,0 +1,398 @@
+"""
+Версионированные миграции схемы базы данных.
+Применяет по порядку шаги, которых еще нет в таблице schema_version,
+и проверяет через EXPLAIN QUERY PLAN, что горячие запросы используют индексы.
+
+Запуск проверки: python -m db.migrations
+"""
+
+import asyncio
+import logging
+import sys
+from dataclasses import dataclass
+from typing import List, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Migration:
+    """Шаг миграции схемы"""
+    version: int
+    description: str
+    statements: List[str]
+
+
+# Миграции применяются строго по возрастанию версии.
+# Уже выпущенные шаги не редактируются - изменения схемы добавляются новым шагом.
+MIGRATIONS: List[Migration] = [
+    Migration(
+        version=1,
+        description="Индексы для горячих запросов по платежам, транзакциям и истории баланса",
+        statements=[
+            # Ожидающие/оплаченные платежи по дате; amount делает индекс покрывающим для сумм
+            "CREATE INDEX IF NOT EXISTS idx_payments_status_created "
+            "ON payments (status, created_at, amount)",
+            # Заявки маркетолога, новые сверху
+            "CREATE INDEX IF NOT EXISTS idx_payments_marketer_created "
+            "ON payments (marketer_id, created_at)",
+            # Последние платежи и статистика по дням
+            "CREATE INDEX IF NOT EXISTS idx_payments_created "
+            "ON payments (created_at, amount)",
+            # Статистика по проектам
+            "CREATE INDEX IF NOT EXISTS idx_payments_project "
+            "ON payments (project_name, amount)",
+            # Последние изменения баланса
+            "CREATE INDEX IF NOT EXISTS idx_balance_history_timestamp "
+            "ON balance_history (timestamp)",
+        ],
+    ),
+    Migration(
+        version=2,
+        description="Индексы для постраничного просмотра заявок",
+        statements=[
+            # Заявки маркетолога с фильтром по статусу; rowid в конце индекса
+            # дает порядок (created_at, id) для курсора страницы
+            "CREATE INDEX IF NOT EXISTS idx_payments_marketer_status_created "
+            "ON payments (marketer_id, status, created_at)",
+            # Заявки всех маркетологов по статусу (очередь финансиста) обслуживает
+            # idx_payments_status_created из миграции 1
+        ],
+    ),
+    Migration(
+        version=3,
+        description="Агрегаты платежей по дням, проектам, сервисам и маркетологам",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS payment_rollups (
+                day TEXT NOT NULL,
+                project_name TEXT NOT NULL,
+                service_name TEXT NOT NULL,
+                marketer_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, project_name, service_name, marketer_id, status)
+            )
+            """,
+            # Статистика по проектам за все время без обращения к таблице
+            "CREATE INDEX IF NOT EXISTS idx_payment_rollups_project "
+            "ON payment_rollups (project_name, count, total)",
+            # Заполнение по уже существующим платежам
+            """
+            INSERT INTO payment_rollups
+                (day, project_name, service_name, marketer_id, status, count, total)
+            SELECT DATE(created_at), project_name, service_name, marketer_id,
+                   IFNULL(status, 'unknown'), COUNT(*), SUM(amount)
+            FROM payments
+            GROUP BY DATE(created_at), project_name, service_name, marketer_id,
+                     IFNULL(status, 'unknown')
+            """,
+            # Новая заявка
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_payment_rollups_insert
+            AFTER INSERT ON payments
+            BEGIN
+                INSERT INTO payment_rollups
+                    (day, project_name, service_name, marketer_id, status, count, total)
+                VALUES (DATE(NEW.created_at), NEW.project_name, NEW.service_name,
+                        NEW.marketer_id, IFNULL(NEW.status, 'unknown'), 1, NEW.amount)
+                ON CONFLICT (day, project_name, service_name, marketer_id, status)
+                DO UPDATE SET count = count + 1, total = total + excluded.total;
+            END
+            """,
+            # Смена статуса или других полей ключа: переносим заявку между строками агрегата.
+            # Триггера на DELETE нет намеренно: агрегаты хранят всю историю,
+            # в том числе платежи, перенесенные в архив
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_payment_rollups_update
+            AFTER UPDATE OF status, amount, created_at, project_name, service_name, marketer_id
+            ON payments
+            BEGIN
+                UPDATE payment_rollups
+                SET count = count - 1, total = total - OLD.amount
+                WHERE day = DATE(OLD.created_at) AND project_name = OLD.project_name
+                  AND service_name = OLD.service_name AND marketer_id = OLD.marketer_id
+                  AND status = IFNULL(OLD.status, 'unknown');
+
+                DELETE FROM payment_rollups
+                WHERE day = DATE(OLD.created_at) AND project_name = OLD.project_name
+                  AND service_name = OLD.service_name AND marketer_id = OLD.marketer_id
+                  AND status = IFNULL(OLD.status, 'unknown') AND count <= 0;
+
+                INSERT INTO payment_rollups
+                    (day, project_name, service_name, marketer_id, status, count, total)
+                VALUES (DATE(NEW.created_at), NEW.project_name, NEW.service_name,
+                        NEW.marketer_id, IFNULL(NEW.status, 'unknown'), 1, NEW.amount)
+                ON CONFLICT (day, project_name, service_name, marketer_id, status)
+                DO UPDATE SET count = count + 1, total = total + excluded.total;
+            END
+            """,
+        ],
+    ),
+    Migration(
+        version=4,
+        description="Индекс для отбора старых транзакций при архивировании",
+        statements=[
+            "CREATE INDEX IF NOT EXISTS idx_transactions_created "
+            "ON transactions (created_at)",
+        ],
+    ),
+    Migration(
+        version=5,
+        description="Обработанные обновления Telegram для отсева повторных доставок webhook",
+        statements=[
+            """
+            CREATE TABLE IF NOT EXISTS processed_updates (
+                update_id INTEGER PRIMARY KEY,
+                received_at REAL NOT NULL
+            )
+            """,
+            # Удаление записей старше TTL
+            "CREATE INDEX IF NOT EXISTS idx_processed_updates_received "
+            "ON processed_updates (received_at)",
+        ],
+    ),
+    Migration(
+        version=6,
+        description="Очередь принятых webhook-обновлений (режим быстрого ответа)",
+        statements=[
+            # owner/lease_until: процесс, обрабатывающий обновление, и срок его аренды;
+            # обновления с истекшей арендой забирает другой (или перезапущенный) процесс
+            """
+            CREATE TABLE IF NOT EXISTS webhook_queue (
+                update_id INTEGER PRIMARY KEY,
+                chat_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                owner TEXT NOT NULL,
+                lease_until REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_webhook_queue_lease "
+            "ON webhook_queue (lease_until)",
+            "CREATE INDEX IF NOT EXISTS idx_webhook_queue_owner "
+            "ON webhook_queue (owner)",
+        ],
+    ),
+    Migration(
+        version=7,
+        description="Состояния FSM aiogram (общие для процессов, переживают перезапуск)",
+        statements=[
+            # data - JSON; expires_at NULL - запись без срока хранения
+            """
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL,
+                expires_at REAL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires "
+            "ON fsm_storage (expires_at)",
+        ],
+    ),
+    Migration(
+        version=8,
+        description="Outbox уведомлений: пишется в транзакции изменения данных, доставляется воркером",
+        statements=[
+            # Одна строка на получателя; dedup_key не дает записать уведомление дважды.
+            # status: pending -> sent | failed; owner/lease_until - аренда строки воркером
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dedup_key TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                lease_until REAL NOT NULL DEFAULT 0,
+                finished_at REAL,
+                last_error TEXT
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending "
+            "ON outbox (available_at) WHERE status = 'pending'",
+            "CREATE INDEX IF NOT EXISTS idx_outbox_finished "
+            "ON outbox (finished_at) WHERE status != 'pending'",
+        ],
+    ),
+    Migration(
+        version=9,
+        description="Кэш ответов OpenAI парсеров по нормализованному тексту сообщения",
+        statements=[
+            # key - хэш (парсер, версия промпта, роль, шаблон текста);
+            # numbers - числа исходного текста (JSON), result - ответ модели (JSON)
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                parser TEXT NOT NULL,
+                template TEXT NOT NULL,
+                numbers TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_expires "
+            "ON llm_cache (expires_at)",
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_created "
+            "ON llm_cache (created_at)",
+        ],
+    ),
+]
+
+
+def hot_queries() -> List[Tuple[str, str, tuple]]:
+    """
+    Горячие запросы бота и дашбордов: (название, SQL, пример параметров)
+
+    SQL берется из модулей, которые его выполняют, поэтому проверка планов
+    не расходится с кодом.
+    """
+    from db import database, readonly, rollups
+
+    cursor = ("9999-12-31", 0)
+    return [
+        ("pending_payments", database.PENDING_PAYMENTS_SQL, ()),
+        ("dashboard_pending_payments", readonly.DASHBOARD_PENDING_PAYMENTS_SQL, ()),
+        ("paid_today", readonly.PAID_TODAY_COUNT_SQL, ()),
+        ("weekly_paid", database.RECENT_PAID_PAYMENTS_SQL, ("-7 days",)),
+        ("daily_statistics", rollups.DAILY_STATS_SQL, ("-7 days",)),
+        ("project_statistics", rollups.PROJECT_STATS_SQL, ()),
+        ("paid_totals_since", rollups.PAID_TOTALS_SINCE_SQL, ("1970-01-01",)),
+        ("recent_payments", database.RECENT_PAYMENTS_SQL, (10,)),
+        ("dashboard_recent_payments", readonly.DASHBOARD_RECENT_PAYMENTS_SQL, ()),
+        ("marketer_payments_page", database.payments_page_sql(True, True, True),
+         (0, "pending") + cursor + (5,)),
+        ("marketer_all_payments_page", database.payments_page_sql(True, False, True),
+         (0,) + cursor + (5,)),
+        ("pending_payments_page", database.payments_page_sql(False, True, True),
+         ("pending",) + cursor + (5,)),
+        ("marketer_status_counts", database.MARKETER_STATUS_COUNTS_SQL, (0,)),
+        ("balance_history", database.BALANCE_HISTORY_SQL, (30,)),
+        ("dashboard_balance_history", readonly.DASHBOARD_BALANCE_HISTORY_SQL, ()),
+    ]
+
+
+async def get_schema_version(db) -> int:
+    """Текущая версия схемы"""
+    cursor = await db.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def apply_migrations(db) -> int:
+    """
+    Применение недостающих миграций
+
+    Каждый шаг выполняется в отдельной транзакции BEGIN IMMEDIATE, поэтому
+    одновременный старт нескольких процессов (бот, дашборд) безопасен:
+    второй процесс дождется блокировки и увидит уже обновленную версию.
+
+    Args:
+        db: Соединение aiosqlite для записи
+
+    Returns:
+        Количество примененных шагов
+    """
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    await db.commit()
+
+    applied = 0
+    for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+        if migration.version <= await get_schema_version(db):
+            continue
+
+        await db.execute("BEGIN IMMEDIATE")
+        try:
+            # Повторная проверка под блокировкой записи
+            if migration.version <= await get_schema_version(db):
+                await db.rollback()
+                continue
+
+            for statement in migration.statements:
+                await db.execute(statement)
+            await db.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (migration.version, migration.description)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            logger.error(f"Ошибка применения миграции {migration.version}: {migration.description}")
+            raise
+
+        applied += 1
+        logger.info(f"Применена миграция {migration.version}: {migration.description}")
+
+    return applied
+
+
+def _plan_uses_index(plan_rows: List[str]) -> bool:
+    """Все обращения к таблицам в плане идут через индекс"""
+    for detail in plan_rows:
+        if detail.startswith("SCAN ") and "INDEX" not in detail:
+            return False
+    return True
+
+
+async def check_index_usage(db) -> Dict[str, Dict[str, Any]]:
+    """
+    Проверка планов горячих запросов через EXPLAIN QUERY PLAN
+
+    Returns:
+        Словарь {название запроса: {"uses_index": bool, "plan": [строки плана]}}
+    """
+    report = {}
+    for name, sql, params in hot_queries():
+        cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        rows = await cursor.fetchall()
+        plan = [row[3] for row in rows]
+        report[name] = {"uses_index": _plan_uses_index(plan), "plan": plan}
+    return report
+
+
+async def _main() -> int:
+    """Применение миграций и вывод отчета по индексам"""
+    from db.database import init_database
+    from db.pool import read_connection, close_pool
+
+    await init_database()
+    try:
+        async with read_connection() as db:
+            version = await get_schema_version(db)
+            report = await check_index_usage(db)
+    finally:
+        await close_pool()
+
+    print(f"Версия схемы: {version}")
+    failed = 0
+    for name, result in report.items():
+        mark = "OK  " if result["uses_index"] else "SCAN"
+        print(f"[{mark}] {name}")
+        for detail in result["plan"]:
+            print(f"         {detail}")
+        if not result["uses_index"]:
+            failed += 1
+
+    if failed:
+        print(f"\nЗапросов без индекса: {failed}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main()))
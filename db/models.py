@@ -0,0 +1,157 @@
+"""
+Типизированные записи таблиц базы данных.
+Компактные классы со __slots__ вместо dict(row): строка списка занимает
+меньше памяти, а обращение к несуществующему полю падает сразу
+(AttributeError), а не превращается в KeyError где-то в обработчике.
+
+Репозиторий выбирает колонки явным списком COLUMNS в том же порядке,
+что и аргументы конструктора, поэтому фабрика строк просто передает
+значения позиционно. Соответствие моделей схеме проверяется при старте
+(verify_models).
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class Payment:
+    """Заявка на оплату (таблица payments)"""
+
+    __slots__ = (
+        "id", "marketer_id", "service_name", "amount", "currency", "payment_method",
+        "payment_details", "project_name", "status", "created_at", "updated_at",
+        "file_path", "confirmation_hash", "confirmation_file",
+    )
+    TABLE = "payments"
+    COLUMNS: Tuple[str, ...] = __slots__
+
+    def __init__(self, id: int, marketer_id: int, service_name: str, amount: float,
+                 currency: Optional[str], payment_method: str, payment_details: Optional[str],
+                 project_name: str, status: str, created_at: str, updated_at: Optional[str],
+                 file_path: Optional[str], confirmation_hash: Optional[str],
+                 confirmation_file: Optional[str]):
+        self.id = id
+        self.marketer_id = marketer_id
+        self.service_name = service_name
+        self.amount = amount
+        self.currency = currency
+        self.payment_method = payment_method
+        self.payment_details = payment_details
+        self.project_name = project_name
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.file_path = file_path
+        self.confirmation_hash = confirmation_hash
+        self.confirmation_file = confirmation_file
+
+    @staticmethod
+    def from_row(cursor, row: tuple) -> "Payment":
+        """Фабрика строк для курсора"""
+        return Payment(*row)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь для JSON-ответов"""
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def __repr__(self) -> str:
+        return f"Payment(id={self.id}, amount={self.amount}, status={self.status!r})"
+
+
+class Transaction:
+    """Операция по балансу (таблица transactions)"""
+
+    __slots__ = ("id", "user_id", "transaction_type", "amount", "description",
+                 "created_at", "payment_id")
+    TABLE = "transactions"
+    COLUMNS: Tuple[str, ...] = __slots__
+
+    def __init__(self, id: int, user_id: int, transaction_type: str, amount: float,
+                 description: Optional[str], created_at: str, payment_id: Optional[int]):
+        self.id = id
+        self.user_id = user_id
+        self.transaction_type = transaction_type
+        self.amount = amount
+        self.description = description
+        self.created_at = created_at
+        self.payment_id = payment_id
+
+    @staticmethod
+    def from_row(cursor, row: tuple) -> "Transaction":
+        """Фабрика строк для курсора"""
+        return Transaction(*row)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь для JSON-ответов"""
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def __repr__(self) -> str:
+        return f"Transaction(id={self.id}, type={self.transaction_type!r}, amount={self.amount})"
+
+
+class BalanceEvent:
+    """Изменение баланса (таблица balance_history)"""
+
+    __slots__ = ("id", "amount", "description", "timestamp", "user_id", "transaction_type")
+    TABLE = "balance_history"
+    COLUMNS: Tuple[str, ...] = __slots__
+
+    def __init__(self, id: int, amount: float, description: Optional[str], timestamp: str,
+                 user_id: Optional[int], transaction_type: Optional[str]):
+        self.id = id
+        self.amount = amount
+        self.description = description
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.transaction_type = transaction_type
+
+    @staticmethod
+    def from_row(cursor, row: tuple) -> "BalanceEvent":
+        """Фабрика строк для курсора"""
+        return BalanceEvent(*row)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Словарь для JSON-ответов"""
+        return {name: getattr(self, name) for name in self.COLUMNS}
+
+    def __repr__(self) -> str:
+        return f"BalanceEvent(id={self.id}, amount={self.amount}, timestamp={self.timestamp!r})"
+
+
+MODELS = (Payment, Transaction, BalanceEvent)
+
+
+def select_columns(model) -> str:
+    """Список колонок модели для SELECT"""
+    return ", ".join(model.COLUMNS)
+
+
+async def fetch_all(db, model, sql: str, params=()) -> List[Any]:
+    """Выполнение запроса с построением объектов модели"""
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = model.from_row
+    return await cursor.fetchall()
+
+
+async def fetch_one(db, model, sql: str, params=()) -> Optional[Any]:
+    """Выполнение запроса с построением одного объекта модели"""
+    cursor = await db.execute(sql, params)
+    cursor.row_factory = model.from_row
+    return await cursor.fetchone()
+
+
+async def verify_models(db):
+    """
+    Проверка, что в схеме есть все колонки моделей
+
+    Raises:
+        RuntimeError: Если в таблице не хватает колонок модели
+    """
+    for model in MODELS:
+        cursor = await db.execute(f"PRAGMA table_info({model.TABLE})")
+        existing = {row[1] for row in await cursor.fetchall()}
+        missing = [name for name in model.COLUMNS if name not in existing]
+        if missing:
+            raise RuntimeError(
+                f"Схема таблицы {model.TABLE} не соответствует модели {model.__name__}: "
+                f"нет колонок {', '.join(missing)}"
+            )
@@ -0,0 +1,282 @@
+"""
+Outbox уведомлений (таблица outbox, миграция 8).
+Уведомление записывается в той же транзакции, что и изменение данных
+(создание заявки, подтверждение оплаты, изменение баланса): если процесс
+упадет после фиксации, уведомление не потеряется, а если транзакция
+откатится - не уйдет. Доставляет уведомления воркер utils/outbox.py.
+
+Каждому получателю соответствует отдельная строка с ключом
+"<dedup_key>:<chat_id>": повторная запись того же уведомления
+игнорируется, а доставка одному получателю не повторяется из-за ошибки
+у другого. Доставка - "хотя бы один раз": строка, отправленная, но не
+отмеченная из-за падения процесса, уйдет повторно после истечения аренды.
+
+Сводки (add_digest_item): строки копятся у получателя NOTIFY_DIGEST_WINDOW_SECONDS
+с первой из них или до NOTIFY_DIGEST_MAX_ITEMS штук, затем воркер берет их все
+вместе и отправляет одним сообщением.
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from db.pool import read_connection
+from db.writer import submit_write
+
+logger = logging.getLogger(__name__)
+
+
+# Сколько хранить доставленные и отброшенные уведомления (часы)
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "72"))
+
+# Сводка уведомлений: окно накопления (секунды, 0 - сводки выключены),
+# количество строк, при котором сводка отправляется не дожидаясь окна,
+# и сумма заявки, начиная с которой уведомление отправляется сразу
+NOTIFY_DIGEST_WINDOW_SECONDS = float(os.getenv("NOTIFY_DIGEST_WINDOW_SECONDS", "0"))
+NOTIFY_DIGEST_MAX_ITEMS = int(os.getenv("NOTIFY_DIGEST_MAX_ITEMS", "10"))
+NOTIFY_DIGEST_IMMEDIATE_AMOUNT = float(os.getenv("NOTIFY_DIGEST_IMMEDIATE_AMOUNT", "1000"))
+
+
+# Событие для воркера доставки: новые строки зафиксированы (и его event loop)
+_wakeup: Optional[asyncio.Event] = None
+_wakeup_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_outbox_wakeup() -> asyncio.Event:
+    """Событие пробуждения воркера доставки (для текущего event loop)"""
+    global _wakeup, _wakeup_loop
+    loop = asyncio.get_running_loop()
+    if _wakeup is None or _wakeup_loop is not loop:
+        _wakeup, _wakeup_loop = asyncio.Event(), loop
+    return _wakeup
+
+
+def signal_outbox(_result: Any = None):
+    """
+    Пробуждение воркера доставки
+
+    Передается писателю как on_commit операций, записавших уведомления:
+    воркер берет их сразу после коммита, не дожидаясь опроса.
+    """
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+class OutboxEntry:
+    """Строка outbox, взятая воркером на доставку"""
+
+    __slots__ = ("id", "dedup_key", "kind", "chat_id", "payload", "attempts")
+
+    def __init__(self, id: int, dedup_key: str, kind: str, chat_id: int,
+                 payload: Dict[str, Any], attempts: int):
+        self.id = id
+        self.dedup_key = dedup_key
+        self.kind = kind
+        self.chat_id = chat_id
+        self.payload = payload
+        self.attempts = attempts
+
+    @property
+    def notification_key(self) -> str:
+        """Ключ уведомления без получателя (общий для всех его строк)"""
+        return self.dedup_key.rsplit(":", 1)[0]
+
+    def __repr__(self) -> str:
+        return f"OutboxEntry(id={self.id}, kind={self.kind!r}, chat_id={self.chat_id})"
+
+
+class OutboxDB:
+    """Операции с таблицей outbox"""
+
+    @staticmethod
+    async def add(db, kind: str, recipients: Iterable[int], payload: Dict[str, Any],
+                  dedup_key: str) -> int:
+        """
+        Запись уведомления внутри операции записи (без commit)
+
+        Args:
+            db: Соединение операции db/writer.py
+            kind: Тип уведомления (шаблон в реестре utils/outbox.py)
+            recipients: ID чатов получателей
+            payload: Данные для шаблона (JSON)
+            dedup_key: Ключ уведомления; получатель добавляется к нему
+
+        Returns:
+            Количество записанных строк (повторы не записываются)
+        """
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False)
+        rows = [(f"{dedup_key}:{chat_id}", kind, chat_id, data, now, now)
+                for chat_id in dict.fromkeys(recipients)]
+        if not rows:
+            return 0
+        cursor = await db.executemany("""
+            INSERT OR IGNORE INTO outbox (dedup_key, kind, chat_id, payload, created_at, available_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
+        return cursor.rowcount
+
+    @staticmethod
+    async def add_digest_item(db, kind: str, recipients: Iterable[int], payload: Dict[str, Any],
+                              dedup_key: str, window: float = NOTIFY_DIGEST_WINDOW_SECONDS,
+                              max_items: int = NOTIFY_DIGEST_MAX_ITEMS) -> int:
+        """
+        Запись элемента сводки внутри операции записи (без commit)
+
+        Строка становится доступной через window секунд; если у получателя
+        накопилось max_items строк сводки, все они становятся доступны сразу.
+        Воркер забирает строки сводки получателя вместе (claim с coalesce_kinds).
+
+        Returns:
+            Количество записанных строк
+        """
+        now = time.time()
+        data = json.dumps(payload, ensure_ascii=False)
+        recipients = list(dict.fromkeys(recipients))
+        if not recipients:
+            return 0
+        cursor = await db.executemany("""
+            INSERT OR IGNORE INTO outbox (dedup_key, kind, chat_id, payload, created_at, available_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(f"{dedup_key}:{chat_id}", kind, chat_id, data, now, now + window)
+              for chat_id in recipients])
+        added = cursor.rowcount
+
+        for chat_id in recipients:
+            # Считаются только строки, ожидающие окончания окна
+            cursor = await db.execute("""
+                SELECT COUNT(*) FROM outbox
+                WHERE status = 'pending' AND kind = ? AND chat_id = ? AND available_at > ?
+            """, (kind, chat_id, now))
+            if (await cursor.fetchone())[0] >= max_items:
+                await db.execute("""
+                    UPDATE outbox SET available_at = ?
+                    WHERE status = 'pending' AND kind = ? AND chat_id = ? AND available_at > ?
+                """, (now, kind, chat_id, now))
+        return added
+
+    @staticmethod
+    async def claim(owner: str, limit: int, lease: float,
+                    coalesce_kinds: Iterable[str] = (),
+                    coalesce_limit: int = NOTIFY_DIGEST_MAX_ITEMS) -> List[OutboxEntry]:
+        """
+        Аренда готовых к доставке строк (в порядке записи)
+
+        Args:
+            coalesce_kinds: Типы сводок: вместе с готовой строкой такого типа
+                берутся остальные ожидающие строки того же типа и получателя
+                (не больше coalesce_limit на получателя)
+        """
+        now = time.time()
+        coalesce_kinds = set(coalesce_kinds)
+
+        async def _claim(db) -> list:
+            cursor = await db.execute("""
+                SELECT id, dedup_key, kind, chat_id, payload, attempts
+                FROM outbox
+                WHERE status = 'pending' AND available_at <= ? AND lease_until < ?
+                ORDER BY id
+                LIMIT ?
+            """, (now, now, limit))
+            rows = await cursor.fetchall()
+
+            # Строки сводки, окно которых еще не истекло, уходят вместе с готовой
+            claimed = {row["id"] for row in rows}
+            targets = dict.fromkeys((row["kind"], row["chat_id"]) for row in rows
+                                    if row["kind"] in coalesce_kinds)
+            for kind, chat_id in targets:
+                cursor = await db.execute("""
+                    SELECT id, dedup_key, kind, chat_id, payload, attempts
+                    FROM outbox
+                    WHERE status = 'pending' AND kind = ? AND chat_id = ? AND lease_until < ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (kind, chat_id, now, coalesce_limit))
+                rows.extend(row for row in await cursor.fetchall() if row["id"] not in claimed)
+
+            if rows:
+                await db.executemany("""
+                    UPDATE outbox SET owner = ?, lease_until = ?, attempts = attempts + 1
+                    WHERE id = ?
+                """, [(owner, now + lease, row["id"]) for row in rows])
+            return rows
+
+        rows = await submit_write(_claim)
+        return [OutboxEntry(row["id"], row["dedup_key"], row["kind"], row["chat_id"],
+                            json.loads(row["payload"]), row["attempts"] + 1)
+                for row in rows]
+
+    @staticmethod
+    async def mark_sent(ids: List[int]):
+        """Отметка доставленных строк"""
+        if not ids:
+            return
+        now = time.time()
+
+        async def _mark(db):
+            await db.executemany("""
+                UPDATE outbox SET status = 'sent', finished_at = ?, lease_until = 0, last_error = NULL
+                WHERE id = ?
+            """, [(now, entry_id) for entry_id in ids])
+
+        await submit_write(_mark)
+
+    @staticmethod
+    async def mark_retry(entry_id: int, error: str, delay: float):
+        """Возврат строки в очередь с паузой перед следующей попыткой"""
+        now = time.time()
+
+        async def _mark(db):
+            await db.execute("""
+                UPDATE outbox SET available_at = ?, lease_until = 0, last_error = ?
+                WHERE id = ?
+            """, (now + delay, error[:500], entry_id))
+
+        await submit_write(_mark)
+
+    @staticmethod
+    async def mark_failed(entry_id: int, error: str):
+        """Отказ от доставки строки"""
+        now = time.time()
+
+        async def _mark(db):
+            await db.execute("""
+                UPDATE outbox SET status = 'failed', finished_at = ?, lease_until = 0, last_error = ?
+                WHERE id = ?
+            """, (now, error[:500], entry_id))
+
+        await submit_write(_mark)
+
+    @staticmethod
+    async def purge(retention_hours: float = OUTBOX_RETENTION_HOURS) -> int:
+        """Удаление завершенных строк старше срока хранения"""
+        cutoff = time.time() - retention_hours * 3600
+
+        async def _purge(db) -> int:
+            cursor = await db.execute("""
+                DELETE FROM outbox WHERE status != 'pending' AND finished_at < ?
+            """, (cutoff,))
+            return cursor.rowcount
+
+        purged = await submit_write(_purge)
+        if purged:
+            logger.info(f"Удалено завершенных уведомлений outbox: {purged}")
+        return purged
+
+    @staticmethod
+    async def stats() -> Dict[str, Any]:
+        """Количество строк по статусам и возраст самой старой недоставленной (секунды)"""
+        async with read_connection() as db:
+            cursor = await db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status")
+            counts = {row[0]: row[1] for row in await cursor.fetchall()}
+            cursor = await db.execute("SELECT MIN(created_at) FROM outbox WHERE status = 'pending'")
+            oldest = (await cursor.fetchone())[0]
+        return {
+            "pending": counts.get("pending", 0),
+            "sent": counts.get("sent", 0),
+            "failed": counts.get("failed", 0),
+            "oldest_pending_age_s": round(time.time() - oldest, 1) if oldest is not None else 0.0,
+        }
@@ -0,0 +1,323 @@
+"""
+Пул соединений с базой данных.
+Держит открытыми соединения aiosqlite на всё время работы процесса:
+несколько соединений для чтения и одно соединение для записи.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any
+
+import aiosqlite
+from utils.config import Config
+from db.sqlstats import connection_factory
+
+logger = logging.getLogger(__name__)
+
+
+# Количество соединений для чтения
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+
+# Максимальное время ожидания свободного соединения (секунды)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Соединение, простоявшее дольше этого времени, проверяется перед выдачей (секунды)
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30"))
+
+# Сколько SQLite ждет снятия блокировки, прежде чем вернуть "database is locked" (мс)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+
+class PoolMetrics:
+    """Метрики ожидания соединений пула"""
+
+    def __init__(self):
+        self.acquired = {"reader": 0, "writer": 0}
+        self.wait_total = {"reader": 0.0, "writer": 0.0}
+        self.wait_max = {"reader": 0.0, "writer": 0.0}
+        self.timeouts = 0
+        self.reconnects = 0
+
+    def record_wait(self, kind: str, wait: float):
+        """Учет времени ожидания соединения"""
+        self.acquired[kind] += 1
+        self.wait_total[kind] += wait
+        if wait > self.wait_max[kind]:
+            self.wait_max[kind] = wait
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения метрик (время в миллисекундах)"""
+        result = {"timeouts": self.timeouts, "reconnects": self.reconnects}
+        for kind in ("reader", "writer"):
+            count = self.acquired[kind]
+            result[kind] = {
+                "acquired": count,
+                "wait_avg_ms": round(self.wait_total[kind] / count * 1000, 3) if count else 0.0,
+                "wait_max_ms": round(self.wait_max[kind] * 1000, 3),
+            }
+        return result
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений: N читателей и один писатель"""
+
+    def __init__(self, database_path: str, size: int = DB_POOL_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT):
+        if size < 1:
+            raise ValueError("Размер пула должен быть не меньше 1")
+
+        self.database_path = database_path
+        self.size = size
+        self.timeout = timeout
+        self.metrics = PoolMetrics()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._readers: Optional[asyncio.Queue] = None
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._last_used: Dict[int, float] = {}
+        self._closed = False
+
+    async def open(self):
+        """Открытие всех соединений пула"""
+        self.loop = asyncio.get_running_loop()
+        self._readers = asyncio.Queue(maxsize=self.size)
+        self._writer_lock = asyncio.Lock()
+
+        for _ in range(self.size):
+            self._readers.put_nowait(await self._connect())
+        self._writer = await self._connect()
+
+        logger.info(f"Пул соединений открыт: {self.size} читателей + 1 писатель ({self.database_path})")
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Создание и настройка нового соединения"""
+        db = aiosqlite.connect(self.database_path, factory=connection_factory())
+        # Соединения пула живут столько же, сколько процесс, и не должны
+        # блокировать его завершение, если пул не был закрыт явно
+        db.daemon = True
+        db = await db
+        db.row_factory = aiosqlite.Row
+        await db.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        self._last_used[id(db)] = time.monotonic()
+        return db
+
+    async def _ensure_healthy(self, db: aiosqlite.Connection) -> aiosqlite.Connection:
+        """Проверка соединения, долго простоявшего без работы; при ошибке - переподключение"""
+        last_used = self._last_used.get(id(db), 0.0)
+        if time.monotonic() - last_used < DB_POOL_HEALTHCHECK_INTERVAL:
+            return db
+
+        try:
+            await db.execute("SELECT 1")
+            return db
+        except Exception as e:
+            logger.warning(f"Соединение пула неработоспособно, переподключаемся: {e}")
+            self.metrics.reconnects += 1
+            await self._close_connection(db)
+            return await self._connect()
+
+    async def _close_connection(self, db: aiosqlite.Connection):
+        """Закрытие соединения без выброса исключений"""
+        self._last_used.pop(id(db), None)
+        try:
+            await db.close()
+        except Exception as e:
+            logger.warning(f"Ошибка закрытия соединения пула: {e}")
+
+    @asynccontextmanager
+    async def reader(self):
+        """Соединение для чтения (возвращается в пул после использования)"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+
+        started = time.perf_counter()
+        try:
+            db = await asyncio.wait_for(self._readers.get(), self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_wait("reader", time.perf_counter() - started)
+
+        try:
+            db = await self._ensure_healthy(db)
+        except BaseException:
+            # Возвращаем слот в пул: при следующей выдаче соединение снова будет проверено
+            self._last_used.pop(id(db), None)
+            self._readers.put_nowait(db)
+            raise
+
+        try:
+            yield db
+        finally:
+            self._last_used[id(db)] = time.monotonic()
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Единственное соединение для записи (эксклюзивный доступ)"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._writer_lock.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.record_wait("writer", time.perf_counter() - started)
+
+        try:
+            self._writer = await self._ensure_healthy(self._writer)
+            try:
+                yield self._writer
+            except BaseException:
+                # Не оставляем незавершенную транзакцию следующему писателю
+                try:
+                    await self._writer.rollback()
+                except Exception as e:
+                    logger.warning(f"Ошибка отката транзакции: {e}")
+                raise
+            finally:
+                self._last_used[id(self._writer)] = time.monotonic()
+        finally:
+            self._writer_lock.release()
+
+    async def data_version(self) -> int:
+        """
+        PRAGMA data_version соединения для записи
+
+        Значение меняется только когда изменения зафиксировало другое
+        соединение (дашборд, второй процесс бота), собственные коммиты
+        писателя его не меняют. Запрос не берет блокировку писателя и не
+        читает данные с диска.
+        """
+        cursor = await self._writer.execute("PRAGMA data_version")
+        row = await cursor.fetchone()
+        return row[0]
+
+    async def health_check(self) -> Dict[str, Any]:
+        """Проверка всех свободных соединений пула"""
+        healthy = 0
+        checked = 0
+        idle = []
+        while not self._readers.empty():
+            idle.append(self._readers.get_nowait())
+
+        for db in idle:
+            checked += 1
+            try:
+                await db.execute("SELECT 1")
+                healthy += 1
+            except Exception as e:
+                logger.warning(f"Соединение пула не прошло проверку: {e}")
+                self.metrics.reconnects += 1
+                await self._close_connection(db)
+                db = await self._connect()
+            self._last_used[id(db)] = time.monotonic()
+            self._readers.put_nowait(db)
+
+        return {
+            "readers_checked": checked,
+            "readers_healthy": healthy,
+            "readers_in_use": self.size - checked,
+        }
+
+    async def close(self):
+        """Закрытие всех соединений пула"""
+        if self._closed:
+            return
+        self._closed = True
+
+        while self._readers is not None and not self._readers.empty():
+            await self._close_connection(self._readers.get_nowait())
+        if self._writer is not None:
+            await self._close_connection(self._writer)
+            self._writer = None
+
+        logger.info("Пул соединений закрыт")
+
+
+# Глобальный пул процесса
+_pool: Optional[ConnectionPool] = None
+_pool_lock: Optional[asyncio.Lock] = None
+_pool_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_pool_lock(loop: asyncio.AbstractEventLoop) -> asyncio.Lock:
+    """Блокировка инициализации пула, привязанная к текущему event loop"""
+    global _pool_lock, _pool_lock_loop
+    if _pool_lock is None or _pool_lock_loop is not loop:
+        _pool_lock = asyncio.Lock()
+        _pool_lock_loop = loop
+    return _pool_lock
+
+
+async def get_pool() -> ConnectionPool:
+    """
+    Получение глобального пула соединений (создается при первом обращении)
+
+    Пул привязан к event loop, в котором был создан. Если код запускается
+    в новом loop (serverless-обработчик создает loop на каждый запрос),
+    старый пул закрывается и открывается новый.
+    """
+    global _pool
+    loop = asyncio.get_running_loop()
+
+    if _pool is not None and _pool.loop is loop:
+        return _pool
+
+    async with _get_pool_lock(loop):
+        if _pool is not None and _pool.loop is not loop:
+            logger.info("Event loop сменился, пересоздаем пул соединений")
+            try:
+                await _pool.close()
+            except Exception as e:
+                logger.warning(f"Ошибка закрытия старого пула: {e}")
+            _pool = None
+
+        if _pool is None:
+            config = Config()
+            pool = ConnectionPool(config.DATABASE_PATH)
+            await pool.open()
+            _pool = pool
+
+    return _pool
+
+
+async def close_pool():
+    """Закрытие глобального пула соединений (при остановке бота)"""
+    global _pool
+    # Сначала выполняем записи, оставшиеся в очереди писателя
+    from db.writer import close_writer
+    await close_writer()
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """Метрики ожидания глобального пула"""
+    if _pool is None:
+        return {}
+    return _pool.metrics.snapshot()
+
+
+@asynccontextmanager
+async def read_connection():
+    """Соединение для чтения из глобального пула"""
+    pool = await get_pool()
+    async with pool.reader() as db:
+        yield db
+
+
+@asynccontextmanager
+async def write_connection():
+    """Соединение для записи из глобального пула"""
+    pool = await get_pool()
+    async with pool.writer() as db:
+        yield db
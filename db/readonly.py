@@ -0,0 +1,276 @@
+"""
+Соединения только для чтения для дашбордов.
+Дашборды открывают базу в режиме mode=ro с PRAGMA query_only, поэтому
+никогда не берут блокировку записи. В режиме WAL (включается в init_database)
+читатели и бот не блокируют друг друга.
+
+Нагрузочное сравнение с прежним режимом (журнал отката + обычные соединения):
+    python -m db.readonly --bench [--seconds 5] [--readers 4]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+from db.pool import DB_BUSY_TIMEOUT_MS
+from db.sqlstats import connection_factory
+
+logger = logging.getLogger(__name__)
+
+
+# Объем файла базы, отображаемый в память читателями (байты)
+DB_READ_MMAP_SIZE = int(os.getenv("DB_READ_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+# Размер страничного кэша соединения для чтения (КБ)
+DB_READ_CACHE_KB = int(os.getenv("DB_READ_CACHE_KB", "16384"))
+
+# Запросы дашбордов (api/dashboard.py, dashboard/main.py) и AI-помощника;
+# их планы проверяет python -m db.migrations
+DASHBOARD_PENDING_PAYMENTS_SQL = """
+    SELECT * FROM payments WHERE status = 'pending' ORDER BY created_at DESC
+"""
+
+DASHBOARD_RECENT_PAYMENTS_SQL = """
+    SELECT id, service_name, amount, project_name, payment_method, status, created_at, marketer_id
+    FROM payments
+    ORDER BY created_at DESC
+    LIMIT 50
+"""
+
+DASHBOARD_BALANCE_HISTORY_SQL = """
+    SELECT amount, description, timestamp, user_id
+    FROM balance_history
+    ORDER BY timestamp DESC
+    LIMIT 30
+"""
+
+PAID_TODAY_COUNT_SQL = """
+    SELECT COUNT(*)
+    FROM payments
+    WHERE status = 'paid'
+      AND created_at >= DATE('now') AND created_at < DATE('now', '+1 day')
+"""
+
+
+def connect_readonly(database_path: Optional[str] = None) -> sqlite3.Connection:
+    """
+    Открытие соединения только для чтения
+
+    Args:
+        database_path: Путь к базе (по умолчанию DATABASE_PATH из конфигурации)
+
+    Returns:
+        Соединение sqlite3 с row_factory = sqlite3.Row
+    """
+    if database_path is None:
+        from utils.config import Config
+        database_path = Config().DATABASE_PATH
+
+    uri = f"{Path(database_path).resolve().as_uri()}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           isolation_level=None, factory=connection_factory())
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {DB_READ_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{DB_READ_CACHE_KB}")
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+
+@contextmanager
+def readonly_connection(database_path: Optional[str] = None, snapshot: bool = False):
+    """
+    Соединение только для чтения (закрывается при выходе)
+
+    Args:
+        database_path: Путь к базе (по умолчанию DATABASE_PATH из конфигурации)
+        snapshot: Выполнить все запросы блока в одной транзакции чтения,
+            чтобы они видели один и тот же снимок базы
+    """
+    conn = connect_readonly(database_path)
+    try:
+        if snapshot:
+            conn.execute("BEGIN")
+        yield conn
+    finally:
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+
+
+# --- Нагрузочный тест ---------------------------------------------------------
+
+_BENCH_READ_QUERIES = [
+    DASHBOARD_PENDING_PAYMENTS_SQL,
+    DASHBOARD_RECENT_PAYMENTS_SQL,
+    DASHBOARD_BALANCE_HISTORY_SQL,
+    "SELECT project_name, COUNT(*), SUM(amount) FROM payments GROUP BY project_name",
+]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль в миллисекундах"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def _bench_prepare(path: str, journal_mode: str, payments: int):
+    """Создание тестовой базы"""
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.executescript("""
+        CREATE TABLE payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, marketer_id INTEGER, service_name TEXT,
+            amount REAL, payment_method TEXT, project_name TEXT, status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE balance (id INTEGER PRIMARY KEY, current_balance REAL);
+        CREATE TABLE balance_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, amount REAL, description TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, user_id INTEGER
+        );
+        INSERT INTO balance VALUES (1, 1000000);
+    """)
+    conn.executemany(
+        "INSERT INTO payments (marketer_id, service_name, amount, payment_method, project_name) "
+        "VALUES (?, ?, ?, 'crypto', ?)",
+        [(i % 10, f"service{i % 7}", 10 + i % 100, f"project{i % 12}") for i in range(payments)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _bench_scenario(path: str, readonly: bool, seconds: float, readers: int,
+                    payments: int) -> Dict[str, Any]:
+    """Писатель подтверждает заявки, читатели выполняют запросы дашборда"""
+    stop = threading.Event()
+    write_latency: List[float] = []
+    read_latency: List[float] = []
+    errors = {"writer": 0, "reader": 0}
+    lock = threading.Lock()
+
+    def writer():
+        conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        payment_id = 0
+        while not stop.is_set():
+            payment_id = payment_id % payments + 1
+            started = time.perf_counter()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("UPDATE payments SET status = 'paid' WHERE id = ?", (payment_id,))
+                conn.execute("UPDATE balance SET current_balance = current_balance - 1 WHERE id = 1")
+                conn.execute("INSERT INTO balance_history (amount, description, user_id) "
+                             "VALUES (-1, 'bench', 0)")
+                conn.execute("COMMIT")
+                write_latency.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                with lock:
+                    errors["writer"] += 1
+        conn.close()
+
+    def reader():
+        if readonly:
+            conn = connect_readonly(path)
+        else:
+            conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+        latencies = []
+        index = 0
+        while not stop.is_set():
+            sql = _BENCH_READ_QUERIES[index % len(_BENCH_READ_QUERIES)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                conn.execute(sql).fetchall()
+                latencies.append(time.perf_counter() - started)
+            except sqlite3.OperationalError:
+                with lock:
+                    errors["reader"] += 1
+        conn.close()
+        with lock:
+            read_latency.extend(latencies)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "writes_per_s": len(write_latency) / seconds,
+        "write_p50_ms": _percentile(write_latency, 0.50),
+        "write_p99_ms": _percentile(write_latency, 0.99),
+        "write_max_ms": max(write_latency, default=0.0) * 1000,
+        "reads_per_s": len(read_latency) / seconds,
+        "read_p50_ms": _percentile(read_latency, 0.50),
+        "read_p99_ms": _percentile(read_latency, 0.99),
+        "writer_errors": errors["writer"],
+        "reader_errors": errors["reader"],
+    }
+
+
+def run_benchmark(seconds: float = 5.0, readers: int = 4, payments: int = 20000) -> Dict[str, Dict[str, Any]]:
+    """
+    Сравнение прежнего режима (журнал отката, обычные соединения) и WAL + mode=ro
+
+    Тест работает с временной базой и не трогает рабочую.
+    """
+    scenarios = [
+        ("rollback journal, read-write readers", "delete", False),
+        ("WAL, read-only readers", "wal", True),
+    ]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for index, (name, journal_mode, readonly) in enumerate(scenarios):
+            path = os.path.join(directory, f"bench{index}.db")
+            _bench_prepare(path, journal_mode, payments)
+            results[name] = _bench_scenario(path, readonly, seconds, readers, payments)
+    return results
+
+
+def _main(argv: List[str]) -> int:
+    """Командная строка нагрузочного теста"""
+    parser = argparse.ArgumentParser(prog="python -m db.readonly",
+                                     description="Нагрузочный тест чтения дашборда во время записи бота")
+    parser.add_argument("--bench", action="store_true", help="запустить нагрузочный тест")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--payments", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if not args.bench:
+        parser.print_help()
+        return 2
+
+    results = run_benchmark(args.seconds, args.readers, args.payments)
+    for name, result in results.items():
+        print(f"\n{name}")
+        print(f"  запись: {result['writes_per_s']:.0f}/с, p50 {result['write_p50_ms']:.2f} мс, "
+              f"p99 {result['write_p99_ms']:.2f} мс, max {result['write_max_ms']:.2f} мс, "
+              f"ошибок {result['writer_errors']}")
+        print(f"  чтение: {result['reads_per_s']:.0f}/с, p50 {result['read_p50_ms']:.2f} мс, "
+              f"p99 {result['read_p99_ms']:.2f} мс, ошибок {result['reader_errors']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,225 @@
+"""
+Агрегаты платежей для аналитики.
+Таблица payment_rollups хранит количество и сумму платежей в разрезе
+дня, проекта, сервиса, маркетолога и статуса. Она поддерживается
+триггерами на таблице payments (миграция 3), поэтому статистика дашборда
+и AI-помощника читает O(дней) строк вместо всей таблицы платежей.
+
+Пересборка и сверка с таблицей платежей (включая архивы):
+    python -m db.rollups --rebuild
+    python -m db.rollups --check
+"""
+
+import asyncio
+import logging
+import sys
+from typing import List, Dict, Any, Optional
+
+from db.pool import read_connection, write_connection
+from db.archive import aggregate_archived_payments
+
+logger = logging.getLogger(__name__)
+
+
+# Агрегация таблицы платежей в строки payment_rollups
+_AGGREGATE_PAYMENTS_SQL = """
+    SELECT DATE(created_at) AS day, project_name, service_name, marketer_id,
+           IFNULL(status, 'unknown') AS status, COUNT(*) AS count, SUM(amount) AS total
+    FROM payments
+    GROUP BY DATE(created_at), project_name, service_name, marketer_id,
+             IFNULL(status, 'unknown')
+"""
+
+# Запросы статистики (их планы проверяет python -m db.migrations)
+PROJECT_STATS_SQL = """
+    SELECT project_name, SUM(count) AS count, SUM(total) AS total
+    FROM payment_rollups
+    GROUP BY project_name
+    HAVING SUM(count) > 0
+    ORDER BY total DESC
+"""
+
+DAILY_STATS_SQL = """
+    SELECT day, SUM(count) AS count, SUM(total) AS total
+    FROM payment_rollups
+    WHERE day >= date('now', ?)
+    GROUP BY day
+    HAVING SUM(count) > 0
+    ORDER BY day DESC
+"""
+
+PAID_TOTALS_SINCE_SQL = """
+    SELECT SUM(count) AS count, SUM(total) AS total
+    FROM payment_rollups
+    WHERE day >= ? AND status = 'paid'
+"""
+
+
+class RollupDB:
+    """Чтение агрегатов платежей"""
+
+    @staticmethod
+    async def get_project_stats(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Статистика по проектам за все время
+
+        Returns:
+            Список {"project_name", "count", "total", "avg_amount"}, по убыванию суммы
+        """
+        sql = PROJECT_STATS_SQL
+        params: tuple = ()
+        if limit is not None:
+            sql += " LIMIT ?"
+            params = (limit,)
+
+        async with read_connection() as db:
+            cursor = await db.execute(sql, params)
+            rows = await cursor.fetchall()
+
+        return [
+            {
+                "project_name": row["project_name"],
+                "count": row["count"],
+                "total": row["total"],
+                "avg_amount": row["total"] / row["count"],
+            }
+            for row in rows
+        ]
+
+    @staticmethod
+    async def get_daily_stats(days: int = 7) -> List[Dict[str, Any]]:
+        """
+        Количество и сумма платежей по дням за последние days дней
+
+        Returns:
+            Список {"date", "count", "total"}, новые дни сверху
+        """
+        async with read_connection() as db:
+            cursor = await db.execute(DAILY_STATS_SQL, (f"-{days} days",))
+            rows = await cursor.fetchall()
+
+        return [{"date": row["day"], "count": row["count"], "total": row["total"]} for row in rows]
+
+    @staticmethod
+    async def get_paid_totals_since(since_day: str) -> Dict[str, Any]:
+        """
+        Количество и сумма оплаченных платежей начиная с дня since_day (YYYY-MM-DD)
+
+        Returns:
+            {"count", "total"}
+        """
+        async with read_connection() as db:
+            cursor = await db.execute(PAID_TOTALS_SINCE_SQL, (since_day,))
+            row = await cursor.fetchone()
+
+        return {"count": row["count"] or 0, "total": row["total"] or 0.0}
+
+
+async def rebuild_rollups(db) -> int:
+    """
+    Полная пересборка агрегатов по таблице платежей
+
+    Учитывает и платежи, перенесенные в архивные файлы. Замена агрегатов
+    выполняется в одной транзакции BEGIN IMMEDIATE: читатели видят либо
+    старые, либо новые агрегаты.
+
+    Args:
+        db: Соединение aiosqlite для записи
+
+    Returns:
+        Количество строк агрегатов
+    """
+    archived = await aggregate_archived_payments(db)
+
+    await db.execute("BEGIN IMMEDIATE")
+    try:
+        await db.execute("DELETE FROM payment_rollups")
+        await db.execute(f"""
+            INSERT INTO payment_rollups
+                (day, project_name, service_name, marketer_id, status, count, total)
+            {_AGGREGATE_PAYMENTS_SQL}
+        """)
+        await db.executemany("""
+            INSERT INTO payment_rollups
+                (day, project_name, service_name, marketer_id, status, count, total)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (day, project_name, service_name, marketer_id, status)
+            DO UPDATE SET count = count + excluded.count, total = total + excluded.total
+        """, [key + value for key, value in archived.items()])
+        cursor = await db.execute("SELECT COUNT(*) FROM payment_rollups")
+        row = await cursor.fetchone()
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    logger.info(f"Агрегаты платежей пересобраны: {row[0]} строк")
+    return row[0]
+
+
+async def check_rollups(db) -> List[Dict[str, Any]]:
+    """
+    Сверка агрегатов с таблицей платежей и архивами
+
+    Returns:
+        Расхождения: {"key", "expected": (count, total), "actual": (count, total)}
+    """
+    totals = await aggregate_archived_payments(db)
+    cursor = await db.execute(_AGGREGATE_PAYMENTS_SQL)
+    for row in await cursor.fetchall():
+        key = (row[0], row[1], row[2], row[3], row[4])
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + row[5], total + row[6])
+    expected = {key: (count, round(total, 2)) for key, (count, total) in totals.items()}
+
+    cursor = await db.execute("""
+        SELECT day, project_name, service_name, marketer_id, status, count, total
+        FROM payment_rollups
+        WHERE count > 0
+    """)
+    actual = {
+        (row[0], row[1], row[2], row[3], row[4]): (row[5], round(row[6], 2))
+        for row in await cursor.fetchall()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        if expected.get(key) != actual.get(key):
+            mismatches.append({"key": key, "expected": expected.get(key), "actual": actual.get(key)})
+    return mismatches
+
+
+async def _main(args: List[str]) -> int:
+    """Пересборка или сверка агрегатов из командной строки"""
+    from db.database import init_database
+    from db.pool import close_pool
+
+    if not args or args[0] not in ("--rebuild", "--check"):
+        print("Использование: python -m db.rollups --rebuild | --check")
+        return 2
+
+    await init_database()
+    try:
+        if args[0] == "--rebuild":
+            async with write_connection() as db:
+                rows = await rebuild_rollups(db)
+            print(f"Агрегаты пересобраны: {rows} строк")
+            return 0
+
+        async with read_connection() as db:
+            mismatches = await check_rollups(db)
+    finally:
+        await close_pool()
+
+    for mismatch in mismatches:
+        print(f"{mismatch['key']}: ожидалось {mismatch['expected']}, в агрегатах {mismatch['actual']}")
+    if mismatches:
+        print(f"\nРасхождений: {len(mismatches)}")
+        return 1
+
+    print("Агрегаты совпадают с таблицей платежей")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
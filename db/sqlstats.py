@@ -0,0 +1,360 @@
+"""
+Инструментирование SQL-запросов.
+Соединения пула (aiosqlite) и соединения только для чтения (дашборды)
+создаются с фабрикой InstrumentedConnection, поэтому каждый запрос
+учитывается без изменений в вызывающем коде:
+- гистограмма времени выполнения по нормализованному тексту запроса
+  (литералы заменены на ?, пробелы схлопнуты);
+- количество возвращенных (или измененных) строк;
+- время ожидания блокировок: длительность BEGIN IMMEDIATE/EXCLUSIVE и
+  запросов, завершившихся ошибкой "database is locked";
+- журнал медленных запросов с выводом EXPLAIN QUERY PLAN.
+
+Время запроса SELECT включает выборку строк (fetchone/fetchall).
+Статистика хранится в памяти процесса: бот показывает свою (/dbstats),
+дашборд - свою (/api/dbstats).
+"""
+
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Включение учета запросов
+DB_SQL_STATS = os.getenv("DB_SQL_STATS", "1") == "1"
+
+# Порог медленного запроса (мс)
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+
+# Сколько последних медленных запросов хранить
+DB_SLOW_QUERY_LOG_SIZE = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "50"))
+
+# Максимальное количество различных запросов в статистике (остальные - в "<other>")
+DB_SQL_STATS_MAX_STATEMENTS = 500
+
+# Верхние границы корзин гистограммы (мс)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# Запросы, время которых целиком уходит на ожидание блокировки записи
+_LOCK_STATEMENTS = ("BEGIN IMMEDIATE", "BEGIN EXCLUSIVE")
+
+# Запросы, для которых можно получить план
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """Нормализованный текст запроса: литералы заменены на ?, пробелы схлопнуты"""
+    text = _STRING_RE.sub("?", sql)
+    text = _NUMBER_RE.sub("?", text)
+    text = _SPACE_RE.sub(" ", text).strip().rstrip(";")
+    return _IN_LIST_RE.sub("(?)", text)
+
+
+class StatementStats:
+    """Накопленная статистика одного нормализованного запроса"""
+
+    __slots__ = ("count", "errors", "total", "max", "rows", "lock_wait", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.lock_wait = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, duration: float, rows: int, lock_wait: float, error: bool):
+        """Учет одного выполнения"""
+        self.count += 1
+        self.errors += int(error)
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.rows += rows
+        self.lock_wait += lock_wait
+
+        duration_ms = duration * 1000
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        """Оценка перцентиля по гистограмме (верхняя граница корзины, мс)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(self.count * fraction)))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return float(LATENCY_BUCKETS_MS[index])
+                break
+        return round(self.max * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Значения для отчета (время в миллисекундах)"""
+        histogram = {f"<={bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)}
+        histogram[f">{LATENCY_BUCKETS_MS[-1]}"] = self.buckets[-1]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.50),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max * 1000, 3),
+            "rows": self.rows,
+            "rows_avg": round(self.rows / self.count, 2) if self.count else 0.0,
+            "lock_wait_ms": round(self.lock_wait * 1000, 3),
+            "histogram": histogram,
+        }
+
+
+class SQLStats:
+    """Реестр статистики запросов процесса (потокобезопасный)"""
+
+    def __init__(self, slow_threshold_ms: float = DB_SLOW_QUERY_MS,
+                 slow_log_size: int = DB_SLOW_QUERY_LOG_SIZE):
+        self.slow_threshold = slow_threshold_ms / 1000
+        self.started_at = datetime.now()
+        self._statements: Dict[str, StatementStats] = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, key: str, duration: float, rows: int, lock_wait: float = 0.0,
+               error: bool = False):
+        """Учет выполнения запроса"""
+        with self._lock:
+            stats = self._statements.get(key)
+            if stats is None:
+                if len(self._statements) >= DB_SQL_STATS_MAX_STATEMENTS:
+                    key = "<other>"
+                stats = self._statements.setdefault(key, StatementStats())
+            stats.record(duration, rows, lock_wait, error)
+
+    def add_rows(self, key: str, rows: int, duration: float):
+        """Строки и время, выбранные уже после учета выполнения"""
+        with self._lock:
+            stats = self._statements.get(key) or self._statements.get("<other>")
+            if stats is not None:
+                stats.rows += rows
+                stats.total += duration
+
+    def record_slow(self, key: str, sql: str, duration: float, rows: int,
+                    plan: Optional[List[str]]):
+        """Запись в журнал медленных запросов"""
+        entry = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "sql": key,
+            "duration_ms": round(duration * 1000, 3),
+            "rows": rows,
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        plan_text = "; ".join(plan) if plan else "план не получен"
+        logger.warning(f"Медленный запрос {entry['duration_ms']} мс ({rows} строк): "
+                       f"{sql.strip()[:300]} | {plan_text}")
+
+    def snapshot(self, limit: int = 20, order_by: str = "total_ms") -> Dict[str, Any]:
+        """Отчет: самые дорогие запросы и журнал медленных"""
+        with self._lock:
+            statements = [dict(stats.to_dict(), sql=key) for key, stats in self._statements.items()]
+            slow = list(self._slow)
+
+        statements.sort(key=lambda item: item.get(order_by, 0), reverse=True)
+        return {
+            "since": self.started_at.isoformat(timespec="seconds"),
+            "slow_threshold_ms": round(self.slow_threshold * 1000, 3),
+            "statements_total": len(statements),
+            "queries_total": sum(item["count"] for item in statements),
+            "statements": statements[:limit],
+            "slow_queries": list(reversed(slow)),
+        }
+
+    def reset(self):
+        """Сброс накопленной статистики"""
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+            self.started_at = datetime.now()
+
+
+# Статистика процесса
+sql_stats = SQLStats()
+
+
+def _is_locked_error(error: BaseException) -> bool:
+    """Ошибка из-за занятой блокировки"""
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, учитывающий время выполнения и выбранные строки"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sample = None
+
+    def execute(self, sql, parameters=()):
+        self._finish_sample()
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception as e:
+            self._record_error(sql, time.perf_counter() - started, e)
+            raise
+        self._begin_sample(sql, parameters, time.perf_counter() - started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish_sample()
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except Exception as e:
+            self._record_error(sql, time.perf_counter() - started, e)
+            raise
+        duration = time.perf_counter() - started
+        rows = max(self.rowcount, 0)
+        key = normalize_sql(sql)
+        sql_stats.record(key, duration, rows)
+        if duration >= sql_stats.slow_threshold:
+            sql_stats.record_slow(key, sql, duration, rows, None)
+        return self
+
+    def executescript(self, sql_script):
+        self._finish_sample()
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            sql_stats.record(normalize_sql(sql_script)[:200], time.perf_counter() - started, 0)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._add_fetched(1 if row is not None else 0, time.perf_counter() - started, finished=True)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        limit = self.arraysize if size is None else size
+        self._add_fetched(len(rows), time.perf_counter() - started, finished=len(rows) < limit)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._add_fetched(len(rows), time.perf_counter() - started, finished=True)
+        return rows
+
+    def close(self):
+        self._finish_sample()
+        super().close()
+
+    def __del__(self):
+        # Курсор может освобождаться в другом потоке: план здесь не запрашиваем
+        self._finish_sample(explain=False)
+
+    def _record_error(self, sql: str, duration: float, error: BaseException):
+        """Учет запроса, завершившегося ошибкой"""
+        lock_wait = duration if _is_locked_error(error) else 0.0
+        sql_stats.record(normalize_sql(sql), duration, 0, lock_wait, error=True)
+
+    def _begin_sample(self, sql: str, parameters, duration: float):
+        """Начало учета: запросы без результата учитываются сразу, SELECT - после выборки"""
+        key = normalize_sql(sql)
+        lock_wait = duration if key.upper().startswith(_LOCK_STATEMENTS) else 0.0
+        self._sample = [key, sql, parameters, duration, 0, lock_wait]
+        if self.description is None:
+            self._sample[4] = max(self.rowcount, 0)
+            self._finish_sample()
+
+    def _add_fetched(self, rows: int, duration: float, finished: bool):
+        """Учет выбранных строк"""
+        sample = self._sample
+        if sample is None:
+            # Выборка после завершения учета (например, повторный fetchone)
+            if rows and getattr(self, "_last_key", None):
+                sql_stats.add_rows(self._last_key, rows, duration)
+            return
+        sample[3] += duration
+        sample[4] += rows
+        if finished:
+            self._finish_sample()
+
+    def _finish_sample(self, explain: bool = True):
+        """Завершение учета текущего запроса"""
+        sample = getattr(self, "_sample", None)
+        if sample is None:
+            return
+        self._sample = None
+        key, sql, parameters, duration, rows, lock_wait = sample
+        self._last_key = key
+        sql_stats.record(key, duration, rows, lock_wait)
+
+        if duration >= sql_stats.slow_threshold:
+            plan = self._explain(sql, parameters) if explain else None
+            sql_stats.record_slow(key, sql, duration, rows, plan)
+
+    def _explain(self, sql: str, parameters) -> Optional[List[str]]:
+        """План запроса (EXPLAIN QUERY PLAN) на том же соединении"""
+        if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        try:
+            cursor = sqlite3.Connection.cursor(self.connection, sqlite3.Cursor)
+            try:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+                return [row[3] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.debug(f"Не удалось получить план запроса: {e}")
+            return None
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение sqlite3, создающее инструментированные курсоры"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_factory() -> type:
+    """Класс соединения для sqlite3.connect / aiosqlite.connect (factory=...)"""
+    return InstrumentedConnection if DB_SQL_STATS else sqlite3.Connection
+
+
+def get_sql_stats(limit: int = 20, order_by: str = "total_ms") -> Dict[str, Any]:
+    """Отчет по запросам процесса"""
+    return sql_stats.snapshot(limit, order_by)
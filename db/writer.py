@@ -0,0 +1,280 @@
+"""
+Единственный писатель базы данных с групповым коммитом.
+Операции записи ставятся в очередь; фоновая задача собирает команды,
+пришедшие в течение короткого окна, и выполняет их в одной транзакции
+(один fsync на пачку вместо fsync на каждую операцию). Каждая команда
+выполняется в своей точке сохранения (SAVEPOINT): ошибка одной команды
+откатывает только ее, остальные команды пачки фиксируются.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db.pool import ConnectionPool, get_pool
+
+logger = logging.getLogger(__name__)
+
+
+# Окно сбора пачки после первой команды (миллисекунды, 0 - без ожидания)
+DB_WRITER_WINDOW_MS = float(os.getenv("DB_WRITER_WINDOW_MS", "2"))
+
+# Максимальное количество команд в одной транзакции
+DB_WRITER_MAX_BATCH = int(os.getenv("DB_WRITER_MAX_BATCH", "64"))
+
+# Операция записи: получает соединение внутри открытой транзакции
+WriteOperation = Callable[[Any], Awaitable[Any]]
+
+
+class WriterMetrics:
+    """Метрики пачек и коммитов"""
+
+    # Границы корзин распределения размера пачки
+    BATCH_BUCKETS = ((1, "1"), (4, "2-4"), (16, "5-16"), (None, "17+"))
+
+    def __init__(self):
+        self.batches = 0
+        self.commands = 0
+        self.failed_commands = 0
+        self.failed_batches = 0
+        self.batch_size_max = 0
+        self.batch_sizes = {label: 0 for _, label in self.BATCH_BUCKETS}
+        self.commit_total = 0.0
+        self.commit_max = 0.0
+        self.transaction_total = 0.0
+
+    def record_batch(self, size: int, transaction_time: float, commit_time: float):
+        """Учет выполненной пачки"""
+        self.batches += 1
+        self.commands += size
+        self.batch_size_max = max(self.batch_size_max, size)
+        for limit, label in self.BATCH_BUCKETS:
+            if limit is None or size <= limit:
+                self.batch_sizes[label] += 1
+                break
+        self.transaction_total += transaction_time
+        self.commit_total += commit_time
+        self.commit_max = max(self.commit_max, commit_time)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Текущие значения метрик (время в миллисекундах)"""
+        batches = self.batches
+        return {
+            "batches": batches,
+            "commands": self.commands,
+            "failed_commands": self.failed_commands,
+            "failed_batches": self.failed_batches,
+            "batch_size_avg": round(self.commands / batches, 2) if batches else 0.0,
+            "batch_size_max": self.batch_size_max,
+            "batch_sizes": dict(self.batch_sizes),
+            "commit_avg_ms": round(self.commit_total / batches * 1000, 3) if batches else 0.0,
+            "commit_max_ms": round(self.commit_max * 1000, 3),
+            "transaction_avg_ms": round(self.transaction_total / batches * 1000, 3) if batches else 0.0,
+        }
+
+
+class _WriteCommand:
+    """Команда в очереди писателя"""
+
+    __slots__ = ("operation", "on_commit", "future")
+
+    def __init__(self, operation: WriteOperation, on_commit: Optional[Callable[[Any], None]],
+                 future: asyncio.Future):
+        self.operation = operation
+        self.on_commit = on_commit
+        self.future = future
+
+
+class DBWriter:
+    """Фоновая задача, выполняющая записи пачками через соединение записи пула"""
+
+    def __init__(self, pool: ConnectionPool, window: float = DB_WRITER_WINDOW_MS / 1000,
+                 max_batch: int = DB_WRITER_MAX_BATCH):
+        if max_batch < 1:
+            raise ValueError("Размер пачки должен быть не меньше 1")
+
+        self.pool = pool
+        self.window = window
+        self.max_batch = max_batch
+        self.metrics = WriterMetrics()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self):
+        """Запуск фоновой задачи в текущем event loop"""
+        self.loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = self.loop.create_task(self._run())
+
+    @property
+    def queue_depth(self) -> int:
+        """Команд в очереди"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, operation: WriteOperation,
+                     on_commit: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        Выполнение операции записи в ближайшей пачке
+
+        Args:
+            operation: Корутина, принимающая соединение. Не должна вызывать
+                commit/rollback и сама ставить записи в очередь писателя
+            on_commit: Вызывается с результатом операции сразу после коммита,
+                до обработки следующей пачки (например, для обновления кэша)
+
+        Returns:
+            Результат операции
+        """
+        if self._closing:
+            raise RuntimeError("Писатель базы данных остановлен")
+
+        future = self.loop.create_future()
+        self._queue.put_nowait(_WriteCommand(operation, on_commit, future))
+        return await future
+
+    async def _run(self):
+        """Цикл сбора и выполнения пачек"""
+        while True:
+            command = await self._queue.get()
+            if command is None:
+                return
+
+            batch = [command]
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+
+            stop = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                command = self._queue.get_nowait()
+                if command is None:
+                    stop = True
+                    break
+                batch.append(command)
+
+            await self._execute(batch)
+            if stop:
+                return
+
+    async def _execute(self, batch: List[_WriteCommand]):
+        """Выполнение пачки в одной транзакции"""
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            async with self.pool.writer() as db:
+                await db.execute("BEGIN IMMEDIATE")
+                for command in batch:
+                    await db.execute("SAVEPOINT write_command")
+                    try:
+                        result = await command.operation(db)
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO SAVEPOINT write_command")
+                        await db.execute("RELEASE SAVEPOINT write_command")
+                        outcomes.append((command, None, e))
+                        continue
+                    await db.execute("RELEASE SAVEPOINT write_command")
+                    outcomes.append((command, result, None))
+
+                commit_started = time.perf_counter()
+                await db.commit()
+                commit_time = time.perf_counter() - commit_started
+        except Exception as e:
+            # Транзакция откатывается пулом: ни одна команда пачки не зафиксирована
+            logger.error(f"Ошибка выполнения пачки из {len(batch)} записей: {e}")
+            self.metrics.failed_batches += 1
+            self.metrics.failed_commands += len(batch)
+            for command in batch:
+                if not command.future.done():
+                    command.future.set_exception(e)
+            return
+
+        self.metrics.record_batch(len(batch), time.perf_counter() - started, commit_time)
+
+        for command, result, error in outcomes:
+            if error is not None:
+                self.metrics.failed_commands += 1
+                if not command.future.done():
+                    command.future.set_exception(error)
+                continue
+
+            if command.on_commit is not None:
+                try:
+                    command.on_commit(result)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика после коммита: {e}")
+            if not command.future.done():
+                command.future.set_result(result)
+
+    async def close(self):
+        """Выполнение оставшихся команд и остановка"""
+        if self._closing:
+            return
+        self._closing = True
+
+        if self._task is not None and not self._task.done():
+            self._queue.put_nowait(None)
+            await self._task
+
+
+# Писатель процесса (пересоздается вместе с пулом)
+_writer: Optional[DBWriter] = None
+
+
+async def _retire_writer(writer: DBWriter):
+    """Остановка писателя, замененного новым (сменился пул или event loop)"""
+    try:
+        if writer.loop is asyncio.get_running_loop():
+            await writer.close()
+        elif writer.loop.is_running():
+            # Очередь дорабатывается в loop писателя, ее ждут вызывающие из того же loop
+            asyncio.run_coroutine_threadsafe(writer.close(), writer.loop)
+        elif writer.queue_depth:
+            logger.warning(f"Event loop писателя остановлен, не выполнено записей: {writer.queue_depth}")
+    except Exception as e:
+        logger.warning(f"Ошибка остановки старого писателя: {e}")
+
+
+async def get_writer() -> DBWriter:
+    """Получение писателя для текущего пула соединений"""
+    global _writer
+    pool = await get_pool()
+    writer = _writer
+
+    if writer is None or writer.pool is not pool or writer.loop is not asyncio.get_running_loop():
+        # Новый писатель устанавливается до остановки старого: одновременные
+        # вызовы не создают по писателю каждый
+        old, writer = writer, DBWriter(pool)
+        writer.start()
+        _writer = writer
+        if old is not None:
+            await _retire_writer(old)
+    return writer
+
+
+async def submit_write(operation: WriteOperation,
+                       on_commit: Optional[Callable[[Any], None]] = None) -> Any:
+    """Выполнение операции записи через писателя процесса"""
+    writer = await get_writer()
+    return await writer.submit(operation, on_commit)
+
+
+async def close_writer():
+    """Остановка писателя процесса (оставшиеся команды выполняются)"""
+    global _writer
+    if _writer is not None:
+        writer, _writer = _writer, None
+        if writer.loop is asyncio.get_running_loop():
+            await writer.close()
+
+
+def get_writer_metrics() -> Dict[str, Any]:
+    """Метрики писателя процесса"""
+    if _writer is None:
+        return {}
+    result = _writer.metrics.snapshot()
+    result["queue_depth"] = _writer.queue_depth
+    return result
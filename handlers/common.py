@@ -155,6 +155,7 @@ async def help_handler(message: Message):
             "• /help - эта справка\n"
             "• /balance или /stats - статистика и баланс\n"
             "• /ai - AI-помощник для аналитики\n"
+            "• /dbstats - статистика запросов к базе\n"
             "• /resetbalance - обнуление баланса"
         )
     }
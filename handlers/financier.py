@@ -5,17 +5,22 @@
 
 import re
 from aiogram import Dispatcher, F
-from aiogram.types import Message
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from utils.config import Config
 from utils.logger import log_action
 from db.database import PaymentDB, BalanceDB
 from utils.file_handler import save_file
+from utils.outbox import register_renderer
+from utils.keyboards import build_page_callback, parse_page_callback, get_page_navigation_keyboard
 from handlers.nlp_command_handler import smart_message_router
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Размер страницы в списке ожидающих заявок
+PENDING_PAGE_SIZE = 5
+
 
 async def payment_confirmation_handler(message: Message):
     """Обработчик подтверждения оплаты"""
@@ -58,10 +63,10 @@ async def payment_confirmation_handler(message: Message):
             )
             return
         
-        if payment["status"] != "pending":
+        if payment.status != "pending":
             await message.answer(
                 f"❌ Заявка `{payment_id}` уже обработана.\n"
-                f"Текущий статус: **{payment['status']}**",
+                f"Текущий статус: **{payment.status}**",
                 parse_mode="Markdown"
             )
             return
@@ -87,45 +92,34 @@ async def payment_confirmation_handler(message: Message):
                 logger.error(f"Ошибка сохранения файла подтверждения: {e}")
                 await message.answer("⚠️ Не удалось сохранить прикрепленный файл.")
         
-        # Обновление статуса платежа
-        await PaymentDB.update_payment_status(
+        # Смена статуса и списание с баланса одной транзакцией
+        new_balance = await PaymentDB.confirm_payment(
             payment_id=payment_id,
-            status="paid",
             confirmation_hash=confirmation_hash,
-            confirmation_file=confirmation_file
+            confirmation_file=confirmation_file,
+            description=f"Оплата {payment.service_name} для {payment.project_name}",
+            notify=True
         )
         
-        # Списание с баланса при подтверждении оплаты
-        await BalanceDB.subtract_balance(
-            payment["amount"], 
-            payment_id, 
-            f"Оплата {payment['service_name']} для {payment['project_name']}"
-        )
+        if new_balance is None:
+            # Заявку успели подтвердить параллельно
+            await message.answer(
+                f"❌ Заявка `{payment_id}` уже обработана.",
+                parse_mode="Markdown"
+            )
+            return
         
         # Отправка подтверждения финансисту
         await message.answer(
             f"✅ **Оплата подтверждена!**\n\n"
             f"📋 **ID заявки:** `{payment_id}`\n"
-            f"🛍️ **Сервис:** {payment['service_name']}\n"
-            f"💰 **Сумма:** {payment['amount']}$\n"
-            f"🏷️ **Проект:** {payment['project_name']}\n\n"
+            f"🛍️ **Сервис:** {payment.service_name}\n"
+            f"💰 **Сумма:** {payment.amount}$\n"
+            f"🏷️ **Проект:** {payment.project_name}\n\n"
             f"✅ Маркетолог получил уведомление об оплате.",
             parse_mode="Markdown"
         )
         
-        # Уведомление маркетолога
-        await notify_marketer_payment_confirmed(
-            message.bot, 
-            payment["marketer_id"], 
-            payment_id, 
-            payment
-        )
-        
-        # Проверка низкого баланса после списания
-        if await BalanceDB.should_send_low_balance_alert():
-            await notify_managers_low_balance(message.bot)
-            await BalanceDB.update_low_balance_alert()
-        
     except ValueError:
         await message.answer(
             "❌ Неверный ID заявки. Используйте числовой ID.",
@@ -171,49 +165,115 @@ async def balance_command_handler(message: Message):
         )
 
 
-async def notify_marketer_payment_confirmed(bot, marketer_id: int, payment_id: int, payment: dict):
-    """Уведомление маркетолога о подтверждении оплаты"""
+async def _pending_payments_page(page: int, before_created_at=None, before_id=None):
+    """
+    Текст и клавиатура страницы ожидающих заявок
+
+    Returns:
+        (текст, клавиатура) или (None, None), если заявок на странице нет
+    """
+    # Запрашиваем на одну заявку больше, чтобы понять, есть ли следующая страница
+    payments = await PaymentDB.list_payments(
+        status="pending",
+        before_created_at=before_created_at, before_id=before_id,
+        limit=PENDING_PAGE_SIZE + 1
+    )
+    if not payments:
+        return None, None
+    
+    has_next = len(payments) > PENDING_PAGE_SIZE
+    payments = payments[:PENDING_PAGE_SIZE]
+    
+    message_parts = [f"⏳ **ОЖИДАЮТ ОПЛАТЫ** (стр. {page})\n"]
+    for payment in payments:
+        message_parts.append(
+            f"• ID `{payment.id}`: **{payment.amount}$** - {payment.service_name}\n"
+            f"  📋 {payment.project_name} | 💳 {payment.payment_method}"
+        )
+    message_parts.append("\n💡 Для подтверждения: `оплачено <ID>`")
+    
+    buttons = []
+    if has_next:
+        last = payments[-1]
+        buttons.append((
+            "▶️ Следующая страница",
+            build_page_callback("pendpay", page + 1, last.created_at, last.id)
+        ))
+    
+    return "\n".join(message_parts), get_page_navigation_keyboard(buttons)
+
+
+async def pending_payments_handler(message: Message):
+    """Обработчик команды /pending - очередь ожидающих заявок"""
+    user_id = message.from_user.id
+    config = Config()
+    
+    # Проверка роли
+    if config.get_user_role(user_id) not in ["financier", "manager"]:
+        await message.answer("❌ У вас нет доступа к заявкам.")
+        return
+    
+    log_action(user_id, "pending_payments", "")
+    
+    try:
+        text, keyboard = await _pending_payments_page(1)
+        if text is None:
+            await message.answer("✅ Ожидающих заявок нет.")
+            return
+        
+        await message.answer(text, parse_mode="Markdown", reply_markup=keyboard)
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения ожидающих заявок: {e}")
+        await message.answer("❌ Ошибка при получении заявок. Попробуйте позже.")
+
+
+async def pending_payments_page_callback(callback: CallbackQuery):
+    """Следующая страница ожидающих заявок (кнопка под списком)"""
+    if Config.get_user_role(callback.from_user.id) not in ["financier", "manager"]:
+        return
+    
+    cursor = parse_page_callback("pendpay", callback.data)
+    if not cursor:
+        return
+    
+    page, created_at, payment_id = cursor
     
-    notification_text = (
+    try:
+        text, keyboard = await _pending_payments_page(page, created_at, payment_id)
+        if text is None:
+            await callback.message.edit_text("✅ Больше ожидающих заявок нет.")
+            return
+        
+        await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения страницы ожидающих заявок: {e}")
+        await callback.message.answer("❌ Ошибка при получении заявок. Попробуйте позже.")
+
+
+@register_renderer("payment_confirmed")
+def render_payment_confirmed(payment: dict) -> str:
+    """Уведомление маркетолога о подтверждении оплаты"""
+    return (
         f"✅ **ОПЛАТА ПОДТВЕРЖДЕНА!**\n\n"
-        f"📋 **ID заявки:** `{payment_id}`\n"
+        f"📋 **ID заявки:** `{payment['payment_id']}`\n"
         f"🛍️ **Сервис:** {payment['service_name']}\n"
         f"💰 **Сумма:** {payment['amount']}$\n"
         f"🏷️ **Проект:** {payment['project_name']}\n\n"
         f"✅ Ваша заявка успешно оплачена!"
     )
-    
-    try:
-        await bot.send_message(
-            marketer_id,
-            notification_text,
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        logger.error(f"Не удалось отправить уведомление маркетологу {marketer_id}: {e}")
 
 
-async def notify_managers_low_balance(bot):
+@register_renderer("low_balance")
+def render_low_balance(alert: dict) -> str:
     """Уведомление руководителей о низком балансе"""
-    config = Config()
-    current_balance = await BalanceDB.get_balance()
-    
-    notification_text = (
+    return (
         f"⚠️ **НИЗКИЙ БАЛАНС!**\n\n"
-        f"💰 **Текущий баланс:** {current_balance:.2f}$\n"
-        f"📉 **Порог:** {config.LOW_BALANCE_THRESHOLD}$\n\n"
+        f"💰 **Текущий баланс:** {alert['balance']:.2f}$\n"
+        f"📉 **Порог:** {alert['threshold']}$\n\n"
         f"💳 Необходимо пополнение баланса!"
     )
-    
-    for manager_id in config.MANAGERS:
-        try:
-            await bot.send_message(
-                manager_id,
-                notification_text,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление руководителю {manager_id}: {e}")
 
 
 def setup_financier_handlers(dp: Dispatcher):
@@ -245,4 +305,11 @@ def setup_financier_handlers(dp: Dispatcher):
         balance_command_handler,
         Command("balance"),
         is_financier_or_manager
+    )
+    
+    # Очередь ожидающих заявок
+    dp.message.register(
+        pending_payments_handler,
+        Command("pending"),
+        is_financier_or_manager
     ) 
\ No newline at end of file
@@ -4,7 +4,6 @@
 """
 
 import re
-from datetime import datetime
 from typing import Dict, Any
 from aiogram import Dispatcher, F
 from aiogram.types import Message
@@ -12,9 +11,13 @@ from aiogram.filters import Command
 from utils.config import Config
 from utils.logger import log_action
 from db.database import BalanceDB, PaymentDB
+from db.pool import get_pool_metrics
+from db.writer import get_writer_metrics
+from db.sqlstats import get_sql_stats
+from utils.outbox import register_renderer
 from nlp.universal_ai_parser import UniversalAIParser
 from nlp.manager_ai_assistant import process_manager_query
-from handlers.nlp_command_handler import smart_message_router
+from handlers.nlp_command_handler import route_message
 import logging
 
 logger = logging.getLogger(__name__)
@@ -142,11 +145,8 @@ async def reset_balance_handler(message: Message):
     log_action(user_id, "reset_balance_attempt", message.text)
     
     try:
-        # Получаем текущий баланс для логирования
-        current_balance = await BalanceDB.get_balance()
-        
-        # Обнуляем баланс (устанавливаем в 0)
-        await reset_balance_to_zero()
+        # Обнуляем баланс; уведомление финансистам записывается в той же транзакции
+        current_balance = await reset_balance_to_zero(user_id, message.from_user.username or "Unknown")
         
         # Отправляем подтверждение
         await message.answer(
@@ -157,13 +157,6 @@ async def reset_balance_handler(message: Message):
             f"✅ Операция завершена успешно"
         )
         
-        # Уведомляем финансистов об обнулении
-        await notify_financiers_balance_reset(
-            message.bot,
-            current_balance,
-            message.from_user.username or "Unknown"
-        )
-        
         log_action(user_id, "reset_balance_success", f"Баланс обнулен с {current_balance:.2f}$")
         
     except Exception as e:
@@ -174,49 +167,26 @@ async def reset_balance_handler(message: Message):
         )
 
 
-async def reset_balance_to_zero():
-    """Обнуляет баланс в базе данных"""
-    config = Config()
-    
-    # Получаем текущий баланс
-    current_balance = await BalanceDB.get_balance()
+async def reset_balance_to_zero(user_id: int = 0, username: str = "Unknown") -> float:
+    """
+    Обнуляет баланс в базе данных
     
-    # Если баланс уже 0, ничего не делаем
-    if current_balance == 0:
-        return
-    
-    # Вычисляем сумму для списания
-    amount_to_subtract = current_balance
-    
-    # Списываем весь баланс
-    await BalanceDB.subtract_balance(
-        amount_to_subtract,
-        payment_id=0,  # Специальный ID для обнуления
-        description="Обнуление баланса руководителем"
-    )
+    Returns:
+        Баланс до обнуления
+    """
+    return await BalanceDB.reset_balance(user_id, username, notify=True)
 
 
-async def notify_financiers_balance_reset(bot, old_balance: float, username: str):
+@register_renderer("balance_reset", parse_mode=None)
+def render_balance_reset(reset: dict) -> str:
     """Уведомление финансистов об обнулении баланса"""
-    config = Config()
-    
-    notification_text = (
+    return (
         f"⚠️ БАЛАНС ОБНУЛЕН\n\n"
-        f"📊 Было: {old_balance:.2f}$\n"
+        f"📊 Было: {reset['old_balance']:.2f}$\n"
         f"🔄 Стало: 0.00$\n"
-        f"👤 Выполнил: {username}\n"
-        f"⏰ Время: {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
+        f"👤 Выполнил: {reset['username']}\n"
+        f"⏰ Время: {reset['reset_at']}"
     )
-    
-    for financier_id in config.FINANCIERS:
-        try:
-            await bot.send_message(
-                financier_id,
-                notification_text,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление об обнулении финансисту {financier_id}: {e}")
 
 
 async def add_balance_handler(message: Message):
@@ -229,15 +199,20 @@ async def add_balance_handler(message: Message):
         return
     
     # Сначала проверяем, не является ли это командой
-    if await smart_message_router(message):
+    handled, parsed = await route_message(message)
+    if handled:
         return  # Сообщение обработано как команда
     
     log_action(user_id, "message_processing", message.text)
     
     try:
-        # Используем AI для понимания сообщения
-        ai_parser = UniversalAIParser()
-        parsed_data = await ai_parser.parse_message(message.text, "manager")
+        # Операция быстрого классификатора или единого разбора используется
+        # без повторной классификации и повторного запроса к AI
+        if parsed is not None:
+            parsed_data = parsed["operation"]
+        else:
+            ai_parser = UniversalAIParser()
+            parsed_data = await ai_parser.parse_message(message.text, "manager")
         
         if not parsed_data:
             await handle_unparseable_message(message)
@@ -287,11 +262,8 @@ async def process_balance_add(message: Message, parsed_data: Dict[str, Any]):
         # Получение текущего баланса
         old_balance = await BalanceDB.get_balance()
         
-        # Пополнение баланса
-        await BalanceDB.add_balance(amount, user_id, description)
-        
-        # Получение нового баланса
-        new_balance = await BalanceDB.get_balance()
+        # Пополнение баланса (уведомление финансистам - в той же транзакции)
+        new_balance = await BalanceDB.add_balance(amount, user_id, description, notify=True)
         
         # Формируем детальное описание
         details = []
@@ -318,14 +290,6 @@ async def process_balance_add(message: Message, parsed_data: Dict[str, Any]):
             parse_mode="Markdown"
         )
         
-        # Уведомление финансистов о пополнении
-        await notify_financiers_balance_updated(
-            message.bot, 
-            amount, 
-            new_balance, 
-            description
-        )
-        
         log_action(user_id, "balance_add_success", f"Добавлено {amount}$ - {description}")
         
     except Exception as e:
@@ -434,7 +398,7 @@ async def statistics_handler(message: Message):
         pending_payments = await PaymentDB.get_pending_payments()
         
         # Подсчет сумм ожидающих платежей
-        total_pending = sum(payment["amount"] for payment in pending_payments)
+        total_pending = sum(payment.amount for payment in pending_payments)
         
         status_emoji = "✅" if current_balance >= config.LOW_BALANCE_THRESHOLD else "⚠️"
         
@@ -455,26 +419,15 @@ async def statistics_handler(message: Message):
         )
 
 
-async def notify_financiers_balance_updated(bot, amount: float, new_balance: float, description: str):
-    """Уведомление финансистов об обновлении баланса"""
-    config = Config()
-    
-    notification_text = (
+@register_renderer("balance_added")
+def render_balance_added(update: dict) -> str:
+    """Уведомление финансистов о пополнении баланса"""
+    return (
         f"💰 **БАЛАНС ПОПОЛНЕН**\n\n"
-        f"📈 **Пополнение:** +{amount:.2f}$\n"
-        f"💰 **Новый баланс:** {new_balance:.2f}$\n"
-        f"📝 **Описание:** {description if description else 'Пополнение баланса'}"
+        f"📈 **Пополнение:** +{update['amount']:.2f}$\n"
+        f"💰 **Новый баланс:** {update['new_balance']:.2f}$\n"
+        f"📝 **Описание:** {update['description'] if update['description'] else 'Пополнение баланса'}"
     )
-    
-    for financier_id in config.FINANCIERS:
-        try:
-            await bot.send_message(
-                financier_id,
-                notification_text,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление финансисту {financier_id}: {e}")
 
 
 async def ai_assistant_handler(message: Message):
@@ -569,6 +522,72 @@ async def dashboard_command_handler(message: Message):
     )
 
 
+# Количество запросов и медленных запросов в отчете /dbstats
+DBSTATS_TOP_STATEMENTS = 8
+DBSTATS_SLOW_QUERIES = 3
+
+
+def format_db_stats() -> str:
+    """Текст отчета по запросам к базе данных"""
+    stats = get_sql_stats(DBSTATS_TOP_STATEMENTS)
+    lines = [
+        f"🗄 Статистика SQL с {stats['since'].replace('T', ' ')}",
+        f"Запросов: {stats['queries_total']}, различных: {stats['statements_total']}, "
+        f"порог медленных: {stats['slow_threshold_ms']:.0f} мс",
+        "",
+        "Топ по суммарному времени:",
+    ]
+    for index, item in enumerate(stats["statements"], 1):
+        lines.append(
+            f"{index}. {item['total_ms']:.1f} мс | {item['count']}× | p95 {item['p95_ms']:g} | "
+            f"max {item['max_ms']:.1f} | строк {item['rows']} | блок. {item['lock_wait_ms']:.1f}"
+        )
+        lines.append(f"   {item['sql'][:120]}")
+
+    pool = get_pool_metrics()
+    if pool:
+        lines.append("")
+        lines.append(
+            f"Пул: ожидание читателя {pool['reader']['wait_avg_ms']}/{pool['reader']['wait_max_ms']} мс, "
+            f"писателя {pool['writer']['wait_avg_ms']}/{pool['writer']['wait_max_ms']} мс (сред./макс.), "
+            f"таймаутов {pool['timeouts']}"
+        )
+
+    writer = get_writer_metrics()
+    if writer:
+        lines.append(
+            f"Писатель: пачек {writer['batches']}, команд {writer['commands']}, "
+            f"средняя пачка {writer['batch_size_avg']}, коммит {writer['commit_avg_ms']} мс"
+        )
+
+    slow = stats["slow_queries"][:DBSTATS_SLOW_QUERIES]
+    if slow:
+        lines.append("")
+        lines.append("Последние медленные запросы:")
+        for entry in slow:
+            lines.append(f"• {entry['at'][11:]} {entry['duration_ms']:.1f} мс, строк {entry['rows']}")
+            lines.append(f"   {entry['sql'][:120]}")
+            if entry["plan"]:
+                lines.append(f"   план: {'; '.join(entry['plan'])[:200]}")
+
+    # Ограничение длины сообщения Telegram
+    return "\n".join(lines)[:4000]
+
+
+async def dbstats_command_handler(message: Message):
+    """Обработчик команды /dbstats"""
+    user_id = message.from_user.id
+    config = Config()
+    
+    # Проверка роли
+    if config.get_user_role(user_id) != "manager":
+        await message.answer("❌ У вас нет доступа к этой команде.")
+        return
+    
+    # Без parse_mode: в тексте запросов встречаются * и _
+    await message.answer(format_db_stats())
+
+
 def setup_manager_handlers(dp: Dispatcher):
     """Регистрация обработчиков для руководителей"""
     
@@ -615,4 +634,11 @@ def setup_manager_handlers(dp: Dispatcher):
         dashboard_command_handler,
         Command("dashboard"),
         is_manager
+    )
+    
+    # Команда статистики запросов к базе данных
+    dp.message.register(
+        dbstats_command_handler,
+        Command("dbstats"),
+        is_manager
     ) 
\ No newline at end of file
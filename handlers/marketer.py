@@ -4,14 +4,17 @@
 """
 
 from aiogram import Dispatcher, F
-from aiogram.types import Message, Document, PhotoSize
+from aiogram.types import Message, Document, PhotoSize, CallbackQuery
 from utils.config import Config
 from utils.logger import log_action
 from nlp.parser import PaymentParser
 from nlp.hybrid_parser import HybridPaymentParser
-from handlers.nlp_command_handler import smart_message_router
-from db.database import PaymentDB, BalanceDB
+from handlers.nlp_command_handler import route_message
+from db.database import PaymentDB
+from db.models import Payment
 from utils.file_handler import save_file
+from utils.outbox import register_renderer
+from utils.keyboards import build_page_callback, parse_page_callback, get_page_navigation_keyboard
 import logging
 import re
 
@@ -28,16 +31,18 @@ async def payment_request_handler(message: Message):
         return
     
     # Сначала проверяем, не является ли это командой
-    if await smart_message_router(message):
+    handled, parsed = await route_message(message)
+    if handled:
         return  # Сообщение обработано как команда
     
     log_action(user_id, "payment_request", message.text or message.caption or "")
     
     try:
         # Парсинг сообщения с использованием гибридного подхода
+        # (данные заявки из единого разбора - без повторного запроса к AI)
         parser = HybridPaymentParser()
         message_text = message.text or message.caption or ""
-        payment_data = await parser.parse_payment_message(message_text)
+        payment_data = await parser.parse_payment_message(message_text, unified=parsed)
         
         if not payment_data:
             await message.answer(
@@ -74,7 +79,8 @@ async def payment_request_handler(message: Message):
             payment_method=payment_data["payment_method"],
             payment_details=payment_data["payment_details"],
             project_name=payment_data["project_name"],
-            file_path=file_path
+            file_path=file_path,
+            notify=True
         )
         
         # Отправка подтверждения маркетологу
@@ -91,9 +97,6 @@ async def payment_request_handler(message: Message):
             parse_mode="Markdown"
         )
         
-        # Отправка уведомления финансистам
-        await notify_financiers_about_payment(message.bot, payment_id, payment_data)
-        
     except ValueError as e:
         logger.error(f"Ошибка валидации данных платежа: {e}")
         await message.answer(
@@ -108,54 +111,46 @@ async def payment_request_handler(message: Message):
         )
 
 
-async def notify_financiers_about_payment(bot, payment_id: int, payment_data: dict):
+@register_renderer("payment_created")
+def render_payment_created(payment: dict) -> str:
     """Уведомление финансистов о новой заявке"""
-    config = Config()
-    
-    notification_text = (
+    payment_id = payment["payment_id"]
+    return (
         f"🔔 **НОВАЯ ЗАЯВКА НА ОПЛАТУ**\n\n"
         f"📋 **ID:** `{payment_id}`\n"
-        f"🛍️ **Сервис:** {payment_data['service_name']}\n"
-        f"💰 **Сумма:** {payment_data['amount']}$\n"
-        f"🏷️ **Проект:** {payment_data['project_name']}\n"
-        f"💳 **Способ оплаты:** {payment_data['payment_method']}\n"
-        f"📝 **Детали:** {payment_data['payment_details']}\n\n"
+        f"🛍️ **Сервис:** {payment['service_name']}\n"
+        f"💰 **Сумма:** {payment['amount']}$\n"
+        f"🏷️ **Проект:** {payment['project_name']}\n"
+        f"💳 **Способ оплаты:** {payment['payment_method']}\n"
+        f"📝 **Детали:** {payment['payment_details']}\n\n"
         f"💸 Для подтверждения оплаты отправьте:\n"
         f"`Оплачено {payment_id}` + прикрепите подтверждение"
     )
-    
-    for financier_id in config.FINANCIERS:
-        try:
-            await bot.send_message(
-                financier_id, 
-                notification_text, 
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление финансисту {financier_id}: {e}")
 
 
-async def notify_managers_low_balance(bot):
-    """Уведомление руководителей о низком балансе"""
-    config = Config()
-    current_balance = await BalanceDB.get_balance()
-    
-    notification_text = (
-        f"⚠️ **НИЗКИЙ БАЛАНС!**\n\n"
-        f"💰 **Текущий баланс:** {current_balance:.2f}$\n"
-        f"📉 **Порог:** {config.LOW_BALANCE_THRESHOLD}$\n\n"
-        f"💳 Необходимо пополнение баланса!"
-    )
+# Сколько заявок перечислять в сводке
+DIGEST_LIST_LIMIT = 30
+
+
+@register_renderer("payment_digest", digest=True)
+def render_payment_digest(digest: dict) -> str:
+    """Сводка новых заявок для финансиста"""
+    items = digest["items"]
+    if len(items) == 1:
+        return render_payment_created(items[0])
     
-    for manager_id in config.MANAGERS:
-        try:
-            await bot.send_message(
-                manager_id,
-                notification_text,
-                parse_mode="Markdown"
-            )
-        except Exception as e:
-            logger.error(f"Не удалось отправить уведомление руководителю {manager_id}: {e}")
+    total = sum(item["amount"] for item in items)
+    message_parts = [f"🔔 **НОВЫЕ ЗАЯВКИ НА ОПЛАТУ: {len(items)}**\n"]
+    for item in items[:DIGEST_LIST_LIMIT]:
+        message_parts.append(
+            f"• ID `{item['payment_id']}`: **{item['amount']}$** - "
+            f"{item['service_name']} ({item['project_name']})"
+        )
+    if len(items) > DIGEST_LIST_LIMIT:
+        message_parts.append(f"... и еще {len(items) - DIGEST_LIST_LIMIT}")
+    message_parts.append(f"\n💰 **Итого:** {total:.2f}$")
+    message_parts.append("\n💸 Детали: /pending\nДля подтверждения: `Оплачено <ID>` + прикрепите подтверждение")
+    return "\n".join(message_parts)
 
 
 def setup_marketer_handlers(dp: Dispatcher):
@@ -178,15 +173,43 @@ def setup_marketer_handlers(dp: Dispatcher):
     )
 
 
+# Размер страницы в списке "Мои заявки"
+PAYMENTS_PAGE_SIZE = 5
+
+# Сколько последних оплаченных заявок показывать в сводке
+PAID_PREVIEW_SIZE = 3
+
+# Заголовки страниц списка заявок по статусам
+PAGE_STATUS_TITLES = {
+    "pending": "⏳ **Ожидают подтверждения**",
+    "paid": "✅ **Оплаченные**",
+}
+
+
+def _format_payment_line(payment: Payment, with_details: bool = True) -> str:
+    """Строка заявки в списке"""
+    line = f"• ID {payment.id}: **{payment.amount}$** - {payment.service_name}"
+    if with_details:
+        line += f"\n  📋 {payment.project_name} | 💳 {payment.payment_method}"
+    return line
+
+
+def _next_page_button(status: str, page: int, last_payment: Payment) -> tuple:
+    """Кнопка следующей страницы заявок со статусом status"""
+    return (
+        "⏳ Ещё ожидающие" if status == "pending" else "✅ Ещё оплаченные",
+        build_page_callback(f"mypay:{status}", page, last_payment.created_at, last_payment.id)
+    )
+
+
 async def my_payments_handler(message: Message):
     """Показать заявки маркетолога"""
     try:
-        from db.database import PaymentDB
-        
         marketer_id = message.from_user.id
-        payments = await PaymentDB.get_payments_by_marketer(marketer_id)
+        counts = await PaymentDB.count_payments_by_status(marketer_id)
+        total = sum(counts.values())
         
-        if not payments:
+        if not total:
             await message.answer(
                 "📝 **Ваши заявки**\n\n"
                 "У вас пока нет заявок на оплату.\n\n"
@@ -197,34 +220,35 @@ async def my_payments_handler(message: Message):
             )
             return
             
-        # Группируем по статусам
-        pending = [p for p in payments if p['status'] == 'pending']
-        paid = [p for p in payments if p['status'] == 'paid']
+        # Первые страницы по статусам, остальное - по кнопкам
+        pending = await PaymentDB.list_payments(marketer_id, "pending", limit=PAYMENTS_PAGE_SIZE)
+        paid = await PaymentDB.list_payments(marketer_id, "paid", limit=PAID_PREVIEW_SIZE)
         
         message_parts = ["📝 **Ваши заявки**\n"]
+        buttons = []
         
         if pending:
             message_parts.append("⏳ **Ожидают подтверждения:**")
-            for payment in pending[-5:]:  # Последние 5
-                message_parts.append(
-                    f"• ID {payment['id']}: **{payment['amount']}$** - {payment['service_name']}\n"
-                    f"  📋 {payment['project_name']} | 💳 {payment['payment_method']}"
-                )
+            for payment in pending:
+                message_parts.append(_format_payment_line(payment))
             message_parts.append("")
+            if counts.get("pending", 0) > len(pending):
+                buttons.append(_next_page_button("pending", 2, pending[-1]))
             
         if paid:
             message_parts.append("✅ **Последние оплаченные:**")
-            for payment in paid[-3:]:  # Последние 3
-                message_parts.append(
-                    f"• ID {payment['id']}: **{payment['amount']}$** - {payment['service_name']}"
-                )
+            for payment in paid:
+                message_parts.append(_format_payment_line(payment, with_details=False))
             message_parts.append("")
+            if counts.get("paid", 0) > len(paid):
+                buttons.append(_next_page_button("paid", 2, paid[-1]))
             
-        message_parts.append(f"📊 **Всего заявок:** {len(payments)}")
+        message_parts.append(f"📊 **Всего заявок:** {total}")
         
         await message.answer(
             "\n".join(message_parts),
-            parse_mode="Markdown"
+            parse_mode="Markdown",
+            reply_markup=get_page_navigation_keyboard(buttons)
         )
         
     except Exception as e:
@@ -232,13 +256,57 @@ async def my_payments_handler(message: Message):
         await message.answer("❌ Ошибка при получении заявок. Попробуйте позже.")
 
 
+async def my_payments_page_callback(callback: CallbackQuery):
+    """Следующая страница заявок маркетолога (кнопка под списком)"""
+    if Config.get_user_role(callback.from_user.id) != "marketer":
+        return
+    
+    for status in PAGE_STATUS_TITLES:
+        cursor = parse_page_callback(f"mypay:{status}", callback.data)
+        if cursor:
+            break
+    else:
+        return
+    
+    page, created_at, payment_id = cursor
+    
+    try:
+        # Запрашиваем на одну заявку больше, чтобы понять, есть ли следующая страница
+        payments = await PaymentDB.list_payments(
+            callback.from_user.id, status,
+            before_created_at=created_at, before_id=payment_id,
+            limit=PAYMENTS_PAGE_SIZE + 1
+        )
+        
+        if not payments:
+            await callback.message.edit_text("📝 Больше заявок нет.")
+            return
+        
+        has_next = len(payments) > PAYMENTS_PAGE_SIZE
+        payments = payments[:PAYMENTS_PAGE_SIZE]
+        
+        message_parts = [f"{PAGE_STATUS_TITLES[status]} (стр. {page})\n"]
+        for payment in payments:
+            message_parts.append(_format_payment_line(payment))
+        
+        buttons = [_next_page_button(status, page + 1, payments[-1])] if has_next else []
+        
+        await callback.message.edit_text(
+            "\n".join(message_parts),
+            parse_mode="Markdown",
+            reply_markup=get_page_navigation_keyboard(buttons)
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения страницы заявок маркетолога: {e}")
+        await callback.message.answer("❌ Ошибка при получении заявок. Попробуйте позже.")
+
+
 async def last_payment_handler(message: Message):
     """Показать последнюю заявку маркетолога"""
     try:
-        from db.database import PaymentDB
-        
         marketer_id = message.from_user.id
-        payments = await PaymentDB.get_payments_by_marketer(marketer_id)
+        payments = await PaymentDB.list_payments(marketer_id, limit=1)
         
         if not payments:
             await message.answer(
@@ -259,18 +327,18 @@ async def last_payment_handler(message: Message):
             'pending': '⏳ Ожидает подтверждения',
             'paid': '✅ Оплачена',
             'rejected': '❌ Отклонена'
-        }.get(last_payment['status'], f"❓ {last_payment['status']}")
+        }.get(last_payment.status, f"❓ {last_payment.status}")
         
         # Форматируем дату создания
-        created_date = last_payment['created_at'][:16].replace('T', ' ')
+        created_date = last_payment.created_at[:16].replace('T', ' ')
         
         await message.answer(
             f"📝 **Последняя заявка**\n\n"
-            f"🆔 **ID:** {last_payment['id']}\n"
-            f"💰 **Сумма:** {last_payment['amount']}$\n"
-            f"🛍️ **Сервис:** {last_payment['service_name']}\n"
-            f"📋 **Проект:** {last_payment['project_name']}\n"
-            f"💳 **Способ оплаты:** {last_payment['payment_method']}\n"
+            f"🆔 **ID:** {last_payment.id}\n"
+            f"💰 **Сумма:** {last_payment.amount}$\n"
+            f"🛍️ **Сервис:** {last_payment.service_name}\n"
+            f"📋 **Проект:** {last_payment.project_name}\n"
+            f"💳 **Способ оплаты:** {last_payment.payment_method}\n"
             f"📅 **Создана:** {created_date}\n"
             f"📊 **Статус:** {status_emoji}\n\n"
             f"💡 Для просмотра всех заявок скажите: 'Мои заявки'",
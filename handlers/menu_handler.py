@@ -270,6 +270,14 @@ async def callback_handler(callback: CallbackQuery):
     elif callback_data == "quick_stats":
         from handlers.manager import statistics_handler
         await statistics_handler(callback.message)
+    
+    # Постраничные списки заявок
+    elif callback_data.startswith("mypay:"):
+        from handlers.marketer import my_payments_page_callback
+        await my_payments_page_callback(callback)
+    elif callback_data.startswith("pendpay:"):
+        from handlers.financier import pending_payments_page_callback
+        await pending_payments_page_callback(callback)
     elif callback_data.startswith("quick_"):
         await callback.message.answer(
             f"🚀 **Быстрое действие: {callback_data}**\n\n"
@@ -4,18 +4,25 @@
 """
 
 import logging
+from typing import Any, Dict, Optional, Tuple
 from aiogram.types import Message
 from utils.config import Config
 from utils.logger import log_action
 from nlp.command_parser import CommandNLPParser
+from nlp.fast_classifier import COMMAND_INTENTS, OPERATION_INTENTS, classify_message
+from nlp.unified_parser import NLP_PARSE_MODE, UnifiedMessageParser
 
 logger = logging.getLogger(__name__)
 
 
-async def nlp_command_handler(message: Message):
+async def nlp_command_handler(message: Message, command_data: Optional[Dict[str, Any]] = None):
     """
     Универсальный обработчик команд с NLP
     Распознает команды в естественном языке и перенаправляет к соответствующим обработчикам
+
+    Args:
+        command_data: Уже распознанная команда (из smart_message_router);
+            если не передана, команда распознается через LLM
     """
     user_id = message.from_user.id
     config = Config()
@@ -33,8 +40,9 @@ async def nlp_command_handler(message: Message):
     
     try:
         # Парсинг команды с помощью NLP
-        command_parser = CommandNLPParser()
-        command_data = await command_parser.parse_command(text, user_role)
+        if command_data is None:
+            command_parser = CommandNLPParser()
+            command_data = await command_parser.parse_command(text, user_role)
         
         if not command_data:
             # Не является командой, пропускаем
@@ -84,30 +92,70 @@ async def nlp_command_handler(message: Message):
         # Не отправляем ошибку пользователю, просто логируем
 
 
-async def smart_message_router(message: Message):
+async def route_message(message: Message) -> Tuple[bool, Optional[Dict[str, Any]]]:
     """
-    Умный роутер сообщений
-    Определяет тип сообщения и направляет к соответствующему обработчику
+    Маршрутизация сообщения с единым разбором
+    
+    Команда обрабатывается сразу. В режиме NLP_PARSE_MODE=unified команда и
+    данные операции извлекаются одним запросом к OpenAI, и разбор возвращается
+    вызывающему обработчику, чтобы он не запрашивал модель повторно. Операция,
+    распознанная быстрым классификатором, возвращается в том же формате.
+    
+    Returns:
+        (сообщение обработано как команда,
+         результат UnifiedMessageParser.parse (или операция быстрого
+         классификатора в его формате) или None - обработчик разбирает сам)
     """
     user_id = message.from_user.id
     config = Config()
     user_role = config.get_user_role(user_id)
     
     if user_role == "unknown":
-        return
+        return False, None
     
     text = message.text
     if not text:
-        return
+        return False, None
+    
+    # Однозначные сообщения распознаются локально, без запроса к OpenAI
+    intent = classify_message(text, user_role)
+    if intent is not None:
+        if intent.name in COMMAND_INTENTS:
+            await nlp_command_handler(message, intent.as_command())
+            return True, None
+        # Операцию выполнит вызывающий обработчик: пополнение и обнуление передаются
+        # готовыми, подтверждение оплаты финансист разбирает сам
+        if intent.name in OPERATION_INTENTS:
+            return False, {"command": None, "operation": intent.as_operation(), "payment": None}
+        return False, None
+    
+    if NLP_PARSE_MODE == "unified":
+        parsed = await UnifiedMessageParser().parse(text, user_role)
+        if parsed is not None and parsed["command"] is not None:
+            await nlp_command_handler(message, parsed["command"])
+            return True, None
+        return False, parsed
     
     # Сначала проверяем, является ли это командой
     command_parser = CommandNLPParser()
     command_data = await command_parser.parse_command(text, user_role)
     
     if command_data:
-        # Это команда - обрабатываем через NLP command handler
-        await nlp_command_handler(message)
-        return True  # Сообщение обработано
+        # Это команда - обрабатываем через NLP command handler (без повторного запроса)
+        await nlp_command_handler(message, command_data)
+        return True, None  # Сообщение обработано
+    
+    # Если не команда, другие обработчики могут обработать сообщение
+    return False, None
+
+
+async def smart_message_router(message: Message) -> bool:
+    """
+    Умный роутер сообщений
+    Определяет тип сообщения и направляет к соответствующему обработчику
     
-    # Если не команда, возвращаем False чтобы другие обработчики могли обработать
-    return False
\ No newline at end of file
+    Returns:
+        True, если сообщение обработано как команда
+    """
+    handled, _ = await route_message(message)
+    return handled
@@ -4,7 +4,6 @@ from typing import Optional
 
 from aiogram import Router, F
 from aiogram.types import Message, Voice
-import openai
 
 from utils.config import Config
 import logging
@@ -15,7 +14,6 @@ router = Router()
 class VoiceProcessor:
     def __init__(self):
         self.config = Config()
-        openai.api_key = self.config.OPENAI_API_KEY
         
     async def process_voice_message(self, voice: Voice, bot) -> Optional[str]:
         try:
@@ -26,7 +24,9 @@ class VoiceProcessor:
                 temp_file_path = temp_file.name
             
             with open(temp_file_path, 'rb') as audio_file:
-                transcript = openai.audio.transcriptions.create(
+                # openai импортируется при первом голосовом сообщении
+                from nlp.openai_client import get_openai_module
+                transcript = get_openai_module().audio.transcriptions.create(
                     model="whisper-1",
                     file=audio_file,
                     language="ru"
@@ -86,7 +86,8 @@ class VoiceProcessor:
                 amount=amount,
                 payment_method=payment_method,
                 payment_details=payment_details or "",
-                project_name=project
+                project_name=project,
+                notify=True
             )
             
             # Отправка подтверждения маркетологу
@@ -102,20 +103,6 @@ class VoiceProcessor:
                 parse_mode="Markdown"
             )
             
-            # Уведомление финансистов
-            from handlers.marketer import notify_financiers_about_payment
-            await notify_financiers_about_payment(
-                message.bot, 
-                payment_id, 
-                {
-                    'amount': amount,
-                    'service_name': platform,
-                    'project_name': project,
-                    'payment_method': payment_method,
-                    'payment_details': payment_details or ""
-                }
-            )
-            
         except Exception as e:
             logger.error(f"Ошибка создания голосовой заявки: {e}")
             await message.answer("❌ Произошла ошибка при создании заявки. Попробуйте еще раз.")
@@ -144,17 +131,17 @@ class VoiceProcessor:
                 )
                 return
             
-            if payment["status"] != "pending":
+            if payment.status != "pending":
                 await message.answer(
                     f"❌ Заявка `{payment_id}` уже обработана.\n"
-                    f"Текущий статус: **{payment['status']}**",
+                    f"Текущий статус: **{payment.status}**",
                     parse_mode="Markdown"
                 )
                 return
             
             # Списание средств с баланса
             current_balance = await BalanceDB.get_balance()
-            payment_amount = float(payment["amount"])
+            payment_amount = float(payment.amount)
             
             if current_balance < payment_amount:
                 await message.answer(
@@ -166,45 +153,33 @@ class VoiceProcessor:
                 )
                 return
             
-            # Обновление статуса заявки
-            await PaymentDB.update_payment_status(payment_id, "paid")
-            
-            # Списание с баланса
-            new_balance = current_balance - payment_amount
-            await BalanceDB.subtract_balance(
-                payment_amount,
+            # Смена статуса и списание с баланса одной транзакцией
+            new_balance = await PaymentDB.confirm_payment(
                 payment_id,
-                f"Оплата заявки #{payment_id} ({payment['platform']} - {payment['project']})"
+                description=f"Оплата заявки #{payment_id} ({payment.service_name} - {payment.project_name})",
+                notify=True
             )
             
+            if new_balance is None:
+                await message.answer(
+                    f"❌ Заявка `{payment_id}` уже обработана.",
+                    parse_mode="Markdown"
+                )
+                return
+            
             # Подтверждение финансисту
             await message.answer(
                 f"✅ **Оплата подтверждена!**\n\n"
                 f"🆔 ID заявки: **{payment_id}**\n"
                 f"💰 Сумма: **{payment_amount:.2f}$**\n"
-                f"📱 Платформа: **{payment['platform']}**\n"
-                f"📋 Проект: **{payment['project']}**\n"
-                f"💳 Способ: **{payment['payment_method']}**\n\n"
+                f"🛍️ Сервис: **{payment.service_name}**\n"
+                f"📋 Проект: **{payment.project_name}**\n"
+                f"💳 Способ: **{payment.payment_method}**\n\n"
                 f"💰 Баланс: **{current_balance:.2f}$** → **{new_balance:.2f}$**\n"
                 f"📤 Маркетологу отправлено уведомление.",
                 parse_mode="Markdown"
             )
             
-            # Уведомление маркетолога
-            from handlers.financier import notify_marketer_payment_confirmed
-            await notify_marketer_payment_confirmed(
-                message.bot,
-                payment["user_id"],
-                payment_id,
-                payment
-            )
-            
-            # Проверка низкого баланса
-            config = Config()
-            if new_balance < config.LOW_BALANCE_THRESHOLD:
-                from handlers.financier import notify_managers_low_balance
-                await notify_managers_low_balance(message.bot)
-            
         except Exception as e:
             logger.error(f"Ошибка подтверждения голосовой оплаты: {e}")
             await message.answer("❌ Произошла ошибка при подтверждении оплаты. Попробуйте еще раз.")
@@ -6,7 +6,8 @@ NLP парсер для операций с балансом руководит
 import json
 import logging
 from typing import Optional, Dict, Any
-from openai import AsyncOpenAI
+from nlp.openai_client import get_openai_client
+from nlp.parse_cache import parse_cache
 from utils.config import Config
 
 logger = logging.getLogger(__name__)
@@ -17,7 +18,7 @@ class BalanceNLPParser:
     
     def __init__(self):
         self.config = Config()
-        self.client = AsyncOpenAI(api_key=self.config.OPENAI_API_KEY)
+        self.client = get_openai_client()
         
         # Системный промпт для GPT-4
         self.system_prompt = """
@@ -61,7 +62,7 @@ class BalanceNLPParser:
         text = text.strip()
         logger.info(f"NLP парсинг баланса: {text}")
         
-        try:
+        async def _request():
             # Отправка запроса к OpenAI
             response = await self.client.chat.completions.create(
                 model="gpt-4o-mini",
@@ -76,10 +77,12 @@ class BalanceNLPParser:
             # Получение ответа
             content = response.choices[0].message.content.strip()
             logger.info(f"OpenAI ответ для баланса: {content}")
-            
-            # Парсинг JSON ответа
+            return json.loads(content)
+        
+        try:
+            # Повторяющиеся фразы берутся из кэша ответов
             try:
-                balance_data = json.loads(content)
+                balance_data = await parse_cache.fetch("balance", self.system_prompt, "manager", text, _request)
             except json.JSONDecodeError as e:
                 logger.error(f"Ошибка парсинга JSON ответа баланса: {e}")
                 return None
@@ -6,7 +6,8 @@
 import json
 import logging
 from typing import Optional, Dict, Any
-from openai import AsyncOpenAI
+from nlp.openai_client import get_openai_client
+from nlp.parse_cache import parse_cache
 from utils.config import Config
 
 logger = logging.getLogger(__name__)
@@ -17,7 +18,7 @@ class CommandNLPParser:
     
     def __init__(self):
         self.config = Config()
-        self.client = AsyncOpenAI(api_key=self.config.OPENAI_API_KEY)
+        self.client = get_openai_client()
         
         # Системный промпт для GPT-4
         self.system_prompt = """
@@ -70,7 +71,7 @@ Confidence - это уверенность в распознавании (1.0 =
         text = text.strip()
         logger.info(f"NLP парсинг команды: {text}")
         
-        try:
+        async def _request():
             # Отправка запроса к OpenAI
             response = await self.client.chat.completions.create(
                 model="gpt-4o-mini",
@@ -85,10 +86,12 @@ Confidence - это уверенность в распознавании (1.0 =
             # Получение ответа
             content = response.choices[0].message.content.strip()
             logger.info(f"OpenAI ответ для команды: {content}")
-            
-            # Парсинг JSON ответа
+            return json.loads(content)
+        
+        try:
+            # Повторяющиеся фразы берутся из кэша ответов
             try:
-                command_data = json.loads(content)
+                command_data = await parse_cache.fetch("command", self.system_prompt, user_role, text, _request)
             except json.JSONDecodeError as e:
                 logger.error(f"Ошибка парсинга JSON команды: {e}")
                 return None
@@ -0,0 +1,224 @@
+"""
+Быстрый локальный классификатор намерений.
+Стоит перед LLM-роутером (handlers/nlp_command_handler.py): короткие
+однозначные сообщения ("баланс", "помощь", "Оплачено 12", "пополни на 500")
+распознаются скомпилированными регулярными выражениями без запроса к OpenAI.
+Правило срабатывает только для ролей, которым доступно намерение, и только
+если его уверенность не ниже FAST_CLASSIFIER_MIN_CONFIDENCE; остальные
+сообщения уходят в LLM как раньше.
+"""
+
+import os
+import re
+import time
+import logging
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern
+
+logger = logging.getLogger(__name__)
+
+
+# Включение быстрого классификатора
+FAST_CLASSIFIER_ENABLED = os.getenv("FAST_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Минимальная уверенность правила, при которой LLM не вызывается
+FAST_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("FAST_CLASSIFIER_MIN_CONFIDENCE", "0.9"))
+
+# Намерения-команды (обрабатываются nlp_command_handler)
+COMMAND_INTENTS = frozenset({"start", "help", "balance", "stats"})
+
+# Операции руководителя в формате UniversalAIParser (Intent.as_operation)
+OPERATION_INTENTS = frozenset({"balance_add", "balance_reset"})
+
+ALL_ROLES = frozenset({"marketer", "financier", "manager"})
+
+# Сумма: 500, 500.50, 1 000, 1,5к. Пробел допускается только как разделитель
+# групп по три цифры: "100 50$" - два числа, такое сообщение разбирает LLM
+_AMOUNT = r"(?P<amount>(?:\d{1,3}(?: \d{3})+|\d+)(?:[.,]\d+)?)\s*(?P<unit>к|k|тыс)?"
+_CURRENCY = r"(?:\$|usd|долларов|доллара|доллар|баксов|бакса|бакс)?"
+
+
+class Intent:
+    """Результат классификации"""
+
+    __slots__ = ("name", "confidence", "data", "rule")
+
+    def __init__(self, name: str, confidence: float, data: Dict[str, Any], rule: str):
+        self.name = name
+        self.confidence = confidence
+        self.data = data
+        self.rule = rule
+
+    def as_command(self) -> Dict[str, Any]:
+        """Формат ответа CommandNLPParser.parse_command"""
+        return {"command": self.name, "confidence": self.confidence}
+
+    def as_operation(self) -> Dict[str, Any]:
+        """Формат ответа UniversalAIParser.parse_message (balance_add, balance_reset)"""
+        return {
+            "operation_type": self.name,
+            "amount": self.data.get("amount"),
+            "description": "Пополнение баланса" if self.name == "balance_add" else "",
+            "platform": None,
+            "project": None,
+            "payment_method": None,
+            "payment_details": None,
+            "confidence": self.confidence,
+        }
+
+    def __repr__(self) -> str:
+        return f"Intent({self.name!r}, confidence={self.confidence}, rule={self.rule!r})"
+
+
+class _Rule:
+    """Правило: регулярное выражение по нормализованному тексту"""
+
+    __slots__ = ("name", "intent", "pattern", "confidence", "roles")
+
+    def __init__(self, name: str, intent: str, pattern: str, confidence: float,
+                 roles: FrozenSet[str] = ALL_ROLES):
+        self.name = name
+        self.intent = intent
+        self.pattern: Pattern = re.compile(pattern)
+        self.confidence = confidence
+        self.roles = roles
+
+
+# Правила проверяются по порядку; текст целиком должен совпасть с шаблоном
+RULES: List[_Rule] = [
+    _Rule("confirm", "payment_confirm",
+          r"оплачено\s+#?(?P<payment_id>\d+)(?:\s+.*)?", 1.0,
+          frozenset({"financier"})),
+    _Rule("start", "start",
+          r"(?:/?start|старт|начать(?: работу)?|привет|здравствуй(?:те)?|главное меню|меню)", 1.0),
+    _Rule("help", "help",
+          r"(?:/?help|помощь|справка|нужна помощь|покажи справку|что ты умеешь|"
+          r"что умеет бот|как пользоваться(?: ботом)?)", 1.0),
+    _Rule("balance", "balance",
+          r"(?:(?:покажи|какой|каков|текущий|наш)\s+)?(?:текущий\s+)?баланс(?:\s+счета)?(?:\s+сейчас)?|"
+          r"сколько (?:денег|на счету|на балансе)(?: на счету| сейчас| осталось)?", 0.95,
+          frozenset({"financier", "manager"})),
+    _Rule("stats", "stats",
+          r"(?:(?:покажи|общая|вся)\s+)?(?:статистик[ау]|отчет)(?: по системе)?", 0.95,
+          frozenset({"manager"})),
+    _Rule("reset", "balance_reset",
+          r"(?:обнули(?:ть)?|очисти(?:ть)?|сбрось|сбросить|сброс)\s+баланса?(?:\s+(?:в|на)\s+(?:ноль|0))?|"
+          r"баланс\s+(?:в|на)\s+(?:ноль|0)|reset balance|clear balance", 1.0,
+          frozenset({"manager"})),
+    _Rule("add", "balance_add",
+          r"(?:пополни(?:ть)?|пополнение|добавь|закинь|внеси)(?:\s+баланс)?(?:\s+на)?\s+"
+          + _AMOUNT + r"\s*" + _CURRENCY, 0.95,
+          frozenset({"manager"})),
+]
+
+# Завершающие знаки препинания и лишние пробелы
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.…]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё -> е, без завершающих знаков препинания и лишних пробелов"""
+    text = text.lower().replace("ё", "е")
+    text = _TRAILING_PUNCTUATION.sub("", text.strip())
+    return _SPACES.sub(" ", text)
+
+
+def _parse_amount(match) -> Optional[float]:
+    """Сумма из совпадения правила пополнения (None - неоднозначная запись)"""
+    raw = match.group("amount").replace(" ", "")
+    # "1,500" или "1.500" - разделитель тысяч или дробная часть: решает LLM
+    if re.search(r"[.,]\d{3}$", raw):
+        return None
+    try:
+        amount = float(raw.replace(",", "."))
+    except ValueError:
+        return None
+    if match.group("unit"):
+        amount *= 1000
+    return amount
+
+
+class FastIntentClassifier:
+    """Классификатор намерений по правилам с метриками попаданий"""
+
+    def __init__(self, rules: List[_Rule] = RULES,
+                 min_confidence: float = FAST_CLASSIFIER_MIN_CONFIDENCE):
+        self.rules = rules
+        self.min_confidence = min_confidence
+
+        self.messages = 0
+        self.fallbacks = 0
+        self.hits: Dict[str, int] = {}
+        self.classify_time = 0.0
+
+    def classify(self, text: str, role: str) -> Optional[Intent]:
+        """
+        Определение намерения
+
+        Args:
+            text: Текст сообщения
+            role: Роль пользователя
+
+        Returns:
+            Намерение или None, если сообщение нужно отдать LLM
+        """
+        started = time.perf_counter()
+        intent = self._match(normalize(text or ""), role)
+        self.messages += 1
+        self.classify_time += time.perf_counter() - started
+        if intent is None:
+            self.fallbacks += 1
+        else:
+            self.hits[intent.name] = self.hits.get(intent.name, 0) + 1
+            logger.debug(f"Быстрый классификатор: {intent!r}")
+        return intent
+
+    def _match(self, text: str, role: str) -> Optional[Intent]:
+        """Первое подходящее правило"""
+        if not text:
+            return None
+        for rule in self.rules:
+            if role not in rule.roles or rule.confidence < self.min_confidence:
+                continue
+            match = rule.pattern.fullmatch(text)
+            if match is None:
+                continue
+
+            data: Dict[str, Any] = {}
+            if rule.intent == "payment_confirm":
+                data["payment_id"] = int(match.group("payment_id"))
+            elif rule.intent == "balance_add":
+                amount = _parse_amount(match)
+                if not amount or amount <= 0:
+                    return None
+                data["amount"] = amount
+            return Intent(rule.intent, rule.confidence, data, rule.name)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Доля сообщений, решенных без LLM, и попадания по намерениям"""
+        messages = self.messages
+        hits = messages - self.fallbacks
+        return {
+            "messages": messages,
+            "hits": hits,
+            "fallbacks": self.fallbacks,
+            "hit_rate": round(hits / messages, 3) if messages else 0.0,
+            "by_intent": dict(self.hits),
+            "classify_avg_us": round(self.classify_time / messages * 1e6, 1) if messages else 0.0,
+        }
+
+
+# Классификатор процесса
+fast_classifier = FastIntentClassifier()
+
+
+def classify_message(text: str, role: str) -> Optional[Intent]:
+    """Намерение сообщения или None (классификатор выключен или правило не подошло)"""
+    if not FAST_CLASSIFIER_ENABLED:
+        return None
+    return fast_classifier.classify(text, role)
+
+
+def get_fast_classifier_stats() -> Dict[str, Any]:
+    """Метрики классификатора процесса"""
+    return fast_classifier.stats()
@@ -18,12 +18,15 @@ class HybridPaymentParser:
         self.regex_parser = PaymentParser()
         self.nlp_parser = NLPPaymentParser()
     
-    async def parse_payment_message(self, text: str) -> Optional[Dict[str, Any]]:
+    async def parse_payment_message(self, text: str,
+                                    unified: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
         """
         Парсинг сообщения о платеже с использованием гибридного подхода
         
         Args:
             text: Текст сообщения от маркетолога
+            unified: Результат UnifiedMessageParser для этого сообщения; если
+                передан, вместо запроса к NLP-парсеру используется его поле payment
             
         Returns:
             Словарь с данными о платеже или None если парсинг не удался
@@ -45,6 +48,14 @@ class HybridPaymentParser:
         except Exception as e:
             logger.warning(f"Ошибка regex парсинга: {e}")
         
+        # Заявка уже извлечена единым AI-разбором
+        if unified is not None:
+            if unified.get("payment"):
+                logger.info("Использован результат единого AI-разбора")
+                return unified["payment"]
+            logger.warning("Единый AI-разбор не нашел заявку в сообщении")
+            return None
+        
         # Если regex не справился, используем NLP парсинг
         try:
             nlp_result = await self.nlp_parser.parse_payment_message(text)
@@ -11,21 +11,24 @@ from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 
 from db.database import BalanceDB, PaymentDB
+from db.models import Payment, BalanceEvent
+from db.pool import read_connection
+from db.rollups import RollupDB
+from db.readonly import PAID_TODAY_COUNT_SQL
 from utils.config import Config
-import aiosqlite
 
 
 @dataclass
 class AnalyticsData:
     """Структура для хранения аналитических данных"""
     balance: float
-    pending_payments: List[Dict]
+    pending_payments: List[Payment]
     team_size: int
     today_payments: int
-    weekly_payments: List[Dict]
+    weekly_payments: List[Payment]
     projects: List[Dict]
-    recent_operations: List[Dict]
-    balance_history: List[Dict]
+    recent_operations: List[Payment]
+    balance_history: List[BalanceEvent]
 
 
 class ManagerAIAssistant:
@@ -184,81 +187,38 @@ class ManagerAIAssistant:
     async def _get_today_payments_count(self) -> int:
         """Получение количества платежей за сегодня"""
         try:
-            async with aiosqlite.connect(self.config.DATABASE_PATH) as conn:
-                cursor = await conn.execute("""
-                    SELECT COUNT(*) 
-                    FROM payments 
-                    WHERE DATE(created_at) = DATE('now') AND status = 'paid'
-                """)
+            async with read_connection() as conn:
+                cursor = await conn.execute(PAID_TODAY_COUNT_SQL)
                 result = await cursor.fetchone()
                 return result[0] if result else 0
         except:
             return 0
 
-    async def _get_weekly_payments(self) -> List[Dict]:
+    async def _get_weekly_payments(self) -> List[Payment]:
         """Получение платежей за неделю"""
         try:
-            async with aiosqlite.connect(self.config.DATABASE_PATH) as conn:
-                conn.row_factory = aiosqlite.Row
-                cursor = await conn.execute("""
-                    SELECT * FROM payments 
-                    WHERE created_at >= datetime('now', '-7 days')
-                    AND status = 'paid'
-                    ORDER BY created_at DESC
-                """)
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+            return await PaymentDB.get_recent_paid_payments(days=7)
         except:
             return []
 
     async def _get_projects_stats(self) -> List[Dict]:
         """Получение статистики по проектам"""
         try:
-            async with aiosqlite.connect(self.config.DATABASE_PATH) as conn:
-                conn.row_factory = aiosqlite.Row
-                cursor = await conn.execute("""
-                    SELECT 
-                        project_name,
-                        COUNT(*) as count,
-                        SUM(amount) as total,
-                        AVG(amount) as avg_amount
-                    FROM payments 
-                    WHERE project_name IS NOT NULL
-                    GROUP BY project_name 
-                    ORDER BY total DESC
-                """)
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+            return await RollupDB.get_project_stats()
         except:
             return []
 
-    async def _get_recent_operations(self) -> List[Dict]:
+    async def _get_recent_operations(self) -> List[Payment]:
         """Получение последних операций"""
         try:
-            async with aiosqlite.connect(self.config.DATABASE_PATH) as conn:
-                conn.row_factory = aiosqlite.Row
-                cursor = await conn.execute("""
-                    SELECT * FROM payments 
-                    ORDER BY created_at DESC 
-                    LIMIT 10
-                """)
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+            return await PaymentDB.get_recent_payments(limit=10)
         except:
             return []
 
-    async def _get_balance_history(self) -> List[Dict]:
+    async def _get_balance_history(self) -> List[BalanceEvent]:
         """Получение истории баланса"""
         try:
-            async with aiosqlite.connect(self.config.DATABASE_PATH) as conn:
-                conn.row_factory = aiosqlite.Row
-                cursor = await conn.execute("""
-                    SELECT * FROM balance_history 
-                    ORDER BY timestamp DESC 
-                    LIMIT 10
-                """)
-                rows = await cursor.fetchall()
-                return [dict(row) for row in rows]
+            return await BalanceDB.get_balance_history(limit=10)
         except:
             return []
 
@@ -271,13 +231,13 @@ class ManagerAIAssistant:
         
         elif intent == 'pending_payments':
             count = len(data.pending_payments)
-            total = sum(p['amount'] for p in data.pending_payments)
+            total = sum(p.amount for p in data.pending_payments)
             response = f"📝 Ожидающие оплаты: {count} платежей на сумму ${total:.2f}"
             
             if count > 0:
                 response += "\n\nПоследние заявки:"
                 for payment in data.pending_payments[:5]:
-                    response += f"\n• {payment['service_name']} - ${payment['amount']:.2f}"
+                    response += f"\n• {payment.service_name} - ${payment.amount:.2f}"
             
             return response
         
@@ -298,15 +258,15 @@ class ManagerAIAssistant:
         
         elif intent == 'weekly_payments':
             count = len(data.weekly_payments)
-            total = sum(p['amount'] for p in data.weekly_payments)
+            total = sum(p.amount for p in data.weekly_payments)
             
             response = f"📈 Платежи за неделю: {count} платежей на ${total:.2f}"
             
             if count > 0:
                 response += "\n\nПоследние платежи:"
                 for payment in data.weekly_payments[:5]:
-                    date = datetime.fromisoformat(payment['created_at']).strftime('%d.%m')
-                    response += f"\n• {date}: {payment['service_name']} - ${payment['amount']:.2f}"
+                    date = datetime.fromisoformat(payment.created_at).strftime('%d.%m')
+                    response += f"\n• {date}: {payment.service_name} - ${payment.amount:.2f}"
             
             return response
         
@@ -329,9 +289,9 @@ class ManagerAIAssistant:
             response = "📋 Последние операции:"
             
             for operation in data.recent_operations[:10]:
-                date = datetime.fromisoformat(operation['created_at']).strftime('%d.%m %H:%M')
-                status = "✅" if operation['status'] == 'paid' else "⏳"
-                response += f"\n{status} {date}: {operation['service_name']} - ${operation['amount']:.2f}"
+                date = datetime.fromisoformat(operation.created_at).strftime('%d.%m %H:%M')
+                status = "✅" if operation.status == 'paid' else "⏳"
+                response += f"\n{status} {date}: {operation.service_name} - ${operation.amount:.2f}"
             
             return response
         
@@ -342,9 +302,9 @@ class ManagerAIAssistant:
             response = "📈 История баланса:"
             
             for record in data.balance_history[:10]:
-                date = datetime.fromisoformat(record['timestamp']).strftime('%d.%m %H:%M')
-                amount_str = f"+${record['amount']:.2f}" if record['amount'] > 0 else f"-${abs(record['amount']):.2f}"
-                response += f"\n• {date}: {amount_str} - {record['description']}"
+                date = datetime.fromisoformat(record.timestamp).strftime('%d.%m %H:%M')
+                amount_str = f"+${record.amount:.2f}" if record.amount > 0 else f"-${abs(record.amount):.2f}"
+                response += f"\n• {date}: {amount_str} - {record.description}"
             
             return response
         
@@ -352,7 +312,7 @@ class ManagerAIAssistant:
             # Общий ответ с кратким обзором
             status = "здоровый" if data.balance >= self.config.LOW_BALANCE_THRESHOLD else "низкий"
             pending_count = len(data.pending_payments)
-            pending_total = sum(p['amount'] for p in data.pending_payments)
+            pending_total = sum(p.amount for p in data.pending_payments)
             
             response = "📊 Общий обзор системы:"
             response += f"\n💰 Баланс: ${data.balance:.2f} ({status})"
@@ -7,7 +7,8 @@ import json
 import logging
 import asyncio
 from typing import Optional, Dict, Any
-from openai import AsyncOpenAI
+from nlp.openai_client import get_openai_client
+from nlp.parse_cache import parse_cache
 from utils.config import Config
 
 logger = logging.getLogger(__name__)
@@ -18,7 +19,7 @@ class NLPPaymentParser:
     
     def __init__(self):
         self.config = Config()
-        self.client = AsyncOpenAI(api_key=self.config.OPENAI_API_KEY)
+        self.client = get_openai_client()
         
         # Системный промпт для GPT-4
         self.system_prompt = """
@@ -64,7 +65,7 @@ class NLPPaymentParser:
         text = text.strip()
         logger.info(f"NLP парсинг сообщения: {text}")
         
-        try:
+        async def _request():
             # Отправка запроса к OpenAI
             response = await self.client.chat.completions.create(
                 model="gpt-4o-mini",
@@ -79,10 +80,12 @@ class NLPPaymentParser:
             # Получение ответа
             content = response.choices[0].message.content.strip()
             logger.info(f"OpenAI ответ: {content}")
-            
-            # Парсинг JSON ответа
+            return json.loads(content)
+        
+        try:
+            # Повторяющиеся фразы берутся из кэша ответов
             try:
-                payment_data = json.loads(content)
+                payment_data = await parse_cache.fetch("payment", self.system_prompt, "marketer", text, _request)
             except json.JSONDecodeError as e:
                 logger.error(f"Ошибка парсинга JSON ответа: {e}")
                 return None
@@ -0,0 +1,57 @@
+"""
+Общий клиент OpenAI.
+Пакет openai импортируется только при первом обращении к клиенту: импорт
+занимает около 0.3 с и раньше выполнялся при загрузке модулей обработчиков,
+замедляя холодный старт. Клиент создается один раз на event loop, поэтому
+его пул HTTP-соединений переиспользуется между сообщениями.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from utils.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+# Клиенты по event loop: соединения httpx привязаны к loop, в котором созданы
+_clients: Dict[Optional[asyncio.AbstractEventLoop], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _current_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Работающий event loop (None вне loop)"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_openai_client():
+    """Асинхронный клиент OpenAI для текущего event loop (создается при первом вызове)"""
+    loop = _current_loop()
+    client = _clients.get(loop)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        # Клиенты закрытых loop больше не пригодны
+        for closed in [key for key in _clients if key is not None and key.is_closed()]:
+            del _clients[closed]
+        client = _clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=Config().OPENAI_API_KEY)
+            _clients[loop] = client
+            logger.debug("Создан клиент OpenAI")
+    return client
+
+
+def get_openai_module():
+    """Модуль openai с установленным ключом API (импортируется при первом вызове)"""
+    import openai
+    if openai.api_key is None:
+        openai.api_key = Config().OPENAI_API_KEY
+    return openai
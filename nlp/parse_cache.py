@@ -0,0 +1,288 @@
+"""
+Кэш ответов OpenAI для парсеров сообщений.
+Пользователи повторяют одни и те же фразы ("какой баланс?", "покажи
+статистику", "мои заявки"), и каждая раньше требовала нового запроса к модели.
+Ответ модели (разобранный JSON, до проверки и нормализации парсером)
+сохраняется по ключу: парсер + версия промпта (хэш системного промпта) +
+роль + шаблон текста.
+
+Шаблон: нижний регистр, ё -> е, без знаков препинания и лишних пробелов,
+числа заменены на N. "Пополни на 500" и "пополни на 700!" дают один шаблон;
+при попадании числа исходного текста в ответе заменяются числами нового
+(сумма 500 -> 700). Если число ответа нельзя однозначно сопоставить с числом
+текста (например, "1,5к" -> 1500), запись подходит только тексту с теми же
+числами, а для остальных модель запрашивается заново.
+
+Парсеры из EXACT_TEXT_PARSERS переносят в ответ фрагменты текста (реквизиты:
+кошелек, email, телефон, название проекта), поэтому их шаблон сохраняет
+регистр и знаки препинания: сводятся только пробелы, а на N заменяются лишь
+отдельно стоящие числа (цифры внутри "TXy7f9", "pay-42@mail.ru" остаются в
+ключе). Сообщения с разными реквизитами не получают один ответ.
+
+Перед таблицей llm_cache (db/llm_cache.py) стоит LRU в памяти процесса.
+Записи живут LLM_CACHE_TTL_SECONDS, таблица ограничена LLM_CACHE_MAX_ENTRIES
+записями. Ошибки запроса и неразборчивые ответы не кэшируются; ошибка самого
+кэша не мешает разбору - запрос уходит в модель.
+"""
+
+import os
+import re
+import copy
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from db.llm_cache import LLMCacheDB
+
+logger = logging.getLogger(__name__)
+
+
+# Включение кэша ответов
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Срок хранения ответа (секунды)
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Предел записей в таблице и размер LRU в памяти процесса
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_LRU_SIZE = int(os.getenv("LLM_CACHE_LRU_SIZE", "1000"))
+
+# Через сколько записей удалять из таблицы просроченные и лишние
+LLM_CACHE_PURGE_EVERY = 100
+
+# Парсеры, ответ которых содержит реквизиты и другие фрагменты текста
+EXACT_TEXT_PARSERS = frozenset({"payment", "unified", "universal"})
+
+# Поля ответа, значения которых модель не берет из текста
+_MODEL_FIELDS = frozenset({"confidence"})
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_STANDALONE_NUMBER = re.compile(r"(?<!\S)\d+(?:[.,]\d+)?(?![.,]?\w)")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def make_template(text: str, exact: bool = False) -> Tuple[str, List[str]]:
+    """
+    Шаблон текста для ключа кэша
+
+    Args:
+        exact: Сохранить регистр, знаки препинания и цифры внутри слов
+
+    Returns:
+        (шаблон, числа текста по порядку)
+    """
+    if exact:
+        text = _SPACES.sub(" ", text).strip()
+        return _STANDALONE_NUMBER.sub("N", text), _STANDALONE_NUMBER.findall(text)
+    text = text.lower().replace("ё", "е")
+    numbers = _NUMBER.findall(text)
+    text = _PUNCTUATION.sub(" ", _NUMBER.sub("N", text))
+    return _SPACES.sub(" ", text).strip(), numbers
+
+
+def _number_value(literal: str) -> float:
+    """Значение числа из текста"""
+    return float(literal.replace(",", "."))
+
+
+class _Unmapped(Exception):
+    """Число ответа не соответствует ни одному числу текста"""
+
+
+def substitute_numbers(result: Any, old: List[str], new: List[str],
+                       exact: bool = False) -> Tuple[bool, Any]:
+    """
+    Перенос ответа на текст с другими числами
+
+    Числовые значения ответа, равные числу старого текста, и такие же числа
+    внутри строк заменяются соответствующими числами нового текста (при exact -
+    только отдельно стоящие, как в make_template).
+
+    Returns:
+        (удалось ли однозначно заменить числа, копия ответа)
+    """
+    if old == new:
+        return True, copy.deepcopy(result)
+    if len(old) != len(new):
+        return False, None
+
+    by_literal: Dict[str, str] = {}
+    by_value: Dict[float, str] = {}
+    for old_literal, new_literal in zip(old, new):
+        # Одно и то же число старого текста перешло в разные числа нового
+        if by_literal.setdefault(old_literal, new_literal) != new_literal:
+            return False, None
+        if by_value.setdefault(_number_value(old_literal), new_literal) != new_literal:
+            return False, None
+
+    pattern = _STANDALONE_NUMBER if exact else _NUMBER
+
+    def _replace_literal(match) -> str:
+        if match.group(0) not in by_literal:
+            raise _Unmapped()
+        return by_literal[match.group(0)]
+
+    def _walk(value: Any, key: Optional[str] = None) -> Any:
+        if isinstance(value, dict):
+            return {k: _walk(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [_walk(item, key) for item in value]
+        if key in _MODEL_FIELDS or isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            literal = by_value.get(float(value))
+            if literal is None:
+                raise _Unmapped()
+            number = _number_value(literal)
+            return int(number) if isinstance(value, int) and number.is_integer() else number
+        if isinstance(value, str):
+            return pattern.sub(_replace_literal, value)
+        return value
+
+    try:
+        return True, _walk(result)
+    except _Unmapped:
+        return False, None
+
+
+class ParseCache:
+    """Кэш ответов модели: LRU в памяти перед таблицей SQLite"""
+
+    def __init__(self, ttl: float = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 lru_size: int = LLM_CACHE_LRU_SIZE,
+                 enabled: bool = LLM_CACHE_ENABLED):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lru_size = lru_size
+        self.enabled = enabled
+        # ключ -> (срок хранения, числа исходного текста, ответ модели)
+        self._recent: "OrderedDict[str, Tuple[float, List[str], Any]]" = OrderedDict()
+        self._writes = 0
+
+        self.hits_memory = 0
+        self.hits_db = 0
+        self.misses = 0
+        self.substituted = 0
+
+    @staticmethod
+    def make_key(parser: str, prompt: str, role: Optional[str], template: str,
+                 exact: bool = False) -> str:
+        """Ключ записи; изменение промпта дает новую версию и новые ключи"""
+        version = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+        mode = "exact" if exact else "normalized"
+        raw = f"{parser}\n{version}\n{role or ''}\n{mode}\n{template}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, expires_at: float, numbers: List[str], result: Any):
+        """Добавление в LRU"""
+        self._recent[key] = (expires_at, numbers, result)
+        self._recent.move_to_end(key)
+        while len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+
+    async def _lookup(self, key: str) -> Optional[Tuple[bool, List[str], Any]]:
+        """
+        Запись из LRU или таблицы
+
+        Returns:
+            (найдена в памяти, числа исходного текста, ответ модели) или None
+        """
+        entry = self._recent.get(key)
+        if entry is not None:
+            expires_at, numbers, result = entry
+            if expires_at > time.time():
+                self._recent.move_to_end(key)
+                return True, numbers, result
+            del self._recent[key]
+
+        try:
+            stored = await LLMCacheDB.get(key)
+        except Exception as e:
+            logger.warning(f"Ошибка чтения кэша ответов OpenAI: {e}")
+            return None
+        if stored is None:
+            return None
+        numbers, result, expires_at = stored
+        self._remember(key, expires_at, numbers, result)
+        return False, numbers, result
+
+    async def _store(self, key: str, parser: str, template: str, numbers: List[str], result: Any):
+        """Сохранение ответа в LRU и таблицу"""
+        self._remember(key, time.time() + self.ttl, numbers, copy.deepcopy(result))
+        self._writes += 1
+        purge = (self._writes - 1) % LLM_CACHE_PURGE_EVERY == 0
+        try:
+            await LLMCacheDB.put(key, parser, template, numbers, result, self.ttl,
+                                 self.max_entries if purge else None)
+        except Exception as e:
+            logger.warning(f"Ошибка записи кэша ответов OpenAI: {e}")
+
+    async def fetch(self, parser: str, prompt: str, role: Optional[str], text: str,
+                    request: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Ответ модели из кэша или от request()
+
+        Args:
+            parser: Имя парсера (часть ключа)
+            prompt: Системный промпт запроса (его хэш - версия промпта)
+            role: Роль пользователя
+            text: Текст сообщения
+            request: Запрос к модели, возвращающий разобранный JSON ответа;
+                исключение пробрасывается вызывающему и не кэшируется
+
+        Returns:
+            Разобранный JSON ответа модели (копия, ее можно изменять)
+        """
+        if not self.enabled:
+            return await request()
+
+        exact = parser in EXACT_TEXT_PARSERS
+        template, numbers = make_template(text, exact)
+        key = self.make_key(parser, prompt, role, template, exact)
+
+        cached = await self._lookup(key)
+        if cached is not None:
+            in_memory, cached_numbers, result = cached
+            ok, value = substitute_numbers(result, cached_numbers, numbers, exact)
+            if ok:
+                if in_memory:
+                    self.hits_memory += 1
+                else:
+                    self.hits_db += 1
+                if cached_numbers != numbers:
+                    self.substituted += 1
+                logger.info(f"Ответ OpenAI из кэша ({parser}): {template}")
+                return value
+            # Числа не переносятся - запись заменяется ответом для нового текста
+
+        self.misses += 1
+        result = await request()
+        await self._store(key, parser, template, numbers, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий"""
+        hits = self.hits_memory + self.hits_db
+        lookups = hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits_memory": self.hits_memory,
+            "hits_db": self.hits_db,
+            "misses": self.misses,
+            "substituted": self.substituted,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "lru_size": len(self._recent),
+        }
+
+
+# Кэш процесса, общий для всех парсеров
+parse_cache = ParseCache()
+
+
+def get_parse_cache_stats() -> Dict[str, Any]:
+    """Метрики кэша процесса"""
+    return parse_cache.stats()
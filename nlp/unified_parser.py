@@ -0,0 +1,173 @@
+"""
+Единый AI-парсер сообщения: один запрос к OpenAI вместо цепочки
+"распознавание команды" (CommandNLPParser) + "разбор операции"
+(UniversalAIParser для руководителя, NLPPaymentParser для маркетолога).
+Модель за один ответ определяет, является ли сообщение командой, и
+извлекает данные операции; проверка и нормализация ответа выполняются
+теми же правилами, что и у отдельных парсеров.
+
+Режим выбирается NLP_PARSE_MODE: unified (по умолчанию) или chain
+(прежняя цепочка запросов).
+"""
+
+import os
+import json
+import logging
+from typing import Optional, Dict, Any
+from nlp.openai_client import get_openai_client
+from nlp.parse_cache import parse_cache
+from nlp.command_parser import CommandNLPParser
+from nlp.universal_ai_parser import UniversalAIParser
+from nlp.nlp_parser import NLPPaymentParser
+
+logger = logging.getLogger(__name__)
+
+
+# Режим разбора сообщений: unified - один запрос, chain - отдельные запросы парсеров
+NLP_PARSE_MODE = os.getenv("NLP_PARSE_MODE", "unified")
+
+
+# Общая часть промпта: распознавание команды
+_COMMAND_SECTION = """
+Ты — специалист по разбору сообщений чат-бота системы управления платежами.
+За один ответ определи, является ли сообщение командой бота, и извлеки данные операции.
+
+КОМАНДЫ (поле "command"):
+- "start" - начать работу, приветствие, главное меню ("Привет", "Начать работу")
+- "help" - справка, что умеет бот ("Помощь", "Что ты умеешь?")
+- "balance" - показать баланс ("Покажи баланс", "Сколько денег на счету?")
+- "stats" - статистика, отчет ("Статистика", "Покажи отчет", "Как дела?")
+Если сообщение - запрос на оплату, пополнение, обнуление или вопрос по данным, "command": null.
+"""
+
+# Операции руководителя (формат UniversalAIParser)
+_OPERATION_SECTION = """
+ОПЕРАЦИЯ (поле "operation", если "command": null):
+- "balance_add" - пополнение баланса (пополни, добавь, закинь, внеси, поступило + сумма)
+- "balance_reset" - обнуление баланса (обнули, очисти, reset + баланс)
+- "analytics_query" - вопрос по данным (сколько, какой, что, как; баланс, платежи, статистика)
+- "system_command" - системная команда
+- "unknown" - не удалось определить
+Поля операции: amount (число или null), description (описание: от кого, для чего),
+platform, project, payment_method, payment_details (строка или null), confidence (0-1).
+Пример: "пополни баланс на 500 баксов для Инсты для сайта из криптокошелька 123"
+→ "operation": {"type": "balance_add", "amount": 500, "description": "для Инсты для сайта из криптокошелька 123",
+"platform": "Инста", "project": "сайт", "payment_method": "криптокошелек", "payment_details": "123", "confidence": 0.98}
+"""
+
+# Заявка на оплату маркетолога (формат NLPPaymentParser)
+_PAYMENT_SECTION = """
+ЗАЯВКА НА ОПЛАТУ (поле "payment", если "command": null):
+service_name (название сервиса), amount (сумма в долларах, число), project_name (проект),
+payment_method ("crypto", "phone", "account" или "file"), payment_details (кошелек, телефон,
+реквизиты или пустая строка). Если сообщение не заявка, "payment": null.
+Пример: "Нужна оплата гугл адс 50 долларов проект Бета телефон +1234567890"
+→ "payment": {"service_name": "Google Ads", "amount": 50, "project_name": "Бета",
+"payment_method": "phone", "payment_details": "+1234567890"}
+"""
+
+_FORMAT_SECTION = """
+Возвращай ТОЛЬКО JSON без дополнительного текста:
+{
+    "command": "название_команды_или_null",
+    "confidence": число_от_0_до_1%s
+}
+"""
+
+
+class UnifiedMessageParser:
+    """Разбор сообщения одним запросом к OpenAI"""
+
+    def __init__(self):
+        self.client = get_openai_client()
+        # Проверка и нормализация ответа - правилами отдельных парсеров
+        self.command_parser = CommandNLPParser()
+        self.operation_parser = UniversalAIParser()
+        self.payment_parser = NLPPaymentParser()
+
+    @staticmethod
+    def build_prompt(user_role: str) -> str:
+        """Промпт для роли: только те разделы, которые нужны ее обработчику"""
+        sections = [_COMMAND_SECTION]
+        fields = ""
+        if user_role == "manager":
+            sections.append(_OPERATION_SECTION)
+            fields = ',\n    "operation": {"type": "...", "amount": ..., "description": "...", ...} или null'
+        elif user_role == "marketer":
+            sections.append(_PAYMENT_SECTION)
+            fields = ',\n    "payment": {"service_name": "...", "amount": ..., ...} или null'
+        sections.append(_FORMAT_SECTION % fields)
+        return "".join(sections)
+
+    async def parse(self, text: str, user_role: str) -> Optional[Dict[str, Any]]:
+        """
+        Разбор сообщения
+
+        Args:
+            text: Текст сообщения
+            user_role: Роль пользователя
+
+        Returns:
+            {"command": данные команды или None,
+             "operation": данные операции руководителя или None,
+             "payment": данные заявки маркетолога или None}
+            или None, если запрос или разбор ответа не удался
+        """
+        if not text or not text.strip():
+            return None
+
+        text = text.strip()
+        logger.info(f"Единый AI-разбор сообщения ({user_role}): {text}")
+
+        prompt = self.build_prompt(user_role)
+
+        async def _request():
+            response = await self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": text}
+                ],
+                max_tokens=350,
+                temperature=0.1
+            )
+            content = response.choices[0].message.content.strip()
+            logger.info(f"OpenAI ответ единого разбора: {content}")
+            return json.loads(content)
+
+        try:
+            data = await parse_cache.fetch("unified", prompt, user_role, text, _request)
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка парсинга JSON единого разбора: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Ошибка единого AI-разбора: {e}")
+            return None
+        if not isinstance(data, dict):
+            return None
+
+        return self._normalize(data, user_role)
+
+    def _normalize(self, data: Dict[str, Any], user_role: str) -> Dict[str, Any]:
+        """Проверка частей ответа правилами отдельных парсеров"""
+        result = {"command": None, "operation": None, "payment": None}
+
+        command_data = {"command": data.get("command"), "confidence": data.get("confidence", 0)}
+        if command_data["command"] is not None:
+            if self.command_parser._validate_command(command_data, user_role):
+                result["command"] = command_data
+                return result
+
+        operation = data.get("operation")
+        if user_role == "manager" and isinstance(operation, dict):
+            operation = dict(operation)
+            operation["operation_type"] = operation.pop("type", None)
+            if self.operation_parser._validate_parsed_data(operation):
+                result["operation"] = self.operation_parser._normalize_parsed_data(operation)
+
+        payment = data.get("payment")
+        if user_role == "marketer" and isinstance(payment, dict):
+            if self.payment_parser._validate_parsed_data(payment):
+                result["payment"] = self.payment_parser._normalize_data(payment)
+
+        return result
@@ -6,7 +6,8 @@
 import json
 import logging
 from typing import Optional, Dict, Any, List
-from openai import AsyncOpenAI
+from nlp.openai_client import get_openai_client
+from nlp.parse_cache import parse_cache
 from utils.config import Config
 
 logger = logging.getLogger(__name__)
@@ -17,7 +18,7 @@ class UniversalAIParser:
     
     def __init__(self):
         self.config = Config()
-        self.client = AsyncOpenAI(api_key=self.config.OPENAI_API_KEY)
+        self.client = get_openai_client()
         
         # Системный промпт для универсального парсинга
         self.system_prompt = """
@@ -146,24 +147,28 @@ class UniversalAIParser:
             elif user_role == "marketer":
                 role_context += "Может создавать заявки на оплату, делать аналитические запросы."
             
-            # Отправка запроса к OpenAI
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.system_prompt + role_context},
-                    {"role": "user", "content": text}
-                ],
-                max_tokens=300,
-                temperature=0.1
-            )
+            system_prompt = self.system_prompt + role_context
             
-            # Получение ответа
-            content = response.choices[0].message.content.strip()
-            logger.info(f"OpenAI ответ: {content}")
+            async def _request():
+                # Отправка запроса к OpenAI
+                response = await self.client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": text}
+                    ],
+                    max_tokens=300,
+                    temperature=0.1
+                )
+                
+                # Получение ответа
+                content = response.choices[0].message.content.strip()
+                logger.info(f"OpenAI ответ: {content}")
+                return json.loads(content)
             
-            # Парсинг JSON ответа
+            # Повторяющиеся фразы берутся из кэша ответов
             try:
-                parsed_data = json.loads(content)
+                parsed_data = await parse_cache.fetch("universal", system_prompt, user_role, text, _request)
             except json.JSONDecodeError as e:
                 logger.error(f"Ошибка парсинга JSON: {e}")
                 return None
@@ -0,0 +1,43 @@
+"""
+Общая основа тестов слоя базы данных: каждый тест работает с новой базой
+во временном каталоге (DATABASE_PATH), пул соединений закрывается после теста.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+try:
+    from utils.config import Config
+    from db.database import init_database
+    from db.pool import close_pool, read_connection
+except ModuleNotFoundError:
+    # Слою базы данных нужна конфигурация бота
+    Config = None
+
+
+requires_database = unittest.skipIf(Config is None, "слой базы данных не импортируется")
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """Тест с временной базой данных"""
+
+    async def asyncSetUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "bot.db")
+        for patcher in (mock.patch.dict(os.environ, {"DATABASE_PATH": path}),
+                        mock.patch.object(Config, "DATABASE_PATH", path, create=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        await init_database()
+
+    async def asyncTearDown(self):
+        await close_pool()
+
+    async def fetch(self, sql: str, params: tuple = ()) -> list:
+        """Строки запроса к временной базе"""
+        async with read_connection() as db:
+            cursor = await db.execute(sql, params)
+            return await cursor.fetchall()
@@ -0,0 +1,59 @@
+"""
+Подтверждение оплаты (PaymentDB.confirm_payment): заявка переходит из pending
+в paid один раз, повторное или одновременное подтверждение ничего не пишет.
+"""
+
+import asyncio
+
+from tests.db_case import DatabaseTestCase, requires_database
+
+try:
+    from db.database import BalanceDB, PaymentDB
+except ModuleNotFoundError:
+    pass
+
+
+@requires_database
+class ConfirmPaymentTest(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        await BalanceDB.add_balance(10000, user_id=4)
+        self.payment_id = await PaymentDB.create_payment(
+            1, "Google Ads", 100, "crypto", "TXy7f9", "Альфа"
+        )
+
+    async def _written(self):
+        transactions = await self.fetch(
+            "SELECT COUNT(*) FROM transactions WHERE payment_id = ?", (self.payment_id,)
+        )
+        outbox = await self.fetch(
+            "SELECT COUNT(*) FROM outbox WHERE kind = 'payment_confirmed'"
+        )
+        return transactions[0][0], outbox[0][0]
+
+    async def test_confirm(self):
+        balance = await PaymentDB.confirm_payment(self.payment_id, "0xabc", notify=True)
+        self.assertEqual(balance, 9900)
+        self.assertEqual(await BalanceDB.get_balance(), 9900)
+        self.assertEqual((await PaymentDB.get_payment(self.payment_id)).status, "paid")
+        self.assertEqual(await self._written(), (1, 1))
+
+    async def test_double_confirm(self):
+        self.assertEqual(await PaymentDB.confirm_payment(self.payment_id, notify=True), 9900)
+        self.assertIsNone(await PaymentDB.confirm_payment(self.payment_id, notify=True))
+        self.assertEqual(await BalanceDB.get_balance(), 9900)
+        self.assertEqual(await self._written(), (1, 1))
+
+    async def test_concurrent_confirm(self):
+        results = await asyncio.gather(
+            *(PaymentDB.confirm_payment(self.payment_id, notify=True) for _ in range(5))
+        )
+        self.assertEqual(sorted(results, key=lambda value: value is not None),
+                         [None, None, None, None, 9900])
+        self.assertEqual(await BalanceDB.get_balance(), 9900)
+        self.assertEqual(await self._written(), (1, 1))
+
+    async def test_unknown_payment(self):
+        self.assertIsNone(await PaymentDB.confirm_payment(self.payment_id + 1, notify=True))
+        self.assertEqual(await self._written(), (0, 0))
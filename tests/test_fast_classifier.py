@@ -0,0 +1,61 @@
+"""
+Правила быстрого классификатора намерений (nlp/fast_classifier.py):
+сообщение распознается без LLM только при однозначной записи.
+"""
+
+import unittest
+
+from nlp.fast_classifier import FastIntentClassifier
+
+
+class FastClassifierTest(unittest.TestCase):
+
+    def setUp(self):
+        self.classifier = FastIntentClassifier(min_confidence=0.9)
+
+    def _amount(self, text):
+        intent = self.classifier.classify(text, "manager")
+        if intent is None:
+            return None
+        self.assertEqual(intent.name, "balance_add")
+        return intent.data["amount"]
+
+    def test_amount(self):
+        self.assertEqual(self._amount("пополни на 500"), 500)
+        self.assertEqual(self._amount("Пополни баланс на 500.50$"), 500.5)
+        self.assertEqual(self._amount("закинь 1,5к"), 1500)
+        self.assertEqual(self._amount("добавь 2 тыс долларов"), 2000)
+
+    def test_thousands_grouping(self):
+        self.assertEqual(self._amount("пополни на 1 000"), 1000)
+        self.assertEqual(self._amount("пополни на 12 500$"), 12500)
+        self.assertEqual(self._amount("внеси 1 000 000"), 1000000)
+
+    def test_separate_numbers_go_to_llm(self):
+        self.assertIsNone(self._amount("пополни на 100 50$"))
+        self.assertIsNone(self._amount("пополнил 100 50$"))
+        self.assertIsNone(self._amount("пополни 1 000 5"))
+        self.assertIsNone(self._amount("пополни на 1000 000"))
+
+    def test_ambiguous_separator_goes_to_llm(self):
+        self.assertIsNone(self._amount("пополни на 1,500"))
+        self.assertIsNone(self._amount("пополни на 1.500$"))
+
+    def test_add_only_for_manager(self):
+        self.assertIsNone(self.classifier.classify("пополни на 500", "marketer"))
+
+    def test_commands(self):
+        self.assertEqual(self.classifier.classify("Баланс?", "manager").name, "balance")
+        self.assertIsNone(self.classifier.classify("баланс", "marketer"))
+        self.assertEqual(self.classifier.classify("Оплачено #12", "financier").data,
+                         {"payment_id": 12})
+
+    def test_stats(self):
+        self.classifier.classify("помощь", "marketer")
+        self.classifier.classify("пополни на 100 50$", "manager")
+        stats = self.classifier.stats()
+        self.assertEqual((stats["messages"], stats["hits"], stats["fallbacks"]), (2, 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+"""
+Бюджет времени импорта при холодном старте (utils/import_budget.py).
+Проверка запускается в отдельном интерпретаторе так же, как из командной
+строки; тест падает при превышении бюджета этапа или импорте модулей из
+LAZY_MODULES при старте.
+"""
+
+import sys
+import subprocess
+import unittest
+
+from utils.import_budget import HEALTH_MODULES, INIT_MODULES, ROOT_DIR
+
+
+def _run(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT_DIR,
+                          capture_output=True, text=True, timeout=300)
+
+
+class ImportBudgetTest(unittest.TestCase):
+
+    def _check_stage(self, stage: str):
+        result = _run("-m", "utils.import_budget", "--stage", stage, "--runs", "3")
+        self.assertEqual(result.returncode, 0,
+                         f"Бюджет импорта этапа {stage} превышен:\n{result.stdout}{result.stderr[-2000:]}")
+
+    def test_health_stage(self):
+        self._check_stage("health")
+
+    def test_init_stage(self):
+        # Этап init требует зависимостей бота; без них замерять нечего
+        code = "".join(f"import {name}\n" for name in HEALTH_MODULES + INIT_MODULES)
+        probe = _run("-c", code)
+        if probe.returncode != 0 and "ModuleNotFoundError" in probe.stderr:
+            self.skipTest(f"Модули этапа init не импортируются: {probe.stderr.strip().splitlines()[-1]}")
+        self._check_stage("init")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Flood control в очереди исходящих сообщений (utils/outbound.py): ответ 429
+приостанавливает не только чат, но и общий лимит бота, но не дольше предела
+ожидания планировщика.
+"""
+
+import time
+import unittest
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from utils.outbound import OutboundScheduler
+
+
+class _Bot:
+    """Бот, отвечающий 429 на первый запрос в чат 1"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        self.calls = []
+
+    async def __call__(self, method):
+        self.calls.append((method.chat_id, time.monotonic()))
+        if len(self.calls) == 1:
+            raise TelegramRetryAfter(method, "Flood control exceeded", self.retry_after)
+        return True
+
+
+class RetryAfterTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_retry_after_pauses_other_chats(self):
+        scheduler = OutboundScheduler(global_rate=100, chat_rate=100)
+        bot = _Bot(retry_after=1)
+
+        started = time.monotonic()
+        first = scheduler.submit(bot, SendMessage(chat_id=1, text="a"))
+        await scheduler.drain(timeout=0.1)
+        second = scheduler.submit(bot, SendMessage(chat_id=2, text="b"))
+        self.assertTrue(await scheduler.drain(timeout=5))
+
+        self.assertTrue(first.result())
+        self.assertTrue(second.result())
+        self.assertEqual(scheduler.retry_after, 1)
+        # Чат 2 ждал окончания паузы, которую Telegram назначил боту
+        sent_to_second = [at for chat_id, at in bot.calls if chat_id == 2]
+        self.assertGreaterEqual(sent_to_second[0] - started, 0.9)
+
+    async def test_long_retry_after_is_not_awaited(self):
+        # Пауза длиннее предела планировщика не ожидается: ошибка уходит вызывающему
+        scheduler = OutboundScheduler(global_rate=100, chat_rate=100, max_retry_after=0.5)
+        bot = _Bot(retry_after=30)
+
+        started = time.monotonic()
+        first = scheduler.submit(bot, SendMessage(chat_id=1, text="a"))
+        second = scheduler.submit(bot, SendMessage(chat_id=2, text="b"))
+        self.assertTrue(await scheduler.drain(timeout=5))
+
+        with self.assertRaises(TelegramRetryAfter):
+            first.result()
+        self.assertTrue(second.result())
+        # Общий лимит приостановлен не дольше предела
+        self.assertLess(time.monotonic() - started, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
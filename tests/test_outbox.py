@@ -0,0 +1,116 @@
+"""
+Доставка outbox (db/outbox.py, utils/outbox.py): аренда строк, повтор с
+нарастающей паузой, отказ при постоянной ошибке и после исчерпания попыток.
+"""
+
+import time
+import asyncio
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from tests.db_case import DatabaseTestCase, requires_database
+
+try:
+    from db.outbox import OutboxDB
+    from db.writer import submit_write
+    from utils import outbound
+    from utils.outbox import OUTBOX_RETRY_DELAY, OutboxWorker, register_renderer
+except ModuleNotFoundError:
+    register_renderer = None
+
+if register_renderer is not None:
+    @register_renderer("test_notice", parse_mode=None)
+    def render_test_notice(payload: dict) -> str:
+        return payload["text"]
+
+
+class _Bot:
+    """Бот с заданной ошибкой для каждого чата"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def __call__(self, method):
+        error = self.errors.get(method.chat_id)
+        if error is not None:
+            raise error(method)
+        self.sent.append(method.chat_id)
+        return True
+
+
+@requires_database
+class OutboxTest(DatabaseTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # Flood control не ожидается: ошибка сразу возвращается воркеру
+        outbound.set_max_retry_after(0)
+        self.addCleanup(outbound.set_max_retry_after, outbound.OUTBOUND_MAX_RETRY_AFTER)
+
+    async def _notify(self, recipients, key="notice:1"):
+        async def _add(db):
+            return await OutboxDB.add(db, "test_notice", recipients, {"text": "hi"}, dedup_key=key)
+        return await submit_write(_add)
+
+    async def _rows(self):
+        rows = await self.fetch(
+            "SELECT chat_id, status, attempts, available_at, lease_until FROM outbox ORDER BY chat_id"
+        )
+        return {row["chat_id"]: row for row in rows}
+
+    async def test_duplicate_notification_ignored(self):
+        self.assertEqual(await self._notify([100, 200]), 2)
+        self.assertEqual(await self._notify([100, 200]), 0)
+
+    async def test_lease(self):
+        await self._notify([100])
+        first = await OutboxDB.claim("a", 10, lease=0.1)
+        self.assertEqual([entry.chat_id for entry in first], [100])
+        # Строка в аренде у первого воркера
+        self.assertEqual(await OutboxDB.claim("b", 10, lease=60), [])
+
+        await asyncio.sleep(0.15)
+        second = await OutboxDB.claim("b", 10, lease=60)
+        self.assertEqual([entry.attempts for entry in second], [2])
+
+    async def test_delivery_and_permanent_error(self):
+        forbidden = lambda method: TelegramForbiddenError(method, "bot was blocked by the user")
+        bot = _Bot({200: forbidden})
+        await self._notify([100, 200])
+
+        worker = OutboxWorker(bot)
+        self.assertEqual(await worker.run_once(), 2)
+        rows = await self._rows()
+        self.assertEqual(bot.sent, [100])
+        self.assertEqual((rows[100]["status"], rows[200]["status"]), ("sent", "failed"))
+        self.assertEqual((worker.delivered, worker.failed, worker.retried), (1, 1, 0))
+
+    async def test_retry_backoff(self):
+        bot = _Bot({300: lambda method: RuntimeError("connection reset")})
+        await self._notify([300])
+
+        worker = OutboxWorker(bot, max_attempts=2)
+        started = time.time()
+        self.assertEqual(await worker.run_once(), 1)
+        row = (await self._rows())[300]
+        self.assertEqual((row["status"], row["attempts"], row["lease_until"]), ("pending", 1, 0))
+        self.assertGreaterEqual(row["available_at"], started + OUTBOX_RETRY_DELAY)
+        # До конца паузы строка не берется
+        self.assertEqual(await worker.run_once(), 0)
+
+        # Последняя попытка: строка отбрасывается
+        await submit_write(lambda db: db.execute("UPDATE outbox SET available_at = 0"))
+        self.assertEqual(await worker.run_once(), 1)
+        self.assertEqual((await self._rows())[300]["status"], "failed")
+        self.assertEqual((worker.retried, worker.failed), (1, 1))
+
+    async def test_retry_after_defers_row(self):
+        bot = _Bot({400: lambda method: TelegramRetryAfter(method, "Flood control", 120)})
+        await self._notify([400])
+
+        started = time.time()
+        await OutboxWorker(bot).run_once()
+        row = (await self._rows())[400]
+        self.assertEqual(row["status"], "pending")
+        self.assertGreaterEqual(row["available_at"], started + 120)
@@ -0,0 +1,63 @@
+"""
+Кэш ответов OpenAI (nlp/parse_cache.py): сообщения, отличающиеся только
+суммой, используют один ответ, а сообщения с разными реквизитами - нет.
+"""
+
+import unittest
+from unittest import mock
+
+try:
+    from nlp import parse_cache as cache_module
+except ModuleNotFoundError:
+    # Кэш импортирует слой базы данных, которому нужна конфигурация бота
+    cache_module = None
+
+
+@unittest.skipIf(cache_module is None, "nlp.parse_cache не импортируется")
+class ParseCacheTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.cache = cache_module.ParseCache(lru_size=100, enabled=True)
+        self.requests = []
+        # Таблица llm_cache не нужна: достаточно LRU в памяти
+        for name, value in (("get", None), ("put", 0)):
+            patcher = mock.patch.object(cache_module.LLMCacheDB, name,
+                                        mock.AsyncMock(return_value=value))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def _parse(self, parser, text, result):
+        async def request():
+            self.requests.append(text)
+            return result
+        return await self.cache.fetch(parser, "prompt", "marketer", text, request)
+
+    async def test_amount_substituted(self):
+        await self._parse("balance", "Пополни на 500", {"amount": 500})
+        value = await self._parse("balance", "пополни на 700!", {"amount": 0})
+        self.assertEqual(value, {"amount": 700})
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_details_not_shared(self):
+        first = {"amount": 50, "payment_details": "TXy7f9"}
+        await self._parse("payment", "Оплата 50$ на кошелек TXy7f9", first)
+        second = {"amount": 50, "payment_details": "txy7f9"}
+        value = await self._parse("payment", "оплата 50$ на кошелек txy7f9", second)
+        self.assertEqual(value["payment_details"], "txy7f9")
+
+        third = {"amount": 50, "payment_details": "pay-43@mail.ru"}
+        await self._parse("payment", "Оплата 50$ на pay-42@mail.ru", {"payment_details": "pay-42@mail.ru"})
+        value = await self._parse("payment", "Оплата 50$ на pay-43@mail.ru", third)
+        self.assertEqual(value["payment_details"], "pay-43@mail.ru")
+        self.assertEqual(len(self.requests), 4)
+
+    async def test_exact_parser_substitutes_standalone_numbers(self):
+        result = {"amount": 50, "payment_details": "+79001234567"}
+        await self._parse("unified", "Оплата 50$ по телефону +79001234567", result)
+        value = await self._parse("unified", "Оплата 70$ по телефону +79001234567", {})
+        self.assertEqual(value, {"amount": 70, "payment_details": "+79001234567"})
+        self.assertEqual(len(self.requests), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Маршрутизация сообщений (handlers/nlp_command_handler.route_message):
+операция, распознанная быстрым классификатором, возвращается обработчику
+в формате единого разбора, правила применяются к сообщению один раз.
+"""
+
+import unittest
+from unittest import mock
+
+from nlp import fast_classifier
+
+try:
+    from handlers import nlp_command_handler
+except ModuleNotFoundError:
+    # Обработчикам нужна конфигурация бота
+    nlp_command_handler = None
+
+
+@unittest.skipIf(nlp_command_handler is None, "обработчики не импортируются")
+class RouteMessageTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        config = mock.Mock()
+        config.return_value.get_user_role.return_value = "manager"
+        classifier = fast_classifier.FastIntentClassifier()
+        for patcher in (mock.patch.object(nlp_command_handler, "Config", config),
+                        mock.patch.object(fast_classifier, "fast_classifier", classifier),
+                        mock.patch.object(fast_classifier, "FAST_CLASSIFIER_ENABLED", True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.classifier = classifier
+
+    def _message(self, text):
+        message = mock.Mock(text=text)
+        message.from_user.id = 4
+        return message
+
+    async def test_operation_passed_to_handler(self):
+        handled, parsed = await nlp_command_handler.route_message(self._message("пополни на 500"))
+        self.assertFalse(handled)
+        self.assertIsNone(parsed["command"])
+        self.assertEqual(parsed["operation"]["operation_type"], "balance_add")
+        self.assertEqual(parsed["operation"]["amount"], 500)
+        self.assertEqual(self.classifier.messages, 1)
+
+    async def test_command_handled(self):
+        with mock.patch.object(nlp_command_handler, "nlp_command_handler", mock.AsyncMock()) as handler:
+            handled, parsed = await nlp_command_handler.route_message(self._message("баланс"))
+        self.assertTrue(handled)
+        self.assertIsNone(parsed)
+        self.assertEqual(handler.await_args.args[1]["command"], "balance")
+        self.assertEqual(self.classifier.messages, 1)
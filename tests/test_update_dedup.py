@@ -0,0 +1,60 @@
+"""
+Отсев повторных доставок обновлений (db/dedup.py): update_id занимается один
+раз, повтор отсеивается через LRU или таблицу, после release и по истечении
+TTL обновление занимается заново.
+"""
+
+import asyncio
+
+from tests.db_case import DatabaseTestCase, requires_database
+
+try:
+    from db.dedup import UpdateDedup
+except ModuleNotFoundError:
+    pass
+
+
+@requires_database
+class UpdateDedupTest(DatabaseTestCase):
+
+    async def test_duplicate_in_memory(self):
+        dedup = UpdateDedup()
+        self.assertTrue(await dedup.claim(1))
+        self.assertFalse(await dedup.claim(1))
+        self.assertEqual(dedup.stats()["duplicates_memory"], 1)
+
+    async def test_duplicate_in_other_instance(self):
+        # Другой экземпляр функции видит обновление только в таблице
+        self.assertTrue(await UpdateDedup().claim(1))
+        other = UpdateDedup()
+        self.assertFalse(await other.claim(1))
+        self.assertEqual(other.stats()["duplicates_db"], 1)
+
+    async def test_concurrent_claim(self):
+        dedup = UpdateDedup()
+        results = await asyncio.gather(*(dedup.claim(1) for _ in range(5)))
+        self.assertEqual(results.count(True), 1)
+
+    async def test_release(self):
+        dedup = UpdateDedup()
+        self.assertTrue(await dedup.claim(1))
+        await dedup.release(1)
+        self.assertTrue(await UpdateDedup().claim(1))
+        self.assertFalse(await dedup.claim(1))
+
+    async def test_reclaim_after_ttl(self):
+        dedup = UpdateDedup(ttl=0.05)
+        self.assertTrue(await dedup.claim(1))
+        await asyncio.sleep(0.1)
+        self.assertTrue(await dedup.claim(1))
+        # Повторное занятие обновило время: другой экземпляр видит повтор
+        self.assertFalse(await UpdateDedup(ttl=0.05).claim(1))
+
+    async def test_lru_eviction_falls_back_to_table(self):
+        dedup = UpdateDedup(lru_size=2)
+        for update_id in (1, 2, 3):
+            self.assertTrue(await dedup.claim(update_id))
+        self.assertEqual(dedup.stats()["lru_size"], 2)
+        # 1 вытеснен из LRU, но занят в таблице
+        self.assertFalse(await dedup.claim(1))
+        self.assertEqual(dedup.stats()["duplicates_db"], 1)
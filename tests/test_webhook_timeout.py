@@ -0,0 +1,128 @@
+"""
+Обновление, обработка которого прервана по WEBHOOK_HANDLER_TIMEOUT,
+освобождается в таблице принятых обновлений: повторная доставка Telegram
+обрабатывает его заново, а не отвечает {"duplicate": True}. Если таймаут
+наступил после обработки (при доставке уведомлений), обновление остается
+принятым: повторная обработка создала бы дубли заявок и пополнений.
+"""
+
+import time
+import asyncio
+import unittest
+from unittest import mock
+
+import api.index as webhook
+from utils.background_loop import BackgroundLoop
+
+
+class _Dispatcher:
+    """Диспетчер, обработка которого длится feed_delay секунд"""
+
+    storage = None
+
+    def __init__(self, feed_delay=60.0):
+        self.message = mock.Mock(handlers=[object()])
+        self.feed_delay = feed_delay
+        self.fed = 0
+
+    async def feed_update(self, bot, update):
+        await asyncio.sleep(self.feed_delay)
+        self.fed += 1
+
+
+async def _slow_delivery(bot):
+    """Доставка уведомлений, ожидающая flood control"""
+    await asyncio.sleep(60)
+
+
+class WebhookTimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = BackgroundLoop("test-loop")
+        self.loop.start()
+        self.claimed = set()
+        self.released = []
+
+        self.dispatcher = _Dispatcher()
+
+        async def init_bot():
+            return object(), self.dispatcher
+
+        async def claim(update_id):
+            if update_id in self.claimed:
+                return False
+            self.claimed.add(update_id)
+            return True
+
+        async def release(update_id):
+            self.claimed.discard(update_id)
+            self.released.append(update_id)
+
+        self.handler = webhook.handler.__new__(webhook.handler)
+        self.handler._claim_update = claim
+        self.handler._release_update = release
+        patcher = mock.patch.object(webhook, "init_bot", init_bot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.loop.stop()
+
+    def _wait_released(self, count, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while len(self.released) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_timeout_releases_update(self):
+        data = {"update_id": 42}
+        with self.assertRaises(TimeoutError):
+            self.loop.run(self.handler._handle_webhook(data), timeout=0.1)
+
+        # Отмена доставляется в loop асинхронно
+        self._wait_released(1)
+        self.assertEqual(self.released, [42])
+        self.assertNotIn(42, self.claimed)
+
+    def test_retry_after_timeout_is_not_duplicate(self):
+        data = {"update_id": 7}
+        with self.assertRaises(TimeoutError):
+            self.loop.run(self.handler._handle_webhook(data), timeout=0.1)
+        self._wait_released(1)
+
+        # Повторная доставка занимает обновление заново и снова уходит в обработку
+        with self.assertRaises(TimeoutError):
+            self.loop.run(self.handler._handle_webhook(data), timeout=0.1)
+        self._wait_released(2)
+        self.assertEqual(self.released, [7, 7])
+
+    def test_timeout_during_delivery_keeps_claim(self):
+        self.dispatcher.feed_delay = 0
+        with mock.patch.object(webhook, "deliver_notifications", _slow_delivery):
+            with self.assertRaises(TimeoutError):
+                self.loop.run(self.handler._handle_webhook({"update_id": 9}), timeout=0.2)
+            time.sleep(0.2)
+
+        self.assertEqual(self.dispatcher.fed, 1)
+        self.assertEqual(self.released, [])
+        self.assertIn(9, self.claimed)
+
+    def test_delivery_limited_by_handler_timeout(self):
+        self.dispatcher.feed_delay = 0
+        with mock.patch.object(webhook, "deliver_notifications", _slow_delivery), \
+                mock.patch.object(webhook, "WEBHOOK_HANDLER_TIMEOUT", 0.3), \
+                mock.patch.object(webhook, "WEBHOOK_DELIVERY_RESERVE", 0.1):
+            # Ответ приходит до таймаута фонового loop, а не через 60 секунд доставки
+            result = self.loop.run(self.handler._handle_webhook({"update_id": 11}), timeout=10)
+
+        self.assertEqual(result, {"ok": True})
+        self.assertEqual(self.released, [])
+
+    def test_duplicate_is_not_released(self):
+        self.claimed.add(5)
+        result = self.loop.run(self.handler._handle_webhook({"update_id": 5}), timeout=1)
+        self.assertEqual(result, {"ok": True, "duplicate": True})
+        self.assertEqual(self.released, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+"""
+Прием обновлений ASGI-приложением (webhook/asgi.py) в режиме очереди:
+некорректное обновление получает 400 и не занимается и не ставится в очередь.
+"""
+
+import unittest
+from unittest import mock
+
+try:
+    from webhook import asgi
+except ModuleNotFoundError:
+    # Приложению нужны FastAPI и конфигурация бота
+    asgi = None
+
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 1700000000,
+        "chat": {"id": 5, "type": "private"},
+        "from": {"id": 5, "is_bot": False, "first_name": "Test"},
+        "text": "баланс",
+    },
+}
+
+
+@unittest.skipIf(asgi is None, "webhook.asgi не импортируется")
+class WebhookValidationTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.queue = mock.Mock(depth=0, max_size=10, enqueue=mock.AsyncMock())
+        self.claim = mock.AsyncMock(return_value=True)
+        patcher = mock.patch.object(asgi, "_claim_update", self.claim)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _post(self, data):
+        request = mock.Mock(json=mock.AsyncMock(return_value=data))
+        request.app.state.queue = self.queue
+        return await asgi.webhook(request)
+
+    async def test_valid_update_queued(self):
+        self.assertEqual(await self._post(UPDATE), {"ok": True, "queued": True})
+        self.queue.enqueue.assert_awaited_once_with(UPDATE)
+
+    async def test_invalid_update_rejected(self):
+        for data in ({"update_id": "x"}, {"message": {"text": "без обновления"}}, [1, 2]):
+            response = await self._post(data)
+            self.assertEqual(response.status_code, 400)
+        self.claim.assert_not_awaited()
+        self.queue.enqueue.assert_not_awaited()
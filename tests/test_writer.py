@@ -0,0 +1,44 @@
+"""
+Писатель процесса (db/writer.py): при смене пула замененный писатель
+выполняет оставшиеся команды и останавливается, а не остается висеть.
+"""
+
+import asyncio
+from unittest import mock
+
+from tests.db_case import DatabaseTestCase, requires_database
+
+try:
+    from db import writer as writer_module
+except ModuleNotFoundError:
+    pass
+
+
+@requires_database
+class WriterSwapTest(DatabaseTestCase):
+
+    async def test_replaced_writer_is_drained(self):
+        old = await writer_module.get_writer()
+
+        async def _insert(db):
+            await db.execute("INSERT INTO processed_updates (update_id, received_at) VALUES (1, 0)")
+            return "done"
+
+        pending = asyncio.ensure_future(old.submit(_insert))
+        await asyncio.sleep(0)
+
+        # Пул сменился: get_writer создает новый писатель и останавливает старый
+        with mock.patch.object(writer_module, "get_pool", mock.AsyncMock(return_value=mock.Mock())):
+            new = await writer_module.get_writer()
+
+        self.assertIsNot(new, old)
+        self.assertEqual(await pending, "done")
+        self.assertTrue(old._task.done())
+        self.assertEqual(len(await self.fetch("SELECT * FROM processed_updates")), 1)
+
+    async def test_concurrent_swap_creates_one_writer(self):
+        await writer_module.get_writer()
+        other_pool = mock.Mock()
+        with mock.patch.object(writer_module, "get_pool", mock.AsyncMock(return_value=other_pool)):
+            writers = await asyncio.gather(*(writer_module.get_writer() for _ in range(5)))
+        self.assertEqual(len({id(writer) for writer in writers}), 1)
@@ -0,0 +1,289 @@
+"""
+Постоянный event loop в фоновом потоке.
+Serverless-обработчик (api/index.py) раньше создавал и закрывал новый loop
+на каждый webhook: сессия aiohttp кэшированного Bot, пул соединений с базой
+и клиенты OpenAI пересоздавались, и каждое обновление платило за новое
+TLS-соединение с api.telegram.org. Теперь теплый экземпляр держит один
+loop на все время жизни процесса, а обработчики HTTP-запросов передают
+в него корутины и ждут результат.
+
+Сравнение холодных и теплых вызовов:
+    python -m utils.background_loop --bench [--requests 20] [--url https://api.telegram.org]
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundLoop:
+    """Event loop, работающий в отдельном потоке до завершения процесса"""
+
+    def __init__(self, name: str = "background-loop"):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        """Поток и loop работают"""
+        return (self._thread is not None and self._thread.is_alive()
+                and self.loop is not None and self.loop.is_running())
+
+    def start(self):
+        """Запуск потока (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self.is_running:
+                return
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            self._ready.wait()
+            logger.info(f"Фоновый event loop запущен ({self.name})")
+
+    def _run(self):
+        """Тело потока: loop работает, пока не будет вызван stop()"""
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.loop = loop
+        loop.call_soon(self._ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                pending = asyncio.all_tasks(loop)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """Передача корутины в loop без ожидания результата"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """
+        Выполнение корутины в фоновом loop с ожиданием результата
+
+        Args:
+            coro: Корутина
+            timeout: Максимальное время ожидания (секунды); по истечении
+                корутина отменяется и выбрасывается TimeoutError
+
+        Raises:
+            RuntimeError: Если вызвано из потока самого loop (взаимоблокировка)
+        """
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("Нельзя ждать фоновый loop из его собственного потока")
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Корутина не завершилась за {timeout} с")
+
+    def stop(self, shutdown: Optional[Callable[[], Awaitable[Any]]] = None, timeout: float = 10.0):
+        """
+        Остановка loop
+
+        Args:
+            shutdown: Корутинная функция освобождения ресурсов (закрытие сессий,
+                пула соединений), выполняется в loop перед остановкой
+            timeout: Максимальное время ожидания остановки (секунды)
+        """
+        with self._lock:
+            if not self.is_running:
+                return
+            loop, thread = self.loop, self._thread
+
+        if shutdown is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+            except Exception as e:
+                logger.warning(f"Ошибка освобождения ресурсов фонового loop: {e}")
+
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        logger.info(f"Фоновый event loop остановлен ({self.name})")
+
+
+# Loop процесса
+_background_loop: Optional[BackgroundLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Общий фоновый loop процесса (запускается при первом обращении)"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = BackgroundLoop("bot-loop")
+    _background_loop.start()
+    return _background_loop
+
+
+def run_in_background_loop(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Выполнение корутины в общем фоновом loop"""
+    return get_background_loop().run(coro, timeout)
+
+
+def stop_background_loop(shutdown: Optional[Callable[[], Awaitable[Any]]] = None):
+    """Остановка общего фонового loop, если он был запущен"""
+    if _background_loop is not None:
+        _background_loop.stop(shutdown)
+
+
+# --- Нагрузочный тест ---------------------------------------------------------
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль в миллисекундах"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+def _summary(latencies: List[float], errors: int) -> Dict[str, Any]:
+    """Холодный (первый) вызов и теплые вызовы"""
+    warm = latencies[1:]
+    return {
+        "cold_ms": latencies[0] * 1000 if latencies else 0.0,
+        "warm_p50_ms": _percentile(warm, 0.50),
+        "warm_p95_ms": _percentile(warm, 0.95),
+        "warm_max_ms": max(warm, default=0.0) * 1000,
+        "errors": errors,
+    }
+
+
+async def _http_probe(session, url: str):
+    """Один HTTPS-запрос (стоимость соединения с Telegram)"""
+    async with session.get(url) as response:
+        await response.read()
+
+
+def run_benchmark(requests: int = 20, url: Optional[str] = "https://api.telegram.org") -> Dict[str, Dict[str, Any]]:
+    """
+    Сравнение нового loop на каждый вызов (прежний режим) и постоянного loop
+
+    Для каждого режима измеряется пустой вызов (накладные расходы loop) и,
+    если задан url, HTTPS-запрос: в прежнем режиме сессия aiohttp и
+    TLS-соединение создаются заново, в постоянном - переиспользуются.
+    """
+    results = {}
+
+    async def noop():
+        return None
+
+    # Прежний режим: новый loop на каждый вызов
+    latencies = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(noop())
+        finally:
+            loop.close()
+        latencies.append(time.perf_counter() - started)
+    results["per-request loop, no-op"] = _summary(latencies, 0)
+
+    # Постоянный loop
+    background = BackgroundLoop("bench-loop")
+    started = time.perf_counter()
+    background.start()
+    latencies = []
+    for index in range(requests):
+        if index:
+            started = time.perf_counter()
+        background.run(noop())
+        latencies.append(time.perf_counter() - started)
+    results["persistent loop, no-op"] = _summary(latencies, 0)
+
+    if url:
+        import aiohttp
+
+        async def fresh_session_probe():
+            async with aiohttp.ClientSession() as session:
+                await _http_probe(session, url)
+
+        latencies, errors = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(fresh_session_probe())
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                logger.warning(f"Ошибка запроса к {url}: {e}")
+            finally:
+                loop.close()
+        results["per-request loop, HTTPS"] = _summary(latencies, errors)
+
+        holder: Dict[str, Any] = {}
+
+        async def shared_session_probe():
+            if "session" not in holder:
+                holder["session"] = aiohttp.ClientSession()
+            await _http_probe(holder["session"], url)
+
+        async def close_session():
+            if "session" in holder:
+                await holder["session"].close()
+
+        latencies, errors = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                background.run(shared_session_probe())
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                logger.warning(f"Ошибка запроса к {url}: {e}")
+        results["persistent loop, HTTPS"] = _summary(latencies, errors)
+        background.stop(close_session)
+    else:
+        background.stop()
+
+    return results
+
+
+def _main(argv: List[str]) -> int:
+    """Командная строка нагрузочного теста"""
+    parser = argparse.ArgumentParser(prog="python -m utils.background_loop",
+                                     description="Холодные и теплые вызовы: новый loop на запрос против постоянного")
+    parser.add_argument("--bench", action="store_true", help="запустить тест")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--url", default="https://api.telegram.org",
+                        help="адрес для HTTPS-запросов (пустая строка - без сети)")
+    args = parser.parse_args(argv)
+
+    if not args.bench:
+        parser.print_help()
+        return 2
+
+    results = run_benchmark(args.requests, args.url or None)
+    for name, result in results.items():
+        print(f"\n{name}")
+        print(f"  холодный: {result['cold_ms']:.2f} мс")
+        print(f"  теплые: p50 {result['warm_p50_ms']:.2f} мс, p95 {result['warm_p95_ms']:.2f} мс, "
+              f"max {result['warm_max_ms']:.2f} мс, ошибок {result['errors']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
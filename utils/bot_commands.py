@@ -44,12 +44,15 @@ class BotCommandManager:
             ],
             "financier": [
                 BotCommand(command="balance", description="💰 Показать баланс"),
+                BotCommand(command="pending", description="⏳ Ожидающие заявки"),
             ],
             "manager": [
                 BotCommand(command="balance", description="💰 Показать баланс"),
                 BotCommand(command="stats", description="📊 Статистика системы"),
+                BotCommand(command="pending", description="⏳ Ожидающие заявки"),
                 BotCommand(command="ai", description="🤖 AI-помощник для аналитики"),
                 BotCommand(command="dashboard", description="📊 Веб-дашборд аналитики"),
+                BotCommand(command="dbstats", description="🗄 Статистика запросов к базе"),
                 BotCommand(command="resetbalance", description="⚠️ Обнулить баланс"),
             ]
         }
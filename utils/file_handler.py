@@ -4,7 +4,6 @@
 """
 
 import os
-import aiofiles
 import logging
 from datetime import datetime
 from typing import Optional
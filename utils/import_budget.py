@@ -0,0 +1,143 @@
+"""
+Бюджет времени импорта при холодном старте.
+Модули запускаются в отдельном интерпретаторе с -X importtime, отчет
+показывает, какие пакеты занимают время, и сравнивает итог с бюджетом.
+Проверяются два этапа:
+- health: импорт api/index.py (ответ health check без инициализации бота);
+- init: модули, которые импортирует init_bot (база, обработчики, команды).
+Тяжелые модули из LAZY_MODULES (openai) должны импортироваться только при
+первом использовании; их появление при старте считается нарушением.
+
+Запуск (код возврата 1 при превышении бюджета, удобно для CI):
+    python -m utils.import_budget [--stage health|init] [--runs 3] [--top 10]
+        [--health-budget-ms 300] [--init-budget-ms 3000]
+Тот же запуск выполняет tests/test_import_budget.py.
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Бюджеты этапов (мс)
+STARTUP_HEALTH_BUDGET_MS = float(os.getenv("STARTUP_HEALTH_BUDGET_MS", "300"))
+STARTUP_INIT_BUDGET_MS = float(os.getenv("STARTUP_INIT_BUDGET_MS", "3000"))
+
+# Модули этапов
+HEALTH_MODULES = ["api.index"]
+INIT_MODULES = [
+    "db.database",
+    "handlers.common",
+    "handlers.command_handlers",
+    "handlers.menu_handler",
+    "handlers.voice_handler",
+    "handlers.marketer",
+    "handlers.financier",
+    "handlers.manager",
+    "utils.bot_commands",
+]
+
+# Модули, которые не должны импортироваться при старте
+LAZY_MODULES = ["openai"]
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Разбор вывода -X importtime
+
+    Returns:
+        Список (модуль, собственное время мкс, накопленное время мкс, вложенность)
+    """
+    entries = []
+    for line in output.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            # Корневые модули выводятся с одним пробелом, каждый уровень - плюс два
+            depth = (len(match.group(3)) - 1) // 2
+            entries.append((match.group(4), int(match.group(1)), int(match.group(2)), depth))
+    return entries
+
+
+def measure(modules: List[str], preload: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Импорт modules в новом интерпретаторе
+
+    Модули preload импортируются заранее и в отчет не входят.
+    """
+    preload = preload or []
+    code = "".join(f"import {name}\n" for name in preload)
+    code += "import sys\nsys.stderr.write('---\\n')\n"
+    code += "".join(f"import {name}\n" for name in modules)
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            cwd=ROOT_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт завершился с ошибкой:\n{result.stderr[-2000:]}")
+
+    output = result.stderr.split("---\n", 1)[-1]
+    entries = parse_importtime(output)
+    total_us = sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+
+    # Собственное время по пакетам верхнего уровня
+    packages: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        packages[name.split(".")[0]] += self_us
+
+    return {
+        "total_ms": total_us / 1000,
+        "modules": {name for name, _, _, _ in entries},
+        "packages": sorted(((name, us / 1000) for name, us in packages.items()),
+                           key=lambda item: item[1], reverse=True),
+    }
+
+
+def check_stage(name: str, modules: List[str], budget_ms: float, runs: int = 3, top: int = 10,
+                preload: Optional[List[str]] = None) -> bool:
+    """Лучший из runs замеров этапа, отчет и проверка бюджета"""
+    best = None
+    for _ in range(max(1, runs)):
+        report = measure(modules, preload)
+        if best is None or report["total_ms"] < best["total_ms"]:
+            best = report
+
+    lazy_loaded = [module for module in LAZY_MODULES if module in best["modules"]]
+    within = best["total_ms"] <= budget_ms and not lazy_loaded
+
+    print(f"\n[{name}] {best['total_ms']:.1f} мс (бюджет {budget_ms:.0f} мс) - "
+          f"{'OK' if within else 'ПРЕВЫШЕН'}")
+    for package, ms in best["packages"][:top]:
+        print(f"  {package:<30} {ms:8.1f} мс")
+    if lazy_loaded:
+        print(f"  Импортированы при старте (должны быть ленивыми): {', '.join(lazy_loaded)}")
+    return within
+
+
+def _main(argv: List[str]) -> int:
+    """Командная строка отчета"""
+    parser = argparse.ArgumentParser(prog="python -m utils.import_budget",
+                                     description="Время импорта при холодном старте и проверка бюджета")
+    parser.add_argument("--stage", choices=("health", "init"), help="только один этап")
+    parser.add_argument("--runs", type=int, default=3, help="замеров на этап (берется лучший)")
+    parser.add_argument("--top", type=int, default=10, help="пакетов в отчете")
+    parser.add_argument("--health-budget-ms", type=float, default=STARTUP_HEALTH_BUDGET_MS)
+    parser.add_argument("--init-budget-ms", type=float, default=STARTUP_INIT_BUDGET_MS)
+    args = parser.parse_args(argv)
+
+    ok = True
+    if args.stage in (None, "health"):
+        ok &= check_stage("health", HEALTH_MODULES, args.health_budget_ms, args.runs, args.top)
+    if args.stage in (None, "init"):
+        ok &= check_stage("init", INIT_MODULES, args.init_budget_ms, args.runs, args.top,
+                          preload=HEALTH_MODULES)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -5,6 +5,7 @@
 
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
+from typing import List, Optional, Tuple
 
 
 def get_main_menu_keyboard(user_role: str) -> ReplyKeyboardMarkup:
@@ -175,4 +176,58 @@ def remove_keyboard() -> ReplyKeyboardMarkup:
         keyboard=[],
         resize_keyboard=True,
         one_time_keyboard=True
-    )
\ No newline at end of file
+    )
+
+
+def build_page_callback(prefix: str, page: int, created_at: str, payment_id: int) -> str:
+    """
+    Формирует callback_data кнопки следующей страницы списка заявок
+
+    Args:
+        prefix: Префикс списка (например, "mypay:pending")
+        page: Номер следующей страницы
+        created_at: created_at последней показанной заявки
+        payment_id: ID последней показанной заявки
+
+    Returns:
+        Строка вида "<prefix>:<page>:<id>:<created_at>"
+    """
+    return f"{prefix}:{page}:{payment_id}:{created_at}"
+
+
+def parse_page_callback(prefix: str, callback_data: str) -> Optional[Tuple[int, str, int]]:
+    """
+    Разбирает callback_data кнопки следующей страницы
+
+    Returns:
+        (номер страницы, created_at, id) или None, если данные не подходят
+    """
+    if not callback_data.startswith(f"{prefix}:"):
+        return None
+    try:
+        # created_at содержит двоеточия, поэтому он идет последним
+        page, payment_id, created_at = callback_data[len(prefix) + 1:].split(":", 2)
+        return int(page), created_at, int(payment_id)
+    except ValueError:
+        return None
+
+
+def get_page_navigation_keyboard(buttons: List[Tuple[str, str]]) -> Optional[InlineKeyboardMarkup]:
+    """
+    Клавиатура перехода по страницам списка заявок
+
+    Args:
+        buttons: Список (текст кнопки, callback_data)
+
+    Returns:
+        InlineKeyboardMarkup или None, если кнопок нет
+    """
+    if not buttons:
+        return None
+
+    builder = InlineKeyboardBuilder()
+    for text, callback_data in buttons:
+        builder.add(InlineKeyboardButton(text=text, callback_data=callback_data))
+    builder.adjust(1)
+
+    return builder.as_markup()
@@ -0,0 +1,403 @@
+"""
+Планировщик исходящих сообщений Telegram.
+Уведомления записываются в outbox (db/outbox.py), а воркер доставки
+(utils/outbox.py) рассылает их через broadcast() этого модуля. Все
+исходящие запросы проходят через одну очередь:
+- общий лимит бота (OUTBOUND_GLOBAL_RATE в секунду) и лимит каждого чата
+  (OUTBOUND_CHAT_RATE в секунду для личных чатов, OUTBOUND_GROUP_RATE в минуту
+  для групп) соблюдаются через token bucket;
+- при TelegramRetryAfter чат и общий лимит бота приостанавливаются на
+  retry_after секунд, затем запрос повторяется; пауза длиннее max_retry_after
+  не ожидается - ошибка возвращается вызывающему (outbox откладывает строку
+  на retry_after). Serverless-обработчик уменьшает предел до
+  OUTBOUND_REQUEST_MAX_RETRY_AFTER, чтобы пауза не съела время запроса; сетевые ошибки и 5xx повторяются с нарастающей паузой;
+- сообщения разным чатам отправляются параллельно (не больше
+  OUTBOUND_CONCURRENCY запросов одновременно), одному чату - по порядку.
+
+broadcast() отправляет одно сообщение нескольким получателям параллельно
+(не больше OUTBOUND_BROADCAST_CONCURRENCY запросов рассылки одновременно)
+и возвращает результат по каждому получателю: воркер outbox по нему
+отмечает строки доставленными, откладывает повтор или отбрасывает их.
+Serverless-обработчик перед ответом Telegram вызывает drain_outbound():
+после ответа экземпляр замораживается.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramMigrateToChat,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import SendMessage, TelegramMethod
+
+logger = logging.getLogger(__name__)
+
+
+# Общий лимит запросов бота (в секунду)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+
+# Лимит сообщений в личный чат (в секунду) и допустимая пачка
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+
+# Лимит сообщений в группу (в минуту)
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", "20"))
+
+# Максимум одновременных запросов к Telegram
+OUTBOUND_CONCURRENCY = int(os.getenv("OUTBOUND_CONCURRENCY", "10"))
+
+# Попыток отправки (сетевые ошибки, ошибки сервера Telegram, flood control)
+OUTBOUND_MAX_ATTEMPTS = int(os.getenv("OUTBOUND_MAX_ATTEMPTS", "5"))
+
+# Максимальная пауза retry_after, которую планировщик готов ждать (секунды)
+OUTBOUND_MAX_RETRY_AFTER = float(os.getenv("OUTBOUND_MAX_RETRY_AFTER", "60"))
+
+# То же внутри serverless-запроса (должно быть заметно меньше WEBHOOK_HANDLER_TIMEOUT)
+OUTBOUND_REQUEST_MAX_RETRY_AFTER = float(os.getenv("OUTBOUND_REQUEST_MAX_RETRY_AFTER", "5"))
+
+# Максимум одновременных запросов одной рассылки (остальные ждут своей очереди,
+# не занимая планировщик перед сообщениями других чатов)
+OUTBOUND_BROADCAST_CONCURRENCY = int(os.getenv("OUTBOUND_BROADCAST_CONCURRENCY", "5"))
+
+# Начальная пауза перед повтором после сетевой ошибки (секунды, удваивается)
+OUTBOUND_RETRY_DELAY = 0.5
+
+
+class TokenBucket:
+    """Token bucket с резервированием: ожидающие получают токены по очереди"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """Резервирование токена; возвращает паузу до его появления (секунды)"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    async def acquire(self):
+        """Ожидание токена"""
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block(self, seconds: float):
+        """Приостановка на seconds (retry_after от Telegram)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        """Bucket полон и не приостановлен (его можно удалить)"""
+        now = time.monotonic()
+        return (now >= self.blocked_until
+                and self.tokens + (now - self.updated) * self.rate >= self.capacity)
+
+
+class _Outgoing:
+    """Запрос в очереди"""
+
+    __slots__ = ("bot", "method", "future", "enqueued_at")
+
+    def __init__(self, bot: Bot, method: TelegramMethod, future: asyncio.Future):
+        self.bot = bot
+        self.method = method
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class OutboundScheduler:
+    """Очередь исходящих запросов с лимитами, повторами и параллельностью по чатам"""
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE,
+                 chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: int = OUTBOUND_CHAT_BURST,
+                 group_rate_per_minute: float = OUTBOUND_GROUP_RATE,
+                 concurrency: int = OUTBOUND_CONCURRENCY,
+                 max_attempts: int = OUTBOUND_MAX_ATTEMPTS,
+                 max_retry_after: float = OUTBOUND_MAX_RETRY_AFTER):
+        if concurrency < 1:
+            raise ValueError("Ограничение параллельности должно быть не меньше 1")
+
+        self.loop = asyncio.get_running_loop()
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate_per_minute / 60
+        self.max_attempts = max_attempts
+        self.max_retry_after = max_retry_after
+        self.concurrency = concurrency
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._queues: Dict[Any, Deque[_Outgoing]] = {}
+        self._workers: Dict[Any, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.retry_after = 0
+        self.in_flight = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.broadcasts = 0
+        self.broadcast_total = 0.0
+        self.broadcast_max = 0.0
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        """Лимит чата: группы (отрицательный id) и каналы - в минуту, личные чаты - в секунду"""
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or (chat_id is not None and chat_id < 0)
+            if is_group:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def submit(self, bot: Bot, method: TelegramMethod) -> asyncio.Future:
+        """
+        Постановка запроса в очередь его чата
+
+        Returns:
+            Future с результатом запроса (или исключением после исчерпания попыток)
+        """
+        chat_id = getattr(method, "chat_id", None)
+        item = _Outgoing(bot, method, self.loop.create_future())
+        self._queues.setdefault(chat_id, deque()).append(item)
+        if chat_id not in self._workers:
+            self._workers[chat_id] = self.loop.create_task(self._drain_chat(chat_id))
+        return item.future
+
+    @property
+    def depth(self) -> int:
+        """Запросов в очередях (включая отправляемые)"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def _drain_chat(self, chat_id: Any):
+        """Отправка очереди чата по порядку"""
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                item = queue[0]
+                try:
+                    result = await self._send(chat_id, item)
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Не удалось отправить {type(item.method).__name__} в чат {chat_id}: {e}")
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                else:
+                    self.sent += 1
+                    latency = time.perf_counter() - item.enqueued_at
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                    if not item.future.done():
+                        item.future.set_result(result)
+                finally:
+                    queue.popleft()
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is not None and bucket.idle:
+                del self._chat_buckets[chat_id]
+
+    async def _send(self, chat_id: Any, item: _Outgoing) -> Any:
+        """Отправка с соблюдением лимитов и повторами"""
+        attempt = 0
+        while True:
+            bucket = self._chat_bucket(chat_id)
+            await bucket.acquire()
+            await self._global.acquire()
+            async with self._semaphore:
+                self.in_flight += 1
+                try:
+                    return await item.bot(item.method)
+                except TelegramRetryAfter as e:
+                    # Flood control: чат ждет столько, сколько попросил Telegram;
+                    # общий лимит тоже приостанавливается, иначе остальные чаты
+                    # продолжают отправку и тоже получают 429
+                    self.retry_after += 1
+                    attempt += 1
+                    self._global.block(min(e.retry_after, self.max_retry_after))
+                    if e.retry_after > self.max_retry_after or attempt >= self.max_attempts:
+                        raise
+                    logger.warning(f"Flood control для чата {chat_id}: повтор через {e.retry_after} с")
+                    bucket.block(e.retry_after)
+                    continue
+                except TelegramMigrateToChat as e:
+                    # Группа стала супергруппой: отправляем в новый чат
+                    item.method.chat_id = e.migrate_to_chat_id
+                    chat_id = e.migrate_to_chat_id
+                    continue
+                except (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError) as e:
+                    attempt += 1
+                    if attempt >= self.max_attempts:
+                        raise
+                    self.retried += 1
+                    delay = OUTBOUND_RETRY_DELAY * 2 ** (attempt - 1)
+                    logger.warning(f"Ошибка отправки в чат {chat_id} (попытка {attempt}): {e}; "
+                                   f"повтор через {delay:.1f} с")
+                finally:
+                    self.in_flight -= 1
+            await asyncio.sleep(delay)
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Ожидание отправки всех запросов в очереди
+
+        Returns:
+            True, если очередь опустела за timeout
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._workers:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.wait(list(self._workers.values()), timeout=remaining)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики отправки (время в миллисекундах)"""
+        return {
+            "queued": self.depth,
+            "chats_active": len(self._workers),
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "retry_after": self.retry_after,
+            "latency_avg_ms": round(self.latency_total / self.sent * 1000, 1) if self.sent else 0.0,
+            "latency_max_ms": round(self.latency_max * 1000, 1),
+            "broadcasts": self.broadcasts,
+            "broadcast_avg_ms": (round(self.broadcast_total / self.broadcasts * 1000, 1)
+                                 if self.broadcasts else 0.0),
+            "broadcast_max_ms": round(self.broadcast_max * 1000, 1),
+        }
+
+    def record_broadcast(self, elapsed: float):
+        """Учет времени рассылки"""
+        self.broadcasts += 1
+        self.broadcast_total += elapsed
+        self.broadcast_max = max(self.broadcast_max, elapsed)
+
+
+class BroadcastResult:
+    """Результат рассылки: ответ или ошибка по каждому получателю"""
+
+    __slots__ = ("delivered", "failed", "elapsed")
+
+    def __init__(self):
+        self.delivered: Dict[Any, Any] = {}
+        self.failed: Dict[Any, BaseException] = {}
+        self.elapsed = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """Доставлено всем получателям"""
+        return not self.failed
+
+    def outcome(self, chat_id: Any) -> Optional[BaseException]:
+        """Ошибка доставки получателю (None - доставлено)"""
+        return self.failed.get(chat_id)
+
+    def __repr__(self) -> str:
+        return (f"BroadcastResult(delivered={len(self.delivered)}, failed={len(self.failed)}, "
+                f"elapsed_ms={self.elapsed * 1000:.1f})")
+
+
+# Планировщик процесса (привязан к event loop, в котором создан)
+_scheduler: Optional[OutboundScheduler] = None
+_max_retry_after = OUTBOUND_MAX_RETRY_AFTER
+
+
+def get_outbound() -> OutboundScheduler:
+    """Планировщик текущего event loop"""
+    global _scheduler
+    if _scheduler is None or _scheduler.loop is not asyncio.get_running_loop():
+        _scheduler = OutboundScheduler(max_retry_after=_max_retry_after)
+    return _scheduler
+
+
+def set_max_retry_after(seconds: float):
+    """Предел ожидания flood control для планировщика процесса"""
+    global _max_retry_after
+    _max_retry_after = seconds
+    if _scheduler is not None:
+        _scheduler.max_retry_after = seconds
+
+
+async def broadcast(bot: Bot, chat_ids: Iterable[Any], text: str,
+                    concurrency: int = OUTBOUND_BROADCAST_CONCURRENCY,
+                    **kwargs) -> BroadcastResult:
+    """
+    Отправка одного сообщения нескольким получателям
+
+    Текст формируется вызывающим один раз; получатели обслуживаются
+    параллельно, но не больше concurrency одновременно. Ошибка одного
+    получателя не прерывает рассылку.
+
+    Args:
+        chat_ids: Получатели (повторы отбрасываются)
+        concurrency: Максимум одновременных запросов рассылки
+        **kwargs: Параметры SendMessage (parse_mode, reply_markup, ...)
+
+    Returns:
+        Результат по каждому получателю и общее время рассылки
+    """
+    if concurrency < 1:
+        raise ValueError("Ограничение параллельности должно быть не меньше 1")
+
+    scheduler = get_outbound()
+    semaphore = asyncio.Semaphore(concurrency)
+    recipients = list(dict.fromkeys(chat_ids))
+    result = BroadcastResult()
+
+    async def _send_one(chat_id: Any):
+        async with semaphore:
+            try:
+                result.delivered[chat_id] = await scheduler.submit(
+                    bot, SendMessage(chat_id=chat_id, text=text, **kwargs)
+                )
+            except Exception as e:
+                result.failed[chat_id] = e
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_send_one(chat_id) for chat_id in recipients))
+    result.elapsed = time.perf_counter() - started
+    scheduler.record_broadcast(result.elapsed)
+
+    logger.info(f"Рассылка {len(recipients)} получателям за {result.elapsed * 1000:.0f} мс: "
+                f"доставлено {len(result.delivered)}, ошибок {len(result.failed)}")
+    return result
+
+
+async def drain_outbound(timeout: Optional[float] = None) -> bool:
+    """Ожидание отправки очереди текущего event loop"""
+    if _scheduler is None or _scheduler.loop is not asyncio.get_running_loop():
+        return True
+    return await _scheduler.drain(timeout)
+
+
+def get_outbound_stats() -> Dict[str, Any]:
+    """Счетчики планировщика процесса"""
+    if _scheduler is None:
+        return {}
+    return _scheduler.stats()
@@ -0,0 +1,288 @@
+"""
+Доставка уведомлений из outbox (db/outbox.py).
+Обработчики больше не отправляют уведомления сами: операция базы данных
+записывает их в outbox в своей транзакции и обработчик сразу отвечает
+пользователю. OutboxWorker пачками берет строки в аренду, формирует текст
+по шаблону типа уведомления (один раз на уведомление) и рассылает его
+получателям через broadcast() планировщика utils/outbound.py (лимиты
+Telegram, повторы при 429):
+- доставленная строка отмечается sent;
+- при временной ошибке строка возвращается в очередь с нарастающей паузой;
+- если получатель заблокировал бота или запрос некорректен, а также после
+  OUTBOX_MAX_ATTEMPTS попыток строка отмечается failed.
+
+Шаблоны регистрируются декоратором register_renderer в модулях обработчиков.
+Шаблон сводки (digest=True) получает {"items": [payload, ...]} - все строки
+своего типа, накопленные у получателя (см. OutboxDB.add_digest_item).
+В serverless-режиме фонового воркера нет: webhook-обработчик вызывает
+deliver_outbox() перед ответом Telegram, а сводки с истекшим окном без новых
+обновлений отправляет GET /cron/outbox (api/index.py) по расписанию.
+"""
+
+import os
+import time
+import socket
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNotFound
+
+from db.outbox import OutboxDB, OutboxEntry, get_outbox_wakeup
+from utils.outbound import broadcast
+
+logger = logging.getLogger(__name__)
+
+
+# Строк в одной пачке доставки
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+
+# Интервал опроса outbox, если новых записей не было (секунды)
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+
+# Попыток доставки одной строки
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+
+# Аренда строки воркером (секунды); по истечении строку может взять другой воркер
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+
+# Начальная пауза перед повторной доставкой (секунды, удваивается) и ее предел
+OUTBOX_RETRY_DELAY = 5.0
+OUTBOX_RETRY_DELAY_MAX = 900.0
+
+# Интервал удаления завершенных строк (секунды)
+OUTBOX_PURGE_INTERVAL = 3600
+
+# Ошибки, при которых повторная доставка бессмысленна
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound)
+
+# Шаблоны уведомлений: тип -> (функция payload -> текст, parse_mode)
+Renderer = Callable[[Dict[str, Any]], str]
+_renderers: Dict[str, Tuple[Renderer, Optional[str]]] = {}
+
+# Типы сводок: строки одного получателя объединяются в одно сообщение
+_digest_kinds = set()
+
+
+def register_renderer(kind: str, parse_mode: Optional[str] = "Markdown", digest: bool = False):
+    """Декоратор регистрации шаблона текста для типа уведомления"""
+    def decorator(func: Renderer) -> Renderer:
+        _renderers[kind] = (func, parse_mode)
+        if digest:
+            _digest_kinds.add(kind)
+        return func
+    return decorator
+
+
+def render(kind: str, payload: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+    """
+    Текст уведомления
+
+    Returns:
+        (текст, parse_mode)
+
+    Raises:
+        LookupError: Шаблон для типа не зарегистрирован
+    """
+    if kind not in _renderers:
+        raise LookupError(f"Шаблон уведомления {kind!r} не зарегистрирован")
+    func, parse_mode = _renderers[kind]
+    return func(payload), parse_mode
+
+
+class OutboxWorker:
+    """Фоновая доставка уведомлений из outbox"""
+
+    def __init__(self, bot: Bot, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 lease: float = OUTBOX_LEASE_SECONDS):
+        if batch_size < 1:
+            raise ValueError("Размер пачки должен быть не меньше 1")
+
+        self.bot = bot
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._last_purge = 0.0
+
+        self.batches = 0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.batch_max_ms = 0.0
+
+    def start(self):
+        """Запуск фоновой доставки в текущем event loop"""
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Воркер outbox запущен ({self.owner})")
+
+    async def stop(self, timeout: Optional[float] = None):
+        """
+        Остановка после текущей пачки
+
+        Если пачка не успела завершиться за timeout, задача отменяется:
+        взятые строки будут доставлены повторно после истечения аренды.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        get_outbox_wakeup().set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Воркер outbox не завершил пачку за отведенное время")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        """Цикл доставки: пачка, затем ожидание новых записей или интервала опроса"""
+        wakeup = get_outbox_wakeup()
+        while not self._stopping:
+            wakeup.clear()
+            try:
+                claimed = await self.run_once()
+                await self._purge_if_due()
+            except Exception as e:
+                logger.error(f"Ошибка доставки outbox: {e}")
+                claimed = 0
+
+            if claimed >= self.batch_size or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _purge_if_due(self):
+        """Периодическое удаление завершенных строк"""
+        now = time.monotonic()
+        if now - self._last_purge >= OUTBOX_PURGE_INTERVAL:
+            self._last_purge = now
+            await OutboxDB.purge()
+
+    async def run_once(self) -> int:
+        """
+        Доставка одной пачки
+
+        Returns:
+            Количество взятых строк
+        """
+        entries = await OutboxDB.claim(self.owner, self.batch_size, self.lease,
+                                       coalesce_kinds=_digest_kinds)
+        if not entries:
+            return 0
+
+        started = time.perf_counter()
+
+        # Строки одного уведомления разным получателям: текст формируется один раз;
+        # строки сводки одного получателя объединяются в одно сообщение
+        groups: Dict[Tuple[str, str], List[OutboxEntry]] = {}
+        for entry in entries:
+            if entry.kind in _digest_kinds:
+                key = f"chat:{entry.chat_id}"
+            else:
+                key = entry.notification_key
+            groups.setdefault((entry.kind, key), []).append(entry)
+
+        broadcasts = []
+        updates = []
+        for (kind, _), group in groups.items():
+            if kind in _digest_kinds:
+                group.sort(key=lambda entry: entry.id)
+                payload = {"items": [entry.payload for entry in group]}
+            else:
+                payload = group[0].payload
+            try:
+                text, parse_mode = render(kind, payload)
+            except LookupError as e:
+                # Модуль с шаблоном мог еще не загрузиться: повторяем как временную ошибку
+                updates.extend(self._retry_or_fail(entry, str(e)) for entry in group)
+                continue
+            except Exception as e:
+                logger.error(f"Ошибка шаблона уведомления {group[0]!r}: {e}")
+                self.failed += len(group)
+                updates.extend(OutboxDB.mark_failed(entry.id, f"шаблон: {e}") for entry in group)
+                continue
+            broadcasts.append((group, broadcast(
+                self.bot, [entry.chat_id for entry in group], text, parse_mode=parse_mode
+            )))
+
+        results = await asyncio.gather(*(coro for _, coro in broadcasts))
+
+        sent_ids = []
+        for (group, _), result in zip(broadcasts, results):
+            for entry in group:
+                error = result.outcome(entry.chat_id)
+                if error is None:
+                    sent_ids.append(entry.id)
+                elif isinstance(error, PERMANENT_ERRORS):
+                    logger.warning(f"Уведомление {entry!r} не может быть доставлено: {error}")
+                    self.failed += 1
+                    updates.append(OutboxDB.mark_failed(entry.id, str(error)))
+                else:
+                    # Flood control дольше, чем готов ждать планировщик: повтор не раньше retry_after
+                    updates.append(self._retry_or_fail(entry, str(error),
+                                                       getattr(error, "retry_after", 0)))
+
+        self.delivered += len(sent_ids)
+        updates.append(OutboxDB.mark_sent(sent_ids))
+        await asyncio.gather(*updates)
+
+        self.batches += 1
+        self.batch_max_ms = max(self.batch_max_ms, (time.perf_counter() - started) * 1000)
+        return len(entries)
+
+    def _retry_or_fail(self, entry: OutboxEntry, error: str, retry_after: float = 0):
+        """Возврат строки в очередь (не раньше retry_after) или отказ после исчерпания попыток"""
+        if entry.attempts >= self.max_attempts:
+            logger.error(f"Уведомление {entry!r} не доставлено за {entry.attempts} попыток: {error}")
+            self.failed += 1
+            return OutboxDB.mark_failed(entry.id, error)
+        self.retried += 1
+        delay = min(OUTBOX_RETRY_DELAY * 2 ** (entry.attempts - 1), OUTBOX_RETRY_DELAY_MAX)
+        delay = max(delay, retry_after)
+        return OutboxDB.mark_retry(entry.id, error, delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики доставки"""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "batches": self.batches,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batch_max_ms": round(self.batch_max_ms, 1),
+        }
+
+
+async def deliver_outbox(bot: Bot, timeout: Optional[float] = None) -> int:
+    """
+    Разовая доставка накопившихся уведомлений (serverless-режим)
+
+    Берет пачки, пока они заполнены целиком и не истек timeout.
+
+    Returns:
+        Количество обработанных строк
+    """
+    worker = OutboxWorker(bot)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    total = 0
+    while True:
+        claimed = await worker.run_once()
+        total += claimed
+        if claimed < worker.batch_size:
+            return total
+        if deadline is not None and time.monotonic() >= deadline:
+            return total
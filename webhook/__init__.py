@@ -0,0 +1 @@
+# Инициализация пакета webhook 
\ No newline at end of file
@@ -0,0 +1,194 @@
+"""
+ASGI-приложение webhook (FastAPI).
+В отличие от api/index.py (BaseHTTPRequestHandler, один запрос за раз)
+обрабатывает обновления параллельно: медленный ответ OpenAI в одном чате
+не задерживает остальные. Порядок обновлений внутри чата сохраняется
+(см. webhook/dispatcher.py). Бот настраивается тем же init_bot().
+
+Запуск:
+    uvicorn webhook.asgi:app --host 0.0.0.0 --port 8080 --workers 4
+    python -m webhook.asgi
+
+Режимы (WEBHOOK_MODE):
+- sync: ответ Telegram после обработки обновления;
+- queue: обновление ставится в очередь (webhook/queue.py), ответ 200
+  отправляется сразу, обработку выполняет пул воркеров.
+
+Порядок внутри чата гарантируется в пределах одного процесса. При
+нескольких воркерах Telegram может доставить соседние обновления одного
+чата в разные процессы, поэтому для строгого порядка используйте
+--workers 1 или max_connections=1 у webhook.
+"""
+
+import os
+import sys
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Корень репозитория для импорта модулей бота
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.index import init_bot
+from webhook.dispatcher import ChatOrderedDispatcher, update_chat_key
+from webhook.queue import UpdateQueue, QueueFullError
+from utils.outbound import drain_outbound, get_outbound_stats
+from utils.outbox import OutboxWorker
+from nlp.fast_classifier import get_fast_classifier_stats
+from nlp.parse_cache import get_parse_cache_stats
+
+logger = logging.getLogger(__name__)
+
+
+# Адрес и количество воркеров для python -m webhook.asgi
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+
+# Режим ответа Telegram: sync - после обработки, queue - сразу после постановки в очередь
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "sync")
+
+# Сколько ждать отправки очереди исходящих сообщений при остановке (секунды)
+OUTBOUND_DRAIN_TIMEOUT = 10
+
+# Сколько ждать завершения пачки доставки outbox при остановке (секунды)
+OUTBOX_STOP_TIMEOUT = 10
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Настройка бота при старте воркера и освобождение ресурсов при остановке"""
+    if WEBHOOK_MODE not in ("sync", "queue"):
+        raise ValueError(f"Неизвестный WEBHOOK_MODE: {WEBHOOK_MODE}")
+
+    bot, dp = await init_bot()
+    app.state.bot = bot
+    app.state.dp = dp
+    app.state.dispatcher = ChatOrderedDispatcher()
+    app.state.queue = None
+    if WEBHOOK_MODE == "queue":
+        app.state.queue = UpdateQueue(lambda data: _process_update(app, data), app.state.dispatcher)
+        await app.state.queue.start()
+    app.state.outbox = OutboxWorker(bot)
+    app.state.outbox.start()
+    logger.info(f"Webhook-воркер готов (режим {WEBHOOK_MODE}, "
+                f"параллельность {app.state.dispatcher.concurrency})")
+    try:
+        yield
+    finally:
+        if app.state.queue is not None:
+            await app.state.queue.close()
+        await app.state.dispatcher.drain()
+        await dp.storage.close()
+        await app.state.outbox.stop(OUTBOX_STOP_TIMEOUT)
+        await drain_outbound(OUTBOUND_DRAIN_TIMEOUT)
+        await bot.session.close()
+        from db.pool import close_pool
+        await close_pool()
+
+
+app = FastAPI(title="Telegram webhook", lifespan=lifespan)
+
+
+async def _claim_update(update_id) -> bool:
+    """Проверка, что обновление еще не принималось"""
+    if update_id is None:
+        return True
+    try:
+        from db.dedup import update_dedup
+        return await update_dedup.claim(update_id)
+    except Exception as e:
+        logger.warning(f"Не удалось проверить повтор обновления {update_id}: {e}")
+        return True
+
+
+async def _release_update(update_id):
+    """Освобождение обновления, чтобы повторная доставка Telegram его обработала"""
+    if update_id is None:
+        return
+    from db.dedup import update_dedup
+    await update_dedup.release(update_id)
+
+
+def _parse_update(data):
+    """Разбор обновления Telegram (ValidationError, если данные не являются Update)"""
+    from aiogram.types import Update
+    return Update.model_validate(data)
+
+
+async def _process_update(app: FastAPI, data):
+    """Передача обновления диспетчеру aiogram"""
+    await app.state.dp.feed_update(app.state.bot, _parse_update(data))
+
+
+@app.post("/webhook")
+async def webhook(request: Request):
+    """Прием обновления от Telegram"""
+    data = await request.json()
+    update_id = data.get("update_id") if isinstance(data, dict) else None
+    queue = request.app.state.queue
+
+    # Переполненная очередь: Telegram повторит доставку позже
+    if queue is not None and queue.depth >= queue.max_size:
+        return JSONResponse(status_code=503, content={"ok": False, "error": "queue is full"})
+
+    # Некорректное обновление не занимается и не ставится в очередь:
+    # иначе воркер отбросил бы его только после всех попыток
+    from pydantic import ValidationError
+    try:
+        update = _parse_update(data)
+    except ValidationError as e:
+        logger.warning(f"Некорректное обновление {update_id}: {e.error_count()} ошибок проверки")
+        return JSONResponse(status_code=400, content={"ok": False, "error": "invalid update"})
+
+    if not await _claim_update(update_id):
+        return {"ok": True, "duplicate": True}
+
+    if queue is not None:
+        try:
+            await queue.enqueue(data)
+        except (QueueFullError, RuntimeError) as e:
+            await _release_update(update_id)
+            return JSONResponse(status_code=503, content={"ok": False, "error": str(e)})
+        except Exception as e:
+            logger.error(f"Не удалось поставить обновление {update_id} в очередь: {e}")
+            await _release_update(update_id)
+            return JSONResponse(status_code=500, content={"ok": False, "error": str(e)})
+        return {"ok": True, "queued": True}
+
+    try:
+        await request.app.state.dispatcher.dispatch(
+            update_chat_key(data),
+            lambda: request.app.state.dp.feed_update(request.app.state.bot, update)
+        )
+    except Exception as e:
+        logger.error(f"Ошибка обработки обновления {update_id}: {e}")
+        await _release_update(update_id)
+        # Telegram повторит доставку
+        return JSONResponse(status_code=500, content={"ok": False, "error": str(e)})
+
+    return {"ok": True}
+
+
+@app.get("/health")
+async def health(request: Request):
+    """Состояние воркера"""
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "handlers": len(request.app.state.dp.message.handlers),
+        "mode": WEBHOOK_MODE,
+        "dispatcher": request.app.state.dispatcher.stats(),
+        "queue": request.app.state.queue.stats() if request.app.state.queue is not None else None,
+        "outbound": get_outbound_stats(),
+        "outbox": request.app.state.outbox.stats(),
+        "fast_classifier": get_fast_classifier_stats(),
+        "parse_cache": get_parse_cache_stats(),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("webhook.asgi:app", host=WEBHOOK_HOST, port=WEBHOOK_PORT, workers=WEBHOOK_WORKERS)
@@ -0,0 +1,143 @@
+"""
+Конкурентная обработка обновлений с сохранением порядка внутри чата.
+Обновления разных чатов обрабатываются параллельно (не больше
+WEBHOOK_CONCURRENCY одновременно), обновления одного чата - строго
+по очереди в порядке поступления: каждое следующее ждет завершения
+предыдущего обновления этого чата.
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Максимальное количество обновлений, обрабатываемых одновременно
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "16"))
+
+# Разделы обновления, в которых есть чат или пользователь
+_CHAT_SECTIONS = ("message", "edited_message", "channel_post", "edited_channel_post",
+                  "business_message", "edited_business_message")
+_USER_SECTIONS = ("callback_query", "inline_query", "chosen_inline_result", "shipping_query",
+                  "pre_checkout_query", "my_chat_member", "chat_member", "chat_join_request")
+
+
+def update_chat_key(data: Dict[str, Any]) -> str:
+    """
+    Ключ очереди обновления (по сырому JSON, до построения Update)
+
+    Сообщения упорядочиваются по чату, callback-запросы - по чату исходного
+    сообщения (или по пользователю), остальные обновления - по пользователю.
+    Обновления без чата и пользователя не упорядочиваются.
+    """
+    for section in _CHAT_SECTIONS:
+        payload = data.get(section)
+        if payload and payload.get("chat"):
+            return f"chat:{payload['chat']['id']}"
+
+    for section in _USER_SECTIONS:
+        payload = data.get(section)
+        if not payload:
+            continue
+        message = payload.get("message")
+        if message and message.get("chat"):
+            return f"chat:{message['chat']['id']}"
+        if payload.get("chat"):
+            return f"chat:{payload['chat']['id']}"
+        if payload.get("from"):
+            return f"user:{payload['from']['id']}"
+
+    return f"update:{data.get('update_id')}"
+
+
+class ChatOrderedDispatcher:
+    """Параллельная обработка с ограничением и порядком внутри чата"""
+
+    def __init__(self, concurrency: int = WEBHOOK_CONCURRENCY):
+        if concurrency < 1:
+            raise ValueError("Ограничение параллельности должно быть не меньше 1")
+
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Последняя задача каждого чата: следующая задача чата ждет ее завершения
+        self._tails: Dict[str, asyncio.Task] = {}
+        self.in_flight = 0
+        self.in_flight_max = 0
+        self.queued = 0
+        self.processed = 0
+        self.failed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def dispatch(self, key: str, handler: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Обработка в очереди чата key
+
+        Обработка продолжается, даже если вызывающий (HTTP-запрос) отменен,
+        иначе следующее обновление чата обогнало бы незавершенное.
+
+        Returns:
+            Результат handler()
+        """
+        previous = self._tails.get(key)
+        task = asyncio.ensure_future(self._run_after(previous, handler))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._release_tail(key, done))
+        return await asyncio.shield(task)
+
+    def _release_tail(self, key: str, task: asyncio.Task):
+        """Удаление завершенной задачи, если она последняя в очереди чата"""
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _run_after(self, previous: Optional[asyncio.Task],
+                         handler: Callable[[], Awaitable[Any]]) -> Any:
+        """Ожидание предыдущего обновления чата и свободного слота"""
+        started = time.perf_counter()
+        self.queued += 1
+        try:
+            if previous is not None:
+                # Ошибка предыдущего обновления не останавливает очередь чата
+                await asyncio.wait([previous])
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        wait = time.perf_counter() - started
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.in_flight += 1
+        self.in_flight_max = max(self.in_flight_max, self.in_flight)
+        try:
+            result = await handler()
+            self.processed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def drain(self):
+        """Ожидание завершения всех принятых обновлений"""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики обработки (время в миллисекундах)"""
+        started = self.processed + self.failed
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "in_flight_max": self.in_flight_max,
+            "queued": self.queued,
+            "chats_active": len(self._tails),
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_avg_ms": round(self.wait_total / started * 1000, 3) if started else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+        }
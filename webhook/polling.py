@@ -0,0 +1,305 @@
+"""
+Режим long polling с шардированными очередями.
+dp.start_polling() запускал каждое обновление отдельной задачей: порядок
+обновлений одного чата не гарантировался, а число одновременных запросов
+к OpenAI и SQLite ничем не ограничивалось. Здесь обновления распределяются
+по POLLING_SHARDS очередям по хэшу чата: каждую очередь разбирает один
+воркер (обновления чата обрабатываются строго по порядку), разные очереди -
+параллельно, но не больше POLLING_CONCURRENCY обработок одновременно.
+
+Очереди ограничены POLLING_QUEUE_SIZE: пока очередь заполнена, новые
+обновления не запрашиваются. При остановке (SIGINT/SIGTERM) прием
+прекращается, принятые обновления дорабатываются (не дольше
+POLLING_DRAIN_TIMEOUT секунд), после чего обработанные обновления
+подтверждаются в Telegram.
+
+Включается в bot.py переменной POLLING_MODE=sharded.
+"""
+
+import os
+import time
+import zlib
+import signal
+import asyncio
+import logging
+from collections import deque
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+logger = logging.getLogger(__name__)
+
+
+# Количество очередей (обновления чата всегда попадают в одну очередь)
+POLLING_SHARDS = int(os.getenv("POLLING_SHARDS", "16"))
+
+# Максимум обновлений, обрабатываемых одновременно во всех очередях
+POLLING_CONCURRENCY = int(os.getenv("POLLING_CONCURRENCY", "8"))
+
+# Емкость одной очереди; при заполнении прием обновлений приостанавливается
+POLLING_QUEUE_SIZE = int(os.getenv("POLLING_QUEUE_SIZE", "100"))
+
+# Сколько ждать обработки принятых обновлений при остановке (секунды)
+POLLING_DRAIN_TIMEOUT = float(os.getenv("POLLING_DRAIN_TIMEOUT", "30"))
+
+# Интервал вывода метрик очередей в лог (секунды, 0 - не выводить)
+POLLING_STATS_INTERVAL = float(os.getenv("POLLING_STATS_INTERVAL", "60"))
+
+# Время ожидания getUpdates (секунды)
+POLLING_TIMEOUT = 10
+
+# Паузы между неудачными запросами getUpdates
+POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=30.0, factor=1.5, jitter=0.1)
+
+
+def update_shard_key(update: Update) -> str:
+    """Ключ упорядочивания: чат обновления, иначе пользователь, иначе само обновление"""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat_id is not None:
+        return f"chat:{context.chat_id}"
+    if context.user_id is not None:
+        return f"user:{context.user_id}"
+    return f"update:{update.update_id}"
+
+
+class _Shard:
+    """Очередь с метриками задержки"""
+
+    __slots__ = ("queue", "enqueued_at", "processed", "failed", "lag_total", "lag_last", "lag_max")
+
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        # Время постановки ожидающих обновлений (порядок совпадает с очередью)
+        self.enqueued_at: Deque[float] = deque()
+        self.processed = 0
+        self.failed = 0
+        self.lag_total = 0.0
+        self.lag_last = 0.0
+        self.lag_max = 0.0
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        """Глубина и задержка очереди (время в миллисекундах)"""
+        started = self.processed + self.failed
+        return {
+            "depth": self.queue.qsize(),
+            "oldest_age_ms": round((now - self.enqueued_at[0]) * 1000, 1) if self.enqueued_at else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "lag_last_ms": round(self.lag_last * 1000, 1),
+            "lag_avg_ms": round(self.lag_total / started * 1000, 1) if started else 0.0,
+            "lag_max_ms": round(self.lag_max * 1000, 1),
+        }
+
+
+class ShardedUpdateDispatcher:
+    """Очереди по хэшу чата: порядок внутри чата, параллельность между очередями"""
+
+    def __init__(self, process: Callable[[Update], Awaitable[Any]],
+                 shards: int = POLLING_SHARDS,
+                 concurrency: int = POLLING_CONCURRENCY,
+                 queue_size: int = POLLING_QUEUE_SIZE):
+        if shards < 1:
+            raise ValueError("Количество очередей должно быть не меньше 1")
+        if concurrency < 1:
+            raise ValueError("Ограничение параллельности должно быть не меньше 1")
+
+        self.process = process
+        self.shards_count = shards
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self._shards: List[_Shard] = []
+        self._workers: List[asyncio.Task] = []
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._closing = False
+        self.in_flight = 0
+        self.in_flight_max = 0
+
+    def start(self):
+        """Создание очередей и воркеров (в работающем event loop)"""
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._shards = [_Shard(self.queue_size) for _ in range(self.shards_count)]
+        self._workers = [asyncio.ensure_future(self._worker(shard)) for shard in self._shards]
+
+    def shard_index(self, key: str) -> int:
+        """Номер очереди ключа (crc32 одинаков во всех процессах и запусках)"""
+        return zlib.crc32(key.encode()) % self.shards_count
+
+    async def submit(self, update: Update):
+        """
+        Постановка обновления в очередь его чата
+
+        Ждет, если очередь заполнена.
+
+        Raises:
+            RuntimeError: Если диспетчер останавливается
+        """
+        if self._closing:
+            raise RuntimeError("Диспетчер обновлений останавливается")
+        shard = self._shards[self.shard_index(update_shard_key(update))]
+        await shard.queue.put(update)
+        shard.enqueued_at.append(time.perf_counter())
+
+    async def _worker(self, shard: _Shard):
+        """Воркер очереди: обновления обрабатываются строго по одному"""
+        while True:
+            update = await shard.queue.get()
+            try:
+                lag = time.perf_counter() - shard.enqueued_at.popleft()
+                shard.lag_last = lag
+                shard.lag_total += lag
+                shard.lag_max = max(shard.lag_max, lag)
+
+                async with self._semaphore:
+                    self.in_flight += 1
+                    self.in_flight_max = max(self.in_flight_max, self.in_flight)
+                    try:
+                        await self.process(update)
+                        shard.processed += 1
+                    except Exception as e:
+                        shard.failed += 1
+                        logger.error(f"Ошибка обработки обновления {update.update_id}: {e}")
+                    finally:
+                        self.in_flight -= 1
+            finally:
+                shard.queue.task_done()
+
+    @property
+    def depth(self) -> int:
+        """Принятых и еще не обработанных обновлений"""
+        return sum(shard.queue.qsize() for shard in self._shards) + self.in_flight
+
+    async def drain(self, timeout: float = POLLING_DRAIN_TIMEOUT) -> bool:
+        """
+        Остановка: прием прекращается, принятые обновления дорабатываются
+
+        Returns:
+            True, если все принятые обновления обработаны за timeout
+        """
+        self._closing = True
+        drained = True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(shard.queue.join() for shard in self._shards)), timeout)
+        except asyncio.TimeoutError:
+            drained = False
+            logger.warning(f"Очереди не опустели за {timeout} с, не обработано обновлений: {self.depth}")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        return drained
+
+    def stats(self) -> Dict[str, Any]:
+        """Метрики всех очередей"""
+        now = time.perf_counter()
+        shards = [shard.stats(now) for shard in self._shards]
+        return {
+            "shards": self.shards_count,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "in_flight_max": self.in_flight_max,
+            "depth": sum(shard["depth"] for shard in shards),
+            "processed": sum(shard["processed"] for shard in shards),
+            "failed": sum(shard["failed"] for shard in shards),
+            "oldest_age_ms": max((shard["oldest_age_ms"] for shard in shards), default=0.0),
+            "lag_max_ms": max((shard["lag_max_ms"] for shard in shards), default=0.0),
+            "per_shard": shards,
+        }
+
+
+async def _log_stats(sharded: ShardedUpdateDispatcher, interval: float):
+    """Периодический вывод метрик очередей"""
+    processed = 0
+    while True:
+        await asyncio.sleep(interval)
+        stats = sharded.stats()
+        if stats["processed"] + stats["failed"] == processed and not stats["depth"]:
+            continue
+        processed = stats["processed"] + stats["failed"]
+        busiest = max(range(len(stats["per_shard"])),
+                      key=lambda index: stats["per_shard"][index]["lag_max_ms"])
+        logger.info(f"Очереди polling: в очереди {stats['depth']}, обработано {stats['processed']}, "
+                    f"ошибок {stats['failed']}, старейшее {stats['oldest_age_ms']} мс, "
+                    f"макс. задержка {stats['lag_max_ms']} мс (очередь {busiest})")
+
+
+async def run_sharded_polling(bot: Bot, dp: Dispatcher,
+                              shards: int = POLLING_SHARDS,
+                              concurrency: int = POLLING_CONCURRENCY,
+                              queue_size: int = POLLING_QUEUE_SIZE,
+                              drain_timeout: float = POLLING_DRAIN_TIMEOUT,
+                              polling_timeout: int = POLLING_TIMEOUT,
+                              handle_signals: bool = True):
+    """
+    Long polling с обработкой через ShardedUpdateDispatcher
+
+    Возвращается после сигнала остановки (или отмены), когда принятые
+    обновления обработаны. Сессию бота закрывает вызывающий.
+    """
+    workflow_data = {"dispatcher": dp, "bots": (bot,), **dp.workflow_data}
+
+    async def process(update: Update):
+        await dp.feed_update(bot, update, **workflow_data)
+
+    sharded = ShardedUpdateDispatcher(process, shards, concurrency, queue_size)
+    sharded.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    if handle_signals:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            # На Windows обработчики сигналов не поддерживаются
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop.set)
+
+    get_updates = GetUpdates(timeout=polling_timeout, allowed_updates=dp.resolve_used_update_types())
+    request_timeout = int(bot.session.timeout + polling_timeout) if bot.session.timeout else None
+
+    async def listen():
+        backoff = Backoff(config=POLLING_BACKOFF)
+        while True:
+            try:
+                updates = await bot(get_updates, request_timeout=request_timeout)
+            except Exception as e:
+                logger.error(f"Не удалось получить обновления: {e}; повтор через {backoff.next_delay:.1f} с")
+                await backoff.asleep()
+                continue
+            backoff.reset()
+            for update in updates:
+                await sharded.submit(update)
+                get_updates.offset = update.update_id + 1
+
+    await dp.emit_startup(bot=bot, **workflow_data)
+    logger.info(f"Polling запущен: {shards} очередей, параллельность {concurrency}")
+    listener = asyncio.ensure_future(listen())
+    stopper = asyncio.ensure_future(stop.wait())
+    reporter = asyncio.ensure_future(_log_stats(sharded, POLLING_STATS_INTERVAL)) if POLLING_STATS_INTERVAL > 0 else None
+    try:
+        done, _ = await asyncio.wait([listener, stopper], return_when=asyncio.FIRST_COMPLETED)
+        if listener in done:
+            listener.result()
+    finally:
+        for task in (listener, stopper, reporter):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(listener, stopper, *([reporter] if reporter else []), return_exceptions=True)
+        if handle_signals:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                with suppress(NotImplementedError):
+                    loop.remove_signal_handler(sig)
+
+        logger.info(f"Остановка polling: дорабатываем {sharded.depth} обновлений")
+        drained = await sharded.drain(drain_timeout)
+
+        # Подтверждение обработанных обновлений: иначе Telegram пришлет их снова после перезапуска
+        if drained and get_updates.offset is not None:
+            with suppress(Exception):
+                await bot(GetUpdates(offset=get_updates.offset, limit=1, timeout=0))
+
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        logger.info(f"Polling остановлен: {sharded.stats()['processed']} обновлений обработано")
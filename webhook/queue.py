@@ -0,0 +1,298 @@
+"""
+Очередь обновлений для режима быстрого ответа webhook.
+В режиме WEBHOOK_MODE=queue обработчик /webhook только проверяет и ставит
+обновление в очередь, сразу отвечая Telegram 200; пул воркеров разбирает
+очередь через ChatOrderedDispatcher (порядок внутри чата сохраняется).
+
+При WEBHOOK_QUEUE_PERSIST=1 обновление до ответа Telegram записывается в
+таблицу webhook_queue (миграция 6) и удаляется после обработки. Строки
+арендуются процессом на WEBHOOK_QUEUE_LEASE_SECONDS и периодически
+продлеваются; обновления перезапущенного или упавшего процесса забирает
+следующий запущенный процесс, когда их аренда истекает.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db.writer import submit_write
+from webhook.dispatcher import ChatOrderedDispatcher, update_chat_key
+
+logger = logging.getLogger(__name__)
+
+
+# Количество воркеров, разбирающих очередь
+WEBHOOK_QUEUE_WORKERS = int(os.getenv("WEBHOOK_QUEUE_WORKERS", "8"))
+
+# Хранить очередь в SQLite (обновления переживают перезапуск процесса)
+WEBHOOK_QUEUE_PERSIST = os.getenv("WEBHOOK_QUEUE_PERSIST", "1") == "1"
+
+# Максимальная глубина очереди; сверх нее Telegram получает 503 и повторит доставку
+WEBHOOK_QUEUE_MAX_SIZE = int(os.getenv("WEBHOOK_QUEUE_MAX_SIZE", "10000"))
+
+# Попыток обработки одного обновления
+WEBHOOK_QUEUE_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "3"))
+
+# Срок аренды строк очереди процессом (секунды)
+WEBHOOK_QUEUE_LEASE_SECONDS = float(os.getenv("WEBHOOK_QUEUE_LEASE_SECONDS", "60"))
+
+# Пауза перед повторной попыткой (секунды, умножается на номер попытки)
+WEBHOOK_QUEUE_RETRY_DELAY = 0.5
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена"""
+
+
+class QueuedUpdate:
+    """Обновление в очереди"""
+
+    __slots__ = ("update_id", "chat_key", "data", "enqueued_at", "attempts")
+
+    def __init__(self, update_id: int, chat_key: str, data: Dict[str, Any],
+                 enqueued_at: float, attempts: int = 0):
+        self.update_id = update_id
+        self.chat_key = chat_key
+        self.data = data
+        self.enqueued_at = enqueued_at
+        self.attempts = attempts
+
+
+class UpdateQueue:
+    """Очередь обновлений с пулом воркеров и (необязательно) хранением в SQLite"""
+
+    def __init__(self, process: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 dispatcher: ChatOrderedDispatcher,
+                 workers: int = WEBHOOK_QUEUE_WORKERS,
+                 persist: bool = WEBHOOK_QUEUE_PERSIST,
+                 max_size: int = WEBHOOK_QUEUE_MAX_SIZE,
+                 max_attempts: int = WEBHOOK_QUEUE_MAX_ATTEMPTS,
+                 lease: float = WEBHOOK_QUEUE_LEASE_SECONDS):
+        if workers < 1:
+            raise ValueError("Количество воркеров должно быть не меньше 1")
+
+        self.process = process
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.persist = persist
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Принятые, но еще не обработанные обновления: update_id -> время постановки
+        self._pending: Dict[int, float] = {}
+        self._closing = False
+
+        self.enqueued = 0
+        self.processed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.recovered = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def start(self):
+        """Восстановление сохраненной очереди и запуск воркеров"""
+        self._queue = asyncio.Queue()
+        if self.persist:
+            await self._recover()
+            self._tasks.append(asyncio.ensure_future(self._maintain()))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.ensure_future(self._worker()))
+        logger.info(f"Очередь обновлений запущена: {self.workers} воркеров, "
+                    f"хранение в SQLite: {'да' if self.persist else 'нет'}")
+
+    @property
+    def depth(self) -> int:
+        """Принятых и еще не обработанных обновлений"""
+        return len(self._pending)
+
+    async def enqueue(self, data: Dict[str, Any]):
+        """
+        Постановка обновления в очередь
+
+        Raises:
+            QueueFullError: Если очередь заполнена
+            RuntimeError: Если очередь останавливается
+        """
+        if self._closing:
+            raise RuntimeError("Очередь обновлений останавливается")
+        if self.depth >= self.max_size:
+            raise QueueFullError(f"Очередь обновлений заполнена ({self.depth})")
+
+        item = QueuedUpdate(data.get("update_id"), update_chat_key(data), data, time.time())
+        if self.persist and item.update_id is not None:
+            lease_until = item.enqueued_at + self.lease
+
+            async def _insert(db):
+                await db.execute("""
+                    INSERT OR IGNORE INTO webhook_queue
+                        (update_id, chat_key, payload, enqueued_at, owner, lease_until)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (item.update_id, item.chat_key, json.dumps(data, ensure_ascii=False),
+                      item.enqueued_at, self.owner, lease_until))
+
+            await submit_write(_insert)
+
+        self._put(item)
+        self.enqueued += 1
+
+    def _put(self, item: QueuedUpdate):
+        """Добавление в очередь в памяти"""
+        self._pending[item.update_id] = item.enqueued_at
+        self._queue.put_nowait(item)
+
+    async def _worker(self):
+        """Воркер: берет обновления по порядку и передает диспетчеру"""
+        while True:
+            item = await self._queue.get()
+            try:
+                await self.dispatcher.dispatch(item.chat_key, lambda item=item: self._handle(item))
+            except Exception:
+                # Ошибка уже учтена в _handle
+                pass
+            finally:
+                self._queue.task_done()
+
+    async def _handle(self, item: QueuedUpdate):
+        """Обработка с повторными попытками"""
+        wait = time.time() - item.enqueued_at
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+        try:
+            while True:
+                item.attempts += 1
+                try:
+                    await self.process(item.data)
+                    self.processed += 1
+                    return
+                except Exception as e:
+                    if item.attempts >= self.max_attempts:
+                        self.dropped += 1
+                        logger.error(f"Обновление {item.update_id} не обработано после "
+                                     f"{item.attempts} попыток, удаляем из очереди: {e}")
+                        return
+                    self.retried += 1
+                    logger.warning(f"Ошибка обработки обновления {item.update_id} "
+                                   f"(попытка {item.attempts}): {e}")
+                    await asyncio.sleep(WEBHOOK_QUEUE_RETRY_DELAY * item.attempts)
+        finally:
+            await self._ack(item)
+
+    async def _ack(self, item: QueuedUpdate):
+        """Удаление обработанного обновления из очереди"""
+        self._pending.pop(item.update_id, None)
+        if not self.persist or item.update_id is None:
+            return
+
+        async def _delete(db):
+            await db.execute("DELETE FROM webhook_queue WHERE update_id = ?", (item.update_id,))
+
+        try:
+            await submit_write(_delete)
+        except Exception as e:
+            # Строка будет обработана повторно после истечения аренды
+            logger.error(f"Не удалось удалить обновление {item.update_id} из очереди: {e}")
+
+    async def _recover(self) -> int:
+        """Захват сохраненных обновлений с истекшей арендой"""
+        now = time.time()
+
+        async def _take(db) -> list:
+            cursor = await db.execute("""
+                SELECT update_id, chat_key, payload, enqueued_at, attempts
+                FROM webhook_queue
+                WHERE lease_until < ?
+                ORDER BY update_id
+            """, (now,))
+            rows = await cursor.fetchall()
+            if rows:
+                await db.executemany("""
+                    UPDATE webhook_queue
+                    SET owner = ?, lease_until = ?, attempts = attempts + 1
+                    WHERE update_id = ?
+                """, [(self.owner, now + self.lease, row["update_id"]) for row in rows])
+            return rows
+
+        rows = await submit_write(_take)
+        recovered = 0
+        for row in rows:
+            # Попытка, прерванная остановкой процесса, тоже считается
+            attempts = row["attempts"] + 1
+            item = QueuedUpdate(row["update_id"], row["chat_key"], json.loads(row["payload"]),
+                                row["enqueued_at"], attempts)
+            if attempts > self.max_attempts:
+                logger.error(f"Обновление {item.update_id} прерывалось {row['attempts']} раз, удаляем из очереди")
+                self.dropped += 1
+                self._pending[item.update_id] = item.enqueued_at
+                await self._ack(item)
+                continue
+            self._put(item)
+            recovered += 1
+
+        if recovered:
+            self.recovered += recovered
+            logger.info(f"Восстановлено обновлений из очереди: {recovered}")
+        return recovered
+
+    async def _maintain(self):
+        """Продление аренды своих строк и захват строк остановленных процессов"""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                lease_until = time.time() + self.lease
+
+                async def _renew(db):
+                    await db.execute("UPDATE webhook_queue SET lease_until = ? WHERE owner = ?",
+                                     (lease_until, self.owner))
+
+                await submit_write(_renew)
+                await self._recover()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания очереди обновлений: {e}")
+
+    async def close(self, timeout: float = 30.0):
+        """
+        Остановка: прием прекращается, принятые обновления дорабатываются
+
+        Не успевшие обработаться за timeout обновления остаются в таблице
+        и будут обработаны после перезапуска.
+        """
+        self._closing = True
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Очередь не опустела за {timeout} с, осталось {self.depth}")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict[str, Any]:
+        """Глубина и возраст очереди (время в миллисекундах)"""
+        now = time.time()
+        oldest = min(self._pending.values(), default=None)
+        started = self.processed + self.dropped
+        return {
+            "depth": self.depth,
+            "oldest_age_ms": round((now - oldest) * 1000, 1) if oldest is not None else 0.0,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "recovered": self.recovered,
+            "wait_avg_ms": round(self.wait_total / started * 1000, 1) if started else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 1),
+            "workers": self.workers,
+            "persist": self.persist,
+        }